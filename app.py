@@ -2,14 +2,29 @@
 Главный файл Chill Bot
 Точка входа приложения
 """
+import asyncio
+
+import aiohttp
 import vk_api
 from vk_api.longpoll import VkLongPoll, VkEventType
 from vk_api.utils import get_random_id
 
 import config
-from database.connection import init_db, get_session, close_session
-from database.queries import get_or_create_player
+from database.connection import init_db, get_session, close_session, unit_of_work
+from database.async_connection import get_async_session, close_async_session
+from database.queries import get_or_create_player, get_player_by_vk_id
+from services.profile_cache import get_user_profile
 from services.scheduler_service import SchedulerService
+from services.event_dispatcher import EventDispatcher, AsyncEventDispatcher
+from services.process_supervisor import ProcessSupervisor
+from services.callback_server import CallbackServer
+from services.xp_buffer import xp_buffer
+from services.broadcast_service import broadcast_service
+from services.outbox import outbox
+from services.leaderboard import leaderboard
+from services.async_vk import AsyncVkApi, AsyncVkLongPoll
+from middleware.async_adapter import async_handler
+from middleware.context import begin_request, end_request
 import states
 
 # Импорт обработчиков
@@ -27,6 +42,14 @@ def init_vk():
     return vk, longpoll
 
 
+def init_vk_api():
+    """Инициализация VK API без LongPoll (для режима Callback API)"""
+    vk = vk_api.VkApi(token=config.VK_GROUP_TOKEN).get_api()
+    
+    print("✅ VK API инициализирован")
+    return vk
+
+
 def route_message(vk, event, session):
     """Маршрутизация сообщений к соответствующим обработчикам"""
     text = event.text.strip()
@@ -80,6 +103,13 @@ def route_message(vk, event, session):
         player_handlers.handle_history_filter(vk, event, session, text)
         return
     
+    # Листание истории; любая другая команда закрывает историю и обрабатывается как обычно
+    if current_state == states.State.BROWSING_HISTORY:
+        if text_lower in ['⬅️ новее', 'новее', 'старее ➡️', 'старее', '🔙 в меню', 'в меню']:
+            player_handlers.handle_history_page(vk, event, session, text_lower)
+            return
+        states.clear_state(user_id)
+    
     # === ОБРАБОТКА АДМИНСКИХ СОСТОЯНИЙ ===
     
     # Начисление/списание
@@ -254,6 +284,79 @@ def route_message(vk, event, session):
     )
 
 
+def handle_message(vk, event, session):
+    """Обработка входящего сообщения: профиль, опыт, маршрутизация"""
+    # Получение информации о пользователе (из кэша профилей)
+    user_info = get_user_profile(vk, event.user_id)
+    first_name = user_info['first_name']
+    last_name = user_info['last_name']
+    
+    # Автоматическое создание профиля (коммит — только для нового игрока)
+    player = get_player_by_vk_id(session, event.user_id)
+    if player is None:
+        with unit_of_work(session):
+            player = get_or_create_player(session, event.user_id, first_name, last_name)
+    
+    leaderboard.ensure(player)
+    
+    # Игрок загружен один раз на всё событие
+    begin_request(session, event.user_id, player)
+    
+    try:
+        # Трекинг сообщений для опыта (кроме команд)
+        if not event.text.startswith('/') and not event.text.startswith('❌'):
+            common_handlers.track_message(vk, event, session)
+        
+        # Маршрутизация сообщения
+        route_message(vk, event, session)
+    
+    finally:
+        end_request(session)
+
+
+def process_event(vk, event):
+    """Обработка одного входящего сообщения (выполняется в воркере диспетчера)"""
+    session = get_session()
+    
+    try:
+        handle_message(vk, event, session)
+        
+    except Exception as e:
+        print(f"❌ Ошибка обработки сообщения от {event.user_id}: {e}")
+        session.rollback()
+        vk.messages.send(
+            user_id=event.user_id,
+            message="❌ Произошла ошибка. Попробуйте позже.",
+            random_id=0
+        )
+    
+    finally:
+        close_session(session)
+
+
+handle_message_async = async_handler(handle_message)
+
+
+async def process_event_async(vk, event):
+    """Обработка одного входящего сообщения в asyncio-режиме"""
+    session = get_async_session()
+    
+    try:
+        await handle_message_async(vk, event, session)
+    
+    except Exception as e:
+        print(f"❌ Ошибка обработки сообщения от {event.user_id}: {e}")
+        await session.rollback()
+        await vk.messages.send(
+            user_id=event.user_id,
+            message="❌ Произошла ошибка. Попробуйте позже.",
+            random_id=0
+        )
+    
+    finally:
+        await close_async_session(session)
+
+
 def main():
     """Главная функция бота"""
     print("=" * 50)
@@ -263,15 +366,131 @@ def main():
     # Инициализация БД
     print("\n📦 Инициализация базы данных...")
     init_db()
+    states.init_store()
     
     # Инициализация VK API
     print("\n🔌 Подключение к VK API...")
-    vk, longpoll = init_vk()
+    raw_vk, longpoll = init_vk()
+    
+    # Исходящие сообщения обработчиков и планировщика — через общую очередь
+    print("\n📤 Запуск очереди исходящих...")
+    outbox.start()
+    vk = outbox.wrap(raw_vk)
     
     # Запуск планировщика
     print("\n⏰ Запуск планировщика...")
     scheduler = SchedulerService(vk)
     scheduler.start()
+    xp_buffer.start()
+    leaderboard.start()
+    broadcast_service.start()
+    
+    # Запуск пула обработки событий
+    print("\n🧵 Запуск диспетчера событий...")
+    dispatcher = EventDispatcher(lambda event: process_event(vk, event))
+    dispatcher.start()
+    
+    print("\n" + "=" * 50)
+    print("✅ БОТ ЗАПУЩЕН И ГОТОВ К РАБОТЕ!")
+    print("=" * 50)
+    print("\nОжидание событий...\n")
+    
+    try:
+        # Основной цикл: чтение LongPoll и передача событий в пул
+        for event in longpoll.listen():
+            if event.type == VkEventType.MESSAGE_NEW and event.to_me:
+                dispatcher.submit(event)
+    
+    except KeyboardInterrupt:
+        print("\n\n⏸️ Остановка бота...")
+        dispatcher.stop()
+        xp_buffer.stop()
+        scheduler.stop()
+        outbox.stop()
+        print("✅ Бот остановлен")
+    
+    except Exception as e:
+        print(f"\n❌ Критическая ошибка: {e}")
+        dispatcher.stop()
+        xp_buffer.stop()
+        scheduler.stop()
+        outbox.stop()
+
+
+async def main_async():
+    """Главная функция бота в asyncio-режиме"""
+    print("=" * 50)
+    print("🎮 CHILL BOT - ЗАПУСК (asyncio)")
+    print("=" * 50)
+    
+    # Инициализация БД
+    print("\n📦 Инициализация базы данных...")
+    init_db()
+    states.init_store()
+    
+    # Планировщик работает в своём потоке с синхронным клиентом VK
+    print("\n⏰ Запуск планировщика...")
+    print("\n📤 Запуск очереди исходящих...")
+    outbox.start()
+    sync_vk = vk_api.VkApi(token=config.VK_GROUP_TOKEN).get_api()
+    scheduler = SchedulerService(outbox.wrap(sync_vk))
+    scheduler.start()
+    xp_buffer.start()
+    leaderboard.start()
+    broadcast_service.start()
+    
+    async with aiohttp.ClientSession() as http_session:
+        print("\n🔌 Подключение к VK API...")
+        vk = AsyncVkApi(config.VK_GROUP_TOKEN, http_session)
+        longpoll = AsyncVkLongPoll(vk, http_session)
+        dispatcher = AsyncEventDispatcher(lambda event: process_event_async(vk, event))
+        
+        print("\n" + "=" * 50)
+        print(f"✅ БОТ ЗАПУЩЕН И ГОТОВ К РАБОТЕ! (до {dispatcher.max_in_flight} событий одновременно)")
+        print("=" * 50)
+        print("\nОжидание событий...\n")
+        
+        try:
+            async for event in longpoll.listen():
+                if event.type == VkEventType.MESSAGE_NEW and event.to_me:
+                    dispatcher.submit(event)
+        
+        finally:
+            print("\n\n⏸️ Остановка бота...")
+            await dispatcher.stop()
+            xp_buffer.stop()
+            states.close_store()
+            scheduler.stop()
+            outbox.stop()
+            print("✅ Бот остановлен")
+
+
+def main_multiprocess():
+    """Главная функция бота в многопроцессном режиме"""
+    print("=" * 50)
+    print("🎮 CHILL BOT - ЗАПУСК (multiprocess)")
+    print("=" * 50)
+    
+    # Инициализация БД
+    print("\n📦 Инициализация базы данных...")
+    init_db()
+    
+    # Инициализация VK API (LongPoll принадлежит только супервизору)
+    print("\n🔌 Подключение к VK API...")
+    vk, longpoll = init_vk()
+    
+    # Лимит группы делится между супервизором и воркерами
+    outbox.start(rps=config.OUTBOX_RPS / (config.WORKER_PROCESSES + 1))
+    
+    # Планировщик — только в супервизоре, чтобы платежи не выполнялись N раз
+    print("\n⏰ Запуск планировщика...")
+    scheduler = SchedulerService(outbox.wrap(vk))
+    scheduler.start()
+    broadcast_service.start(rps=broadcast_service.rps / (config.WORKER_PROCESSES + 1))
+    
+    print("\n🧩 Запуск процессов-воркеров...")
+    supervisor = ProcessSupervisor(process_event)
+    supervisor.start()
     
     print("\n" + "=" * 50)
     print("✅ БОТ ЗАПУЩЕН И ГОТОВ К РАБОТЕ!")
@@ -279,47 +498,86 @@ def main():
     print("\nОжидание событий...\n")
     
     try:
-        # Основной цикл обработки событий
         for event in longpoll.listen():
             if event.type == VkEventType.MESSAGE_NEW and event.to_me:
-                session = get_session()
-                
-                try:
-                    # Получение информации о пользователе
-                    user_info = vk.users.get(user_ids=event.user_id)[0]
-                    first_name = user_info['first_name']
-                    last_name = user_info['last_name']
-                    
-                    # Автоматическое создание/обновление профиля
-                    player = get_or_create_player(session, event.user_id, first_name, last_name)
-                    
-                    # Трекинг сообщений для опыта (кроме команд)
-                    if not event.text.startswith('/') and not event.text.startswith('❌'):
-                        common_handlers.track_message(vk, event, session)
-                    
-                    # Маршрутизация сообщения
-                    route_message(vk, event, session)
-                    
-                except Exception as e:
-                    print(f"❌ Ошибка обработки сообщения от {event.user_id}: {e}")
-                    vk.messages.send(
-                        user_id=event.user_id,
-                        message="❌ Произошла ошибка. Попробуйте позже.",
-                        random_id=0
-                    )
-                
-                finally:
-                    close_session(session)
+                supervisor.submit(event)
     
     except KeyboardInterrupt:
         print("\n\n⏸️ Остановка бота...")
+        supervisor.stop()
         scheduler.stop()
+        outbox.stop()
         print("✅ Бот остановлен")
     
     except Exception as e:
         print(f"\n❌ Критическая ошибка: {e}")
+        supervisor.stop()
+        scheduler.stop()
+        outbox.stop()
+
+
+def main_callback():
+    """Главная функция бота в режиме Callback API"""
+    print("=" * 50)
+    print("🎮 CHILL BOT - ЗАПУСК (Callback API)")
+    print("=" * 50)
+    
+    # Инициализация БД
+    print("\n📦 Инициализация базы данных...")
+    init_db()
+    states.init_store()
+    
+    # Инициализация VK API
+    print("\n🔌 Подключение к VK API...")
+    raw_vk = init_vk_api()
+    
+    # Исходящие сообщения обработчиков и планировщика — через общую очередь
+    print("\n📤 Запуск очереди исходящих...")
+    outbox.start()
+    vk = outbox.wrap(raw_vk)
+    
+    # Запуск планировщика
+    print("\n⏰ Запуск планировщика...")
+    scheduler = SchedulerService(vk)
+    scheduler.start()
+    xp_buffer.start()
+    leaderboard.start()
+    broadcast_service.start()
+    
+    # Запуск пула обработки событий
+    print("\n🧵 Запуск диспетчера событий...")
+    dispatcher = EventDispatcher(lambda event: process_event(vk, event))
+    dispatcher.start()
+    
+    server = CallbackServer(dispatcher)
+    
+    print("\n" + "=" * 50)
+    print("✅ БОТ ЗАПУЩЕН И ГОТОВ К РАБОТЕ!")
+    print("=" * 50)
+    print("\nОжидание событий...\n")
+    
+    try:
+        server.serve_forever()
+    
+    except KeyboardInterrupt:
+        print("\n\n⏸️ Остановка бота...")
+        server.shutdown()
+        dispatcher.stop()
+        xp_buffer.stop()
         scheduler.stop()
+        outbox.stop()
+        print("✅ Бот остановлен")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if config.RUNTIME_MODE == 'async':
+        try:
+            asyncio.run(main_async())
+        except KeyboardInterrupt:
+            pass
+    elif config.RUNTIME_MODE == 'multiprocess':
+        main_multiprocess()
+    elif config.RUNTIME_MODE == 'callback':
+        main_callback()
+    else:
+        main()
\ No newline at end of file
@@ -24,6 +24,52 @@ CONFIRMATION_TIMEOUT_MINUTES = int(os.getenv('CONFIRMATION_TIMEOUT_MINUTES', 5))
 STARTING_BALANCE = int(os.getenv('STARTING_BALANCE', 100))
 TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow')
 
+# Event processing
+WORKER_POOL_SIZE = int(os.getenv('WORKER_POOL_SIZE', 8))  # Потоков обработки событий
+
+# Runtime: sync (потоки), async (asyncio), multiprocess (несколько процессов)
+# или callback (приём событий через Callback API вместо LongPoll)
+RUNTIME_MODE = os.getenv('RUNTIME_MODE', 'sync')
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', os.cpu_count() or 1))
+ASYNC_MAX_IN_FLIGHT = int(os.getenv('ASYNC_MAX_IN_FLIGHT', 1000))  # Одновременно обрабатываемых событий
+ASYNC_DB_POOL_SIZE = int(os.getenv('ASYNC_DB_POOL_SIZE', 20))
+
+# Буфер опыта: период записи счётчиков сообщений в БД
+XP_FLUSH_INTERVAL_SECONDS = int(os.getenv('XP_FLUSH_INTERVAL_SECONDS', 5))
+
+# Кэш профилей VK (users.get)
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv('PROFILE_CACHE_TTL_SECONDS', 6 * 60 * 60))
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 50000))
+
+# Лимит запросов сообщества к API VK в секунду (делится между очередью исходящих и рассылками)
+VK_GROUP_RPS_LIMIT = float(os.getenv('VK_GROUP_RPS_LIMIT', 20))
+
+# Массовые рассылки (запросов messages.send в секунду, не больше VK_GROUP_RPS_LIMIT - OUTBOX_RPS)
+BROADCAST_RPS = float(os.getenv('BROADCAST_RPS', 5))
+
+# Таблица лидеров: пересборка из БД (изменения из других процессов)
+LEADERBOARD_REFRESH_SECONDS = int(os.getenv('LEADERBOARD_REFRESH_SECONDS', 60))
+
+# Очередь исходящих сообщений (часть лимита группы оставлена рассылкам)
+OUTBOX_RPS = float(os.getenv('OUTBOX_RPS', 15))
+
+# Глобальная статистика: период сверки счётчиков точным пересчётом
+GLOBAL_STATS_RECONCILE_MINUTES = int(os.getenv('GLOBAL_STATS_RECONCILE_MINUTES', 60))
+GLOBAL_STATS_SHARDS = int(os.getenv('GLOBAL_STATS_SHARDS', 16))  # Строк-счётчиков: записи разных воркеров не ждут одну строку
+
+# Планировщик платежей: период сверки будильника с БД (платежи других экземпляров бота)
+SCHEDULER_RESYNC_MINUTES = int(os.getenv('SCHEDULER_RESYNC_MINUTES', 10))
+SCHEDULED_PAYMENT_BATCH_SIZE = int(os.getenv('SCHEDULED_PAYMENT_BATCH_SIZE', 500))  # Платежей в одной транзакции БД
+
+# Хранилище состояний диалогов (FSM): database (таблица fsm_states) или memory (только процесс)
+FSM_STATE_STORE = os.getenv('FSM_STATE_STORE', 'database')
+
+# Callback API
+CALLBACK_HOST = os.getenv('CALLBACK_HOST', '0.0.0.0')
+CALLBACK_PORT = int(os.getenv('CALLBACK_PORT', 8080))
+CALLBACK_CONFIRMATION_CODE = os.getenv('CALLBACK_CONFIRMATION_CODE', '')
+CALLBACK_SECRET = os.getenv('CALLBACK_SECRET', '')
+
 # Validation
 if not VK_GROUP_TOKEN:
     raise ValueError("VK_GROUP_TOKEN не установлен в .env файле!")
@@ -32,4 +78,6 @@ if not VK_GROUP_ID:
 if not ADMIN_IDS:
     raise ValueError("ADMIN_IDS не установлены в .env файле!")
 if not DATABASE_URL:
-    raise ValueError("DATABASE_URL не установлен в .env файле!")
\ No newline at end of file
+    raise ValueError("DATABASE_URL не установлен в .env файле!")
+if RUNTIME_MODE == 'callback' and not CALLBACK_CONFIRMATION_CODE:
+    raise ValueError("CALLBACK_CONFIRMATION_CODE не установлен в .env файле!")
\ No newline at end of file
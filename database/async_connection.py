@@ -0,0 +1,55 @@
+"""
+Асинхронное подключение к Supabase PostgreSQL (asyncpg) для asyncio-режима
+"""
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+import config
+
+
+def _to_asyncpg_url(url):
+    """
+    Преобразование DATABASE_URL в формат драйвера asyncpg
+    Возвращает (url, connect_args)
+    """
+    parts = urlsplit(url)
+    scheme = 'postgresql+asyncpg'
+    
+    # asyncpg не понимает sslmode — переводим в параметр ssl
+    query = dict(parse_qsl(parts.query))
+    connect_args = {}
+    sslmode = query.pop('sslmode', None)
+    if sslmode and sslmode != 'disable':
+        connect_args['ssl'] = 'require'
+    
+    return urlunsplit((scheme, parts.netloc, parts.path, urlencode(query), parts.fragment)), connect_args
+
+
+_async_url, _connect_args = _to_asyncpg_url(config.DATABASE_URL)
+
+# Создание асинхронного движка БД
+async_engine = create_async_engine(
+    _async_url,
+    pool_size=config.ASYNC_DB_POOL_SIZE,
+    max_overflow=20,
+    pool_pre_ping=True,
+    connect_args=_connect_args,
+    echo=False
+)
+
+# Фабрика асинхронных сессий (expire_on_commit=False — как у синхронной, см. database/connection.py)
+AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+def get_async_session():
+    """Получить асинхронную сессию БД"""
+    return AsyncSessionLocal()
+
+
+async def close_async_session(session):
+    """Закрыть асинхронную сессию БД"""
+    try:
+        await session.close()
+    except Exception as e:
+        print(f"❌ Ошибка при закрытии сессии: {e}")
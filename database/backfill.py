@@ -0,0 +1,76 @@
+"""
+Разовые пересборки производных данных
+
+Запуск:
+    python -m database.backfill player_stats
+    python -m database.backfill achievements
+"""
+import sys
+import time
+
+import vk_api
+
+from database.connection import init_db, get_session, close_session, unit_of_work
+from database.queries import rebuild_player_stats
+import config
+
+
+def backfill_player_stats(session):
+    """Статистика игроков по всей истории транзакций"""
+    with unit_of_work(session):
+        rows = rebuild_player_stats(session)
+    return f"игроков со статистикой: {rows}"
+
+
+def backfill_achievements(session):
+    """Достижения по всем правилам; уведомления — через очередь исходящих"""
+    from services.achievement_service import achievement_engine
+    from services.outbox import outbox
+    
+    outbox.start()
+    try:
+        vk = outbox.wrap(vk_api.VkApi(token=config.VK_GROUP_TOKEN).get_api())
+        results = achievement_engine.backfill(session, vk)
+    finally:
+        # Дождаться отправки всех уведомлений
+        outbox.stop(timeout=None)
+    
+    return ', '.join(f"{achievement_type}: {count}" for achievement_type, count in results.items())
+
+
+# Команда -> функция пересборки (player_stats раньше achievements: правила читают счётчики)
+BACKFILLS = {
+    'player_stats': backfill_player_stats,
+    'achievements': backfill_achievements
+}
+
+
+def main(argv):
+    names = argv or list(BACKFILLS)
+    unknown = [name for name in names if name not in BACKFILLS]
+    if unknown:
+        print(f"❌ Неизвестные команды: {', '.join(unknown)}")
+        print(f"Доступные: {', '.join(BACKFILLS)}")
+        return 1
+    
+    init_db()
+    session = get_session()
+    
+    try:
+        for name in names:
+            started = time.monotonic()
+            print(f"🔄 {name}...")
+            result = BACKFILLS[name](session)
+            print(f"✅ {name}: {result} ({time.monotonic() - started:.2f} сек.)")
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Ошибка пересборки: {e}")
+        return 1
+    finally:
+        close_session(session)
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,90 @@
+"""
+Обвязка бенчмарков с отдельной схемой PostgreSQL (python -m database.benchmark_*)
+
+Схема бенчмарка создаётся заново, нужные таблицы копируются из public
+(LIKE ... INCLUDING ALL — с ключами, индексами и значениями по умолчанию),
+а движок бенчмарка ищет таблицы сначала в ней: код приложения работает
+с копиями, не зная о схеме. После прогона схема удаляется, если не передан --keep
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+
+from database.connection import engine, init_db
+import config
+
+
+def add_keep_argument(parser, schema):
+    """Флаг --keep: оставить схему для разбора после прогона"""
+    parser.add_argument('--keep', action='store_true', help=f"не удалять схему {schema}")
+
+
+def postgres_required():
+    """Бенчмарки схем работают только с PostgreSQL; False — запуск невозможен (сообщение напечатано)"""
+    if engine.dialect.name != 'postgresql':
+        print("❌ Бенчмарк рассчитан на PostgreSQL")
+        return False
+    return True
+
+
+@contextmanager
+def scratch_schema(schema, tables, keep=False, including='ALL', pool_size=2, **engine_options):
+    """
+    Пустая схема с копиями tables; отдаёт движок бенчмарка
+    including — что копировать из public: ALL или, например, DEFAULTS (без ключей и индексов)
+    pool_size и engine_options — параметры пула (по соединению на поток бенчмарка)
+    Схема удаляется на выходе, даже если прогон упал; keep=True — оставить
+    """
+    init_db()
+    
+    # Отдельный пул: таблицы ищутся сначала в схеме бенчмарка
+    bench_engine = create_engine(
+        config.DATABASE_URL,
+        pool_size=pool_size,
+        connect_args={'options': f'-csearch_path={schema},public'},
+        **engine_options
+    )
+    
+    try:
+        with bench_engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            conn.execute(text(f"CREATE SCHEMA {schema}"))
+            for table in tables:
+                conn.execute(text(f"CREATE TABLE {schema}.{table} (LIKE public.{table} INCLUDING {including})"))
+        
+        yield bench_engine
+    
+    finally:
+        if not keep:
+            with bench_engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        bench_engine.dispose()
+
+
+class StatementCounter:
+    """
+    SQL-запросы и коммиты движка бенчмарка
+    record=True — сохранять и запросы: (текст, параметры)
+    """
+    
+    def __init__(self, bench_engine, record=False):
+        self.engine = bench_engine
+        self.count = 0
+        self.commits = 0
+        self.statements = [] if record else None
+        
+        event.listen(bench_engine, 'before_cursor_execute', self._on_execute)
+        event.listen(bench_engine, 'commit', self._on_commit)
+    
+    def remove(self):
+        """Перестать считать"""
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+        event.remove(self.engine, 'commit', self._on_commit)
+    
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        if self.statements is not None:
+            self.statements.append((statement, parameters))
+    
+    def _on_commit(self, conn):
+        self.commits += 1
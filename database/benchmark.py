@@ -0,0 +1,187 @@
+"""
+Бенчмарк планов горячих запросов: до и после индексов из database/migrations.py
+
+В отдельной схеме bench создаются копии таблиц без индексов, заполняются
+синтетическими данными (generate_series), и для каждого запроса печатается
+EXPLAIN (ANALYZE, BUFFERS) без индексов и с ними. Запросы берутся из реального
+кода: SQL перехватывается при вызове функций из database/queries.py.
+
+Только PostgreSQL. Запуск:
+    python -m database.benchmark                    10 000 000 транзакций
+    python -m database.benchmark --rows 1000000
+    python -m database.benchmark --keep             не удалять схему bench
+"""
+import argparse
+import re
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import sessionmaker
+
+from database.bench_schema import add_keep_argument, postgres_required, scratch_schema
+from database.migrations import INDEXES
+from database.models import PurchaseRequest
+from database.queries import claim_due_payments
+from database.read_queries import get_history_page
+import config
+
+BENCH_SCHEMA = 'bench'
+TABLES = ['players', 'transactions', 'purchase_requests', 'scheduled_payments', 'achievements']
+
+
+def _seed(conn, rows, players):
+    """Синтетические данные"""
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.players
+            (id, vk_id, first_name, last_name, balance, experience, level, messages_count,
+             notifications_enabled, hide_balance, is_banned, created_at, updated_at)
+        SELECT g, 100000000 + g, 'Игрок', g::text, (random() * 10000)::int, 0, 1, 0,
+               true, false, false, now(), now()
+        FROM generate_series(1, :players) g
+    """), {'players': players})
+    
+    # Четверть — админские начисления/списания с одной стороной NULL
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.transactions
+            (id, from_player_id, to_player_id, amount, type, reason, is_anonymous, created_at)
+        SELECT g,
+               CASE WHEN g % 4 = 0 THEN NULL ELSE 1 + (random() * (:players - 1))::int END,
+               CASE WHEN g % 4 = 1 THEN NULL ELSE 1 + (random() * (:players - 1))::int END,
+               1 + (random() * 1000)::int,
+               (ARRAY['TRANSFER', 'PURCHASE', 'ADMIN_GIVE', 'ADMIN_TAKE', 'SCHEDULED_GIVE']::transactiontype[])[1 + g % 5],
+               NULL, false,
+               now() - random() * interval '365 days'
+        FROM generate_series(1, :rows) g
+    """), {'rows': rows, 'players': players})
+    
+    # Почти все запросы обработаны, ожидающих — доли процента
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.purchase_requests
+            (id, player_id, item_description, price, status, created_at, updated_at)
+        SELECT g, 1 + (random() * (:players - 1))::int, 'Предмет', 100,
+               CASE WHEN g % 500 = 0 THEN 'pending' ELSE 'completed' END,
+               now() - random() * interval '365 days', now()
+        FROM generate_series(1, :count) g
+    """), {'count': max(rows // 50, 1000), 'players': players})
+    
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.scheduled_payments
+            (id, player_id, admin_id, amount, reason, scheduled_for, executed, created_at)
+        SELECT g, 1 + (random() * (:players - 1))::int, 1, 100, NULL,
+               now() - interval '180 days' + random() * interval '365 days',
+               g % 1000 <> 0,
+               now()
+        FROM generate_series(1, :count) g
+    """), {'count': max(rows // 10, 1000), 'players': players})
+    
+    for table in TABLES:
+        conn.execute(text(f"ANALYZE {BENCH_SCHEMA}.{table}"))
+
+
+def _create_indexes(conn):
+    for name, (table, columns, unique) in INDEXES.items():
+        conn.execute(text(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {BENCH_SCHEMA}.{table} ({columns})"
+        ))
+    for table in TABLES:
+        conn.execute(text(f"ANALYZE {BENCH_SCHEMA}.{table}"))
+
+
+def _latest_pending_request(session):
+    """Запрос из handle_admin_price_response"""
+    return session.query(PurchaseRequest).filter_by(
+        status='pending'
+    ).order_by(PurchaseRequest.created_at.desc()).first()
+
+
+# Название -> функция (session, sample_player_id)
+QUERIES = {
+    'get_history_page': lambda session, player_id: get_history_page(session, player_id, limit=10),
+    'claim_due_payments': lambda session, player_id: claim_due_payments(session, config.SCHEDULED_PAYMENT_BATCH_SIZE),
+    'handle_admin_price_response': lambda session, player_id: _latest_pending_request(session),
+}
+
+
+def _explain(make_session, bench_engine, query):
+    """Перехват SQL функции и EXPLAIN (ANALYZE, BUFFERS) по нему в схеме bench"""
+    session = make_session()
+    captured = []
+    
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+    
+    try:
+        sample_player_id = session.execute(text("SELECT min(id) + (max(id) - min(id)) / 2 FROM players")).scalar()
+        
+        # Изменения запроса (claim_due_payments отмечает платежи) откатываются до EXPLAIN ANALYZE
+        savepoint = session.begin_nested()
+        event.listen(bench_engine, 'before_cursor_execute', capture)
+        try:
+            query(session, sample_player_id)
+        finally:
+            event.remove(bench_engine, 'before_cursor_execute', capture)
+            savepoint.rollback()
+        
+        statement, parameters = captured[-1]
+        cursor = session.connection().connection.cursor()
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+    
+    finally:
+        session.rollback()
+        session.close()
+
+
+def _execution_ms(plan):
+    match = re.search(r'Execution Time: ([\d.]+) ms', plan)
+    return float(match.group(1)) if match else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Планы горячих запросов до и после индексов")
+    parser.add_argument('--rows', type=int, default=10_000_000, help="транзакций в истории")
+    parser.add_argument('--players', type=int, default=50_000)
+    add_keep_argument(parser, BENCH_SCHEMA)
+    args = parser.parse_args()
+    
+    if not postgres_required():
+        return 1
+    
+    results = {}
+    # LIKE без INCLUDING INDEXES: ни первичных ключей, ни индексов
+    with scratch_schema(BENCH_SCHEMA, TABLES, keep=args.keep, including='DEFAULTS') as bench_engine:
+        make_session = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=bench_engine)
+        
+        print(f"📦 Заполнение схемы {BENCH_SCHEMA}: {args.rows:,} транзакций, {args.players:,} игроков...")
+        started = time.monotonic()
+        with bench_engine.begin() as conn:
+            _seed(conn, args.rows, args.players)
+        print(f"✅ Данные готовы ({time.monotonic() - started:.1f} сек.)")
+        
+        for name, query in QUERIES.items():
+            results[name] = [_explain(make_session, bench_engine, query)]
+        
+        print("🔧 Создание индексов...")
+        with bench_engine.begin() as conn:
+            _create_indexes(conn)
+        
+        for name, query in QUERIES.items():
+            results[name].append(_explain(make_session, bench_engine, query))
+    
+    for name, (before, after) in results.items():
+        print("\n" + "=" * 70)
+        print(f"📊 {name}")
+        print("=" * 70)
+        print("\n— Без индексов:\n" + before)
+        print("\n— С индексами:\n" + after)
+    
+    print("\n" + "=" * 70)
+    print(f"{'Запрос':<32}{'без индексов, мс':>18}{'с индексами, мс':>18}")
+    for name, (before, after) in results.items():
+        print(f"{name:<32}{_execution_ms(before) or 0:>18.2f}{_execution_ms(after) or 0:>18.2f}")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,156 @@
+"""
+Загрузки игрока на событие: handle_message для типичных сообщений
+
+В отдельной схеме bench_events создаются отправитель и получатель, и через
+app.handle_message проходят события отправителя: обычное сообщение, команды
+меню и диалог перевода до подтверждения. Для каждого события считаются
+SQL-запросы (before_cursor_execute) и среди них — SELECT из players по
+VK ID отправителя. Игрок события должен загружаться ровно один раз
+(в handle_message, дальше — из контекста события), иначе код выхода 1.
+
+Только PostgreSQL. Запуск:
+    python -m database.benchmark_events
+    python -m database.benchmark_events --sql     печатать запросы
+"""
+import argparse
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from database.bench_schema import add_keep_argument, postgres_required, scratch_schema, StatementCounter
+from database.state_store import MemoryStateStore
+from middleware import rate_limiter
+from utils.events import MessageEvent
+import app
+import states
+
+BENCH_SCHEMA = 'bench_events'
+TABLES = ['players', 'transactions', 'player_stats', 'global_stats', 'achievements', 'purchase_requests']
+
+SENDER_VK_ID = 100000001
+RECEIVER_VK_ID = 100000002
+
+# Сообщения отправителя по порядку (диалог перевода идёт через состояния FSM)
+MESSAGES = [
+    "Привет",
+    "Начать",
+    "❓ Помощь",
+    "💰 Баланс",
+    "📜 История",
+    "🏆 Топ игроков",
+    "📊 Статистика",
+    "⚙️ Настройки",
+    "➡️ Перевести",
+    str(RECEIVER_VK_ID),
+    "10",
+    "✅ Подтвердить",
+]
+
+
+class _RecordingVk:
+    """Клиент VK: запоминает отправленные сообщения, профили отдаёт без сети"""
+    
+    def __init__(self):
+        self.messages = self
+        self.users = self
+        self.sent = []
+    
+    def send(self, **params):
+        self.sent.append(params)
+        return 0
+    
+    def get(self, user_ids, **params):
+        return [
+            {'id': int(vk_id), 'first_name': 'Игрок', 'last_name': vk_id}
+            for vk_id in user_ids.split(',')
+        ]
+
+
+def _seed(conn):
+    """Отправитель и получатель"""
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.players
+            (id, vk_id, first_name, last_name, balance, experience, level, messages_count,
+             notifications_enabled, hide_balance, is_banned, created_at, updated_at)
+        SELECT g, 100000000 + g, 'Игрок', g::text, 1000000, 0, 1, 0,
+               true, false, false, now(), now()
+        FROM generate_series(1, 2) g
+    """))
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.global_stats (id, total_players, total_emission, total_transactions, updated_at)
+        SELECT 1, count(*), sum(balance), 0, now() FROM {BENCH_SCHEMA}.players
+    """))
+
+
+def _loads_sender(statement, parameters):
+    """SELECT из players с VK ID отправителя в параметрах"""
+    values = parameters.values() if isinstance(parameters, dict) else parameters
+    return (
+        statement.lstrip().upper().startswith('SELECT')
+        and 'FROM players' in statement
+        and SENDER_VK_ID in values
+    )
+
+
+def _handle(make_session, bench_engine, vk, message, show_sql):
+    """
+    Одно событие отправителя через handle_message, как в process_event
+    Возвращает (запросов, загрузок игрока отправителя)
+    """
+    session = make_session()
+    # Бенчмарк шлёт команды подряд — лимит частоты не должен их отсекать
+    rate_limiter.user_requests.pop(SENDER_VK_ID, None)
+    
+    counter = StatementCounter(bench_engine, record=True)
+    try:
+        app.handle_message(vk, MessageEvent(SENDER_VK_ID, message), session)
+    finally:
+        counter.remove()
+        session.rollback()
+        session.close()
+    
+    if show_sql:
+        for statement, _ in counter.statements:
+            print("    " + " ".join(statement.split())[:200])
+    
+    loads = sum(1 for statement, parameters in counter.statements if _loads_sender(statement, parameters))
+    return counter.count, loads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузки игрока на событие")
+    parser.add_argument('--sql', action='store_true', help="печатать запросы событий")
+    add_keep_argument(parser, BENCH_SCHEMA)
+    args = parser.parse_args()
+    
+    if not postgres_required():
+        return 1
+    
+    states.use_store(MemoryStateStore())
+    
+    violations = []
+    with scratch_schema(BENCH_SCHEMA, TABLES, keep=args.keep) as bench_engine:
+        make_session = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=bench_engine)
+        with bench_engine.begin() as conn:
+            _seed(conn)
+        
+        vk = _RecordingVk()
+        print(f"{'Сообщение':<24}{'запросов':>10}{'загрузок игрока':>18}")
+        for message in MESSAGES:
+            queries, loads = _handle(make_session, bench_engine, vk, message, args.sql)
+            
+            ok = loads == 1
+            if not ok:
+                violations.append(message)
+            print(f"{'✅' if ok else '❌'} {message:<22}{queries:>10}{loads:>18}")
+    
+    if violations:
+        print(f"\n❌ Игрок отправителя загружен не один раз: {', '.join(violations)}")
+        return 1
+    
+    print("\n✅ Каждое событие: игрок отправителя загружен один раз")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+"""
+Суточный прогон состояний FSM на виртуальных часах: память без очистки
+против колеса таймеров (states.cleanup_expired_states каждую секунду)
+
+Каждую виртуальную секунду начинаются новые диалоги (set_state), часть из них
+с подтверждением (add_pending_confirmation). Часть диалогов пользователи
+завершают (clear_state, remove_pending_confirmation), остальные бросают —
+такие записи держатся до таймаута. Без очистки брошенные записи копятся,
+с колесом число записей и память (tracemalloc) выходят на плато. Время не
+ждётся, а переводится. Печатается почасовая таблица и стоимость очистки
+за тик; если память колеса растёт после первого часа — код выхода 1.
+
+БД не нужна (хранилище memory). Запуск:
+    python -m database.benchmark_fsm_expiry
+    python -m database.benchmark_fsm_expiry --hours 24 --rate 20
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from database.state_store import MemoryStateStore
+from utils.timer_wheel import TimerWheel
+import config
+import states
+
+# Допустимый рост памяти колеса относительно первого часа
+FLAT_TOLERANCE = 1.25
+
+
+def _run(args, expire):
+    """Прогон: [(час, записей, МБ)], (тиков, сумма, максимум) стоимости очистки в мкс"""
+    rnd = random.Random(args.seed)
+    clock = [0.0]
+    store = MemoryStateStore()
+    states.use_store(store, wheel=TimerWheel(clock=lambda: clock[0]))
+    
+    # Секунда -> действия пользователей, завершающих диалог
+    finishing = {}
+    confirmation_id = 0
+    samples = []
+    # Только агрегаты: список замеров сам рос бы на тик и портил замер памяти
+    sweeps, sweep_total, sweep_max = 0, 0.0, 0.0
+    
+    tracemalloc.start()
+    for second in range(1, args.hours * 3600 + 1):
+        clock[0] = float(second)
+        
+        for _ in range(rnd.randint(0, 2 * args.rate)):
+            vk_id = rnd.randint(1, args.users)
+            states.set_state(vk_id, states.State.WAITING_TRANSFER_AMOUNT, receiver_vk_id=rnd.randint(1, args.users))
+            if rnd.random() < args.complete:
+                finishing.setdefault(second + rnd.randint(5, 120), []).append((states.clear_state, vk_id))
+            
+            if rnd.random() < args.confirmations:
+                confirmation_id += 1
+                states.add_pending_confirmation(f"transfer_{confirmation_id}", vk_id, 'transfer', amount=100)
+                if rnd.random() < args.complete:
+                    finishing.setdefault(second + rnd.randint(5, 120), []).append(
+                        (states.remove_pending_confirmation, f"transfer_{confirmation_id}")
+                    )
+        
+        for action, key in finishing.pop(second, ()):
+            action(key)
+        
+        if expire:
+            started = time.perf_counter()
+            states.cleanup_expired_states()
+            cost = (time.perf_counter() - started) * 1_000_000
+            sweeps, sweep_total, sweep_max = sweeps + 1, sweep_total + cost, max(sweep_max, cost)
+        
+        if second % 3600 == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            samples.append((second // 3600, len(store.mapping), current / 1024 / 1024))
+    
+    tracemalloc.stop()
+    return samples, (sweeps, sweep_total, sweep_max)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Состояния FSM за сутки: без очистки против колеса таймеров")
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--rate', type=int, default=5, help="новых диалогов в секунду (в среднем)")
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--complete', type=float, default=0.6, help="доля диалогов, которые завершают")
+    parser.add_argument('--confirmations', type=float, default=0.3, help="доля диалогов с подтверждением")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    
+    print(f"📦 {args.hours} ч., ~{args.rate} диалогов/сек., таймаут {config.CONFIRMATION_TIMEOUT_MINUTES} мин.")
+    runs = {}
+    for name, expire in (('без очистки', False), ('колесо', True)):
+        started = time.perf_counter()
+        runs[name] = _run(args, expire)
+        print(f"⏱ {name}: {time.perf_counter() - started:.1f} сек.")
+    
+    print("\n" + "=" * 56)
+    print(f"{'час':>5}" + "".join(f"{name + ', зап.':>18}{'МБ':>8}" for name in runs))
+    for index in range(args.hours):
+        row = f"{index + 1:>5}"
+        for samples, _ in runs.values():
+            _, entries, megabytes = samples[index]
+            row += f"{entries:>18,}{megabytes:>8.1f}"
+        print(row)
+    
+    samples, (sweeps, sweep_total, sweep_max) = runs['колесо']
+    print(f"\n🧹 Очистка за тик: сред. {sweep_total / sweeps:.1f} мкс, макс. {sweep_max:.1f} мкс")
+    
+    baseline = samples[0][2]
+    peak = max(megabytes for _, _, megabytes in samples)
+    flat = peak <= baseline * FLAT_TOLERANCE
+    print(f"\n{'✅ Память колеса не растёт' if flat else '❌ Память колеса растёт'}: {baseline:.1f} → пик {peak:.1f} МБ")
+    return 0 if flat else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
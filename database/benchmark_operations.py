@@ -0,0 +1,200 @@
+"""
+Коммиты и запросы на бизнес-операцию
+
+Каждая операция сервисного слоя выполняется в отдельной схеме bench_operations
+так же, как при обработке события (игрок события уже загружен в контекст),
+и для неё считаются SQL-запросы и коммиты. Замер — на втором выполнении:
+кэши (контекст события, полученные достижения) уже прогреты, у игроков есть
+все достижения, поэтому считается только сама операция.
+
+Проверяется, что операция коммитит ровно один раз и укладывается в бюджет
+запросов; при нарушении код выхода 1.
+
+Только PostgreSQL. Запуск:
+    python -m database.benchmark_operations
+    python -m database.benchmark_operations --sql     печатать запросы
+"""
+import argparse
+import itertools
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from database.bench_schema import add_keep_argument, postgres_required, scratch_schema, StatementCounter
+from database.connection import unit_of_work
+from database.models import PurchaseRequest
+from database.queries import get_or_create_player, get_player_by_vk_id
+from middleware.context import begin_request, end_request
+from services.achievement_service import ACHIEVEMENTS
+from services.transaction_service import transfer_chilliki, admin_give_chilliki, admin_take_chilliki, purchase_item
+
+BENCH_SCHEMA = 'bench_operations'
+TABLES = ['players', 'transactions', 'player_stats', 'global_stats', 'achievements', 'purchase_requests']
+
+# VK ID игроков схемы: отправитель/покупатель и получатель
+SENDER_VK_ID = 100000001
+RECEIVER_VK_ID = 100000002
+ADMIN_VK_ID = 100000003
+
+_new_vk_ids = itertools.count(200000001)
+
+
+class _RecordingVk:
+    """Клиент VK, который только запоминает отправленные сообщения"""
+    
+    def __init__(self):
+        self.messages = self
+        self.sent = []
+    
+    def send(self, **params):
+        self.sent.append(params)
+        return 0
+
+
+def _seed(conn):
+    """Игроки со всеми достижениями"""
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.players
+            (id, vk_id, first_name, last_name, balance, experience, level, messages_count,
+             notifications_enabled, hide_balance, is_banned, created_at, updated_at)
+        SELECT g, 100000000 + g, 'Игрок', g::text, 1000000, 0, 1, 0,
+               true, false, false, now(), now()
+        FROM generate_series(1, 3) g
+    """))
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.global_stats (id, total_players, total_emission, total_transactions, updated_at)
+        SELECT 1, count(*), sum(balance), 0, now() FROM {BENCH_SCHEMA}.players
+    """))
+    
+    for achievement_type, rule in ACHIEVEMENTS.items():
+        conn.execute(text(f"""
+            INSERT INTO {BENCH_SCHEMA}.achievements (player_id, achievement_type, title, description, icon, earned_at)
+            SELECT id, :type, :title, :description, :icon, now() FROM {BENCH_SCHEMA}.players
+        """), {
+            'type': achievement_type,
+            'title': rule['title'],
+            'description': rule['description'],
+            'icon': rule['icon']
+        })
+
+
+def _transfer(session, vk, prepared):
+    return transfer_chilliki(session, vk, SENDER_VK_ID, RECEIVER_VK_ID, 10)
+
+
+def _admin_give(session, vk, prepared):
+    return admin_give_chilliki(session, vk, ADMIN_VK_ID, RECEIVER_VK_ID, 10, "бенчмарк")
+
+
+def _admin_take(session, vk, prepared):
+    return admin_take_chilliki(session, vk, ADMIN_VK_ID, RECEIVER_VK_ID, 10, "бенчмарк")
+
+
+def _prepare_purchase(session):
+    """Одобренный запрос на покупку, уже загруженный обработчиком"""
+    player = get_player_by_vk_id(session, SENDER_VK_ID)
+    with unit_of_work(session):
+        request = PurchaseRequest(player_id=player.id, item_description="Предмет", price=10, status='approved')
+        session.add(request)
+    return request
+
+
+def _purchase(session, vk, request):
+    """Подтверждение покупки (handle_purchase_confirm)"""
+    return purchase_item(session, vk, SENDER_VK_ID, request.item_description, request.price, purchase_request=request)
+
+
+def _new_player(session, vk, prepared):
+    """Первое сообщение нового игрока (handle_message)"""
+    vk_id = next(_new_vk_ids)
+    player = get_player_by_vk_id(session, vk_id)
+    if player is None:
+        with unit_of_work(session):
+            player = get_or_create_player(session, vk_id, 'Новый', 'Игрок')
+    return True, player
+
+
+# Название -> (подготовка (session) или None, операция (session, vk, подготовленное), бюджет запросов)
+OPERATIONS = {
+    # получатель (в событии — при первом обращении), блокировка строк, CTE перевода
+    'transfer_chilliki': (None, _transfer, 3),
+    # получатель, CTE change_balance (баланс, история, счётчики)
+    'admin_give_chilliki': (None, _admin_give, 2),
+    'admin_take_chilliki': (None, _admin_take, 2),
+    # CTE change_balance, UPDATE запроса
+    'purchase_item': (_prepare_purchase, _purchase, 2),
+    # поиск игрока (handle_message), поиск в get_or_create_player, global_stats, INSERT игрока
+    'new_player': (None, _new_player, 4),
+}
+
+
+def _measure(make_session, bench_engine, prepare, operation, show_sql):
+    """
+    Выполнить операцию в контексте события дважды, замерить второе выполнение
+    Возвращает (запросов, коммитов, результат операции)
+    """
+    session = make_session()
+    
+    try:
+        vk = _RecordingVk()
+        player = get_player_by_vk_id(session, SENDER_VK_ID)
+        begin_request(session, SENDER_VK_ID, player)
+        
+        # Первое выполнение прогревает кэши
+        operation(session, vk, prepare(session) if prepare else None)
+        
+        prepared = prepare(session) if prepare else None
+        counter = StatementCounter(bench_engine, record=show_sql)
+        try:
+            result = operation(session, vk, prepared)
+        finally:
+            counter.remove()
+        
+        if show_sql:
+            for statement, _ in counter.statements:
+                print("    " + " ".join(statement.split())[:200])
+        
+        return counter.count, counter.commits, result
+    
+    finally:
+        end_request(session)
+        session.rollback()
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Коммиты и запросы на бизнес-операцию")
+    parser.add_argument('--sql', action='store_true', help="печатать запросы операций")
+    add_keep_argument(parser, BENCH_SCHEMA)
+    args = parser.parse_args()
+    
+    if not postgres_required():
+        return 1
+    
+    violations = []
+    with scratch_schema(BENCH_SCHEMA, TABLES, keep=args.keep) as bench_engine:
+        make_session = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=bench_engine)
+        with bench_engine.begin() as conn:
+            _seed(conn)
+        
+        print(f"{'Операция':<24}{'запросов':>10}{'бюджет':>10}{'коммитов':>10}")
+        for name, (prepare, operation, budget) in OPERATIONS.items():
+            queries, commits, result = _measure(make_session, bench_engine, prepare, operation, args.sql)
+            
+            ok = commits == 1 and queries <= budget and result[0]
+            if not ok:
+                violations.append(name)
+            print(f"{'✅' if ok else '❌'} {name:<22}{queries:>10}{budget:>10}{commits:>10}")
+            if not result[0]:
+                print(f"    {result[1]}")
+    
+    if violations:
+        print(f"\n❌ Превышен бюджет или больше одного коммита: {', '.join(violations)}")
+        return 1
+    
+    print("\n✅ Все операции: один коммит, запросы в пределах бюджета")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
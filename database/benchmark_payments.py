@@ -0,0 +1,223 @@
+"""
+Нагрузочный тест выполнения запланированных платежей (claim_due_payments + apply_scheduled_payments)
+
+В отдельной схеме bench_payments создаются игроки и наступившие платежи.
+Несколько потоков — как несколько экземпляров бота — одновременно забирают
+и начисляют пачки, пока очередь не опустеет. После каждого прогона
+проверяется, что каждый платёж выполнен ровно один раз: все отмечены,
+записей в истории столько же, сколько платежей, сумма балансов выросла
+ровно на сумму платежей. Печатается пропускная способность. В конце
+выполняется один платёж сегменту «все игроки»: одна строка в очереди
+раскрывается в начисление каждому игроку.
+
+Только PostgreSQL. Запуск:
+    python -m database.benchmark_payments
+    python -m database.benchmark_payments --payments 200000 --workers 1 4 8 --batch 1000
+"""
+import argparse
+from datetime import datetime, timedelta
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from database.bench_schema import add_keep_argument, postgres_required, scratch_schema
+from database.connection import unit_of_work
+from database.models import PaymentSegment
+from database.queries import claim_due_payments, apply_scheduled_payments, apply_segment_payment, create_scheduled_payment
+import config
+
+BENCH_SCHEMA = 'bench_payments'
+TABLES = ['players', 'transactions', 'player_stats', 'global_stats', 'scheduled_payments']
+
+
+def _seed(conn, players):
+    """Игроки с нулевым балансом"""
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.players
+            (id, vk_id, first_name, last_name, balance, experience, level, messages_count,
+             notifications_enabled, hide_balance, is_banned, created_at, updated_at)
+        SELECT g, 100000000 + g, 'Игрок', g::text, 0, 0, 1, 0,
+               true, false, false, now(), now()
+        FROM generate_series(1, :players) g
+    """), {'players': players})
+    
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.global_stats (id, total_players, total_emission, total_transactions, updated_at)
+        VALUES (1, :players, 0, 0, now())
+    """), {'players': players})
+
+
+def _enqueue(conn, payments, players):
+    """Наступившие платежи случайным игрокам"""
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.scheduled_payments
+            (player_id, admin_id, amount, reason, scheduled_for, executed, created_at)
+        SELECT 1 + (random() * (:players - 1))::int, 1, 1 + (random() * 100)::int, NULL,
+               now() - random() * interval '1 hour', false, now()
+        FROM generate_series(1, :payments) g
+    """), {'payments': payments, 'players': players})
+    conn.execute(text(f"ANALYZE {BENCH_SCHEMA}.scheduled_payments"))
+
+
+def _snapshot(conn):
+    """Сумма балансов, записи в истории, невыполненные платежи и сумма выполненных"""
+    return conn.execute(text(f"""
+        SELECT (SELECT sum(balance) FROM {BENCH_SCHEMA}.players) AS total_balance,
+               (SELECT count(*) FROM {BENCH_SCHEMA}.transactions) AS transactions,
+               (SELECT count(*) FROM {BENCH_SCHEMA}.scheduled_payments WHERE NOT executed) AS pending,
+               (SELECT coalesce(sum(amount), 0) FROM {BENCH_SCHEMA}.scheduled_payments WHERE executed) AS paid,
+               (SELECT count(*) FROM {BENCH_SCHEMA}.scheduled_payments WHERE executed) AS executed
+    """)).first()
+
+
+def _worker(make_session, batch, counters, lock):
+    """Цикл SchedulerService.process_scheduled_payments без уведомлений"""
+    session = make_session()
+    executed = batches = 0
+    
+    try:
+        while True:
+            with unit_of_work(session):
+                payments = claim_due_payments(session, batch)
+                single = [payment for payment in payments if payment.segment is None]
+                if single:
+                    apply_scheduled_payments(session, single)
+                for payment in payments:
+                    if payment.segment is not None:
+                        apply_segment_payment(session, payment)
+            if not payments:
+                break
+            executed += len(payments)
+            batches += 1
+    except Exception as e:
+        print(f"❌ Ошибка выполнения платежей: {e}")
+        with lock:
+            counters['errors'] += 1
+    finally:
+        session.close()
+    
+    with lock:
+        counters['executed'] += executed
+        counters['batches'] += batches
+
+
+def _run(make_session, workers, batch):
+    counters = {'executed': 0, 'batches': 0, 'errors': 0}
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=_worker, args=(make_session, batch, counters, lock))
+        for _ in range(workers)
+    ]
+    
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    return counters, time.monotonic() - started
+
+
+def _run_segment(make_session, bench_engine, players):
+    """Один платёж сегменту «все»: строк в очереди, время раскрытия, проверка начислений"""
+    amount = 7
+    session = make_session()
+    try:
+        with unit_of_work(session):
+            create_scheduled_payment(
+                session, None, 1, amount, datetime.now() - timedelta(minutes=1),
+                segment=PaymentSegment.ALL
+            )
+    finally:
+        session.close()
+    
+    with bench_engine.connect() as conn:
+        before = _snapshot(conn)
+        queued = conn.execute(text(f"SELECT count(*) FROM {BENCH_SCHEMA}.scheduled_payments WHERE NOT executed")).scalar()
+    
+    counters, elapsed = _run(make_session, 1, 1)
+    
+    with bench_engine.connect() as conn:
+        after = _snapshot(conn)
+    
+    failed = [
+        name for name, passed in {
+            'записей в истории = игроков': after.transactions - before.transactions == players,
+            'начислено всем': after.total_balance - before.total_balance == amount * players,
+        }.items() if not passed
+    ]
+    print(
+        f"{'✅' if not failed else '❌'} Сегмент «все»: {queued} строка в очереди → {players:,} начислений"
+        f" за {elapsed:.2f} сек." + (f" — нарушено: {', '.join(failed)}" if failed else "")
+    )
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выполнение запланированных платежей несколькими экземплярами")
+    parser.add_argument('--payments', type=int, default=100_000, help="наступивших платежей на прогон")
+    parser.add_argument('--players', type=int, default=10_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help="числа экземпляров")
+    parser.add_argument('--batch', type=int, default=config.SCHEDULED_PAYMENT_BATCH_SIZE, help="платежей в пачке")
+    add_keep_argument(parser, BENCH_SCHEMA)
+    args = parser.parse_args()
+    
+    if not postgres_required():
+        return 1
+    
+    results = []
+    consistent = True
+    with scratch_schema(
+        BENCH_SCHEMA, TABLES, keep=args.keep, pool_size=max(args.workers) + 1, max_overflow=0
+    ) as bench_engine:
+        make_session = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=bench_engine)
+        with bench_engine.begin() as conn:
+            _seed(conn, args.players)
+        
+        for workers in args.workers:
+            with bench_engine.begin() as conn:
+                _enqueue(conn, args.payments, args.players)
+                before = _snapshot(conn)
+            
+            counters, elapsed = _run(make_session, workers, args.batch)
+            
+            with bench_engine.connect() as conn:
+                after = _snapshot(conn)
+            
+            executed = after.executed - before.executed
+            checks = {
+                'очередь пуста': after.pending == 0 and counters['errors'] == 0,
+                'выполнено = забрано': executed == counters['executed'] == args.payments,
+                'записей в истории = платежей': after.transactions - before.transactions == executed,
+                'начислено = сумме платежей': after.total_balance - before.total_balance == after.paid - before.paid,
+            }
+            failed = [name for name, passed in checks.items() if not passed]
+            consistent = consistent and not failed
+            
+            results.append((workers, counters, elapsed, failed))
+            print(
+                f"{'✅' if not failed else '❌'} {workers} экз.: {counters['executed'] / elapsed:,.0f} платежей/сек."
+                + (f" — нарушено: {', '.join(failed)}" if failed else "")
+            )
+        
+        consistent = _run_segment(make_session, bench_engine, args.players) and consistent
+    
+    base_rate = None
+    print("\n" + "=" * 60)
+    print(f"{'экземпляров':>12}{'платежей/сек':>16}{'ускорение':>12}{'пачек':>10}{'ошибок':>10}")
+    for workers, counters, elapsed, _ in results:
+        rate = counters['executed'] / elapsed
+        base_rate = base_rate or rate
+        print(
+            f"{workers:>12}{rate:>16,.0f}{rate / base_rate if base_rate else 0:>11.2f}x"
+            f"{counters['batches']:>10,}{counters['errors']:>10,}"
+        )
+    
+    print(f"\n{'✅ Каждый платёж выполнен ровно один раз' if consistent else '❌ Нарушена согласованность'}")
+    return 0 if consistent else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
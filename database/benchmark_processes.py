@@ -0,0 +1,219 @@
+"""
+Многопроцессный режим: событий в секунду от числа процессов-воркеров
+
+События проходят настоящий путь многопроцессного режима: ProcessSupervisor
+распределяет их по очередям воркеров (user_id % N), воркер подключается к
+общим хранилищам супервизора (attach_shared_storage: FSM и rate limit в
+словарях SyncManager — обращение к ним идёт в процесс менеджера) и
+обрабатывает события пулом потоков (serve_inbox) через app.handle_message.
+Вместо служб VK и БД у воркера заглушка VK и своя копия таблиц в SQLite:
+замер не зависит от сети и сервера БД. Сообщения — баланс, начало перевода
+и отмена, чтобы события читали и писали общие словари.
+
+Для сравнения те же события обрабатывает многопоточный режим (один процесс,
+EventDispatcher, словари процесса). Процессы должны масштабироваться почти
+линейно до числа ядер: если при N ≤ ядер ускорение меньше N × --efficiency —
+код выхода 1.
+
+БД не нужна. Запуск:
+    python -m database.benchmark_processes
+    python -m database.benchmark_processes --processes 1 2 4 8 --events 50000
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Achievement, Player
+from database.state_store import MemoryStateStore
+from services.event_dispatcher import EventDispatcher
+from services.process_supervisor import ProcessSupervisor, attach_shared_storage, serve_inbox
+from utils.events import MessageEvent
+import app
+import config
+import states
+
+FIRST_VK_ID = 100000001
+
+# Сообщения игрока по кругу: чтение профиля, запись и удаление состояния FSM
+MESSAGES = ["💰 Баланс", "➡️ Перевести", "❌ Отменить"]
+
+
+class _StubVk:
+    """Клиент VK без сети: сообщения только считаются, профили отдаются сразу"""
+    
+    def __init__(self):
+        self.messages = self
+        self.users = self
+        self.sent = 0
+    
+    def send(self, **params):
+        self.sent += 1
+        return 0
+    
+    def get(self, user_ids, **params):
+        return [
+            {'id': int(vk_id), 'first_name': 'Игрок', 'last_name': vk_id}
+            for vk_id in user_ids.split(',')
+        ]
+
+
+class _Handler:
+    """Обработчик событий воркера: app.handle_message со своей SQLite и заглушкой VK"""
+    
+    def __init__(self, players, directory, results=None):
+        self.players = players
+        self.directory = directory
+        self.results = results
+        self.vk = _StubVk()
+        self.make_session = None
+        self.handled = 0
+        self._lock = threading.Lock()
+    
+    def open(self):
+        """Своя копия таблиц процесса: игроки (без достижений)"""
+        engine = create_engine(
+            f'sqlite:///{os.path.join(self.directory, f"worker-{os.getpid()}.db")}',
+            connect_args={'check_same_thread': False}
+        )
+        Player.__table__.create(engine)
+        Achievement.__table__.create(engine)
+        
+        with engine.begin() as conn:
+            conn.execute(insert(Player), [
+                {'id': i, 'vk_id': FIRST_VK_ID + i - 1, 'first_name': 'Игрок', 'last_name': str(i), 'balance': 1000}
+                for i in range(1, self.players + 1)
+            ])
+        
+        self.make_session = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+    
+    def __call__(self, event):
+        """Как process_event: своя сессия на событие"""
+        session = self.make_session()
+        try:
+            app.handle_message(self.vk, event, session)
+        finally:
+            session.close()
+        
+        with self._lock:
+            self.handled += 1
+
+
+def _worker_main(index, inboxes, handler, shared_storage):
+    """Воркер как в process_supervisor, но вместо служб VK и БД — _Handler"""
+    attach_shared_storage(index, inboxes, shared_storage)
+    handler.open()
+    handler.results.put('ready')
+    
+    serve_inbox(inboxes[index], handler)
+    handler.results.put(handler.handled)
+
+
+def _events(count, players):
+    for n in range(count):
+        player = n % players
+        yield MessageEvent(FIRST_VK_ID + player, MESSAGES[(n // players) % len(MESSAGES)])
+
+
+def _run_processes(workers, events, players, directory):
+    """Прогон через ProcessSupervisor: (обработано событий, секунд)"""
+    handler = _Handler(players, directory, multiprocessing.Queue())
+    supervisor = ProcessSupervisor(handler, processes=workers, worker_main=_worker_main)
+    supervisor.start()
+    
+    # Заполнение таблиц в замер не входит
+    for _ in range(workers):
+        handler.results.get()
+    
+    started = time.perf_counter()
+    for event in _events(events, players):
+        supervisor.submit(event)
+    supervisor.stop()
+    elapsed = time.perf_counter() - started
+    
+    return sum(handler.results.get() for _ in range(workers)), elapsed
+
+
+def _run_threads(events, players, directory):
+    """Многопоточный режим: один процесс, пул потоков диспетчера, словари процесса"""
+    handler = _Handler(players, directory)
+    handler.open()
+    states.use_store(MemoryStateStore())
+    
+    dispatcher = EventDispatcher(handler)
+    dispatcher.start()
+    
+    started = time.perf_counter()
+    for event in _events(events, players):
+        dispatcher.submit(event)
+    dispatcher.stop()
+    elapsed = time.perf_counter() - started
+    
+    return handler.handled, elapsed
+
+
+def _default_counts():
+    """1, 2, 4, ... до числа ядер и само число ядер"""
+    cores = os.cpu_count() or 1
+    counts = {cores}
+    count = 1
+    while count < cores:
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Событий в секунду от числа процессов-воркеров")
+    parser.add_argument('--processes', type=int, nargs='+', default=_default_counts(), help="числа воркеров")
+    parser.add_argument('--events', type=int, default=20_000, help="событий на прогон")
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--efficiency', type=float, default=0.7, help="минимальная доля линейного ускорения")
+    args = parser.parse_args()
+    
+    # Общие словари процессов — хранилище memory многопроцессного режима
+    config.FSM_STATE_STORE = 'memory'
+    
+    cores = os.cpu_count() or 1
+    print(f"🖥 Ядер: {cores}, событий на прогон: {args.events:,}, потоков в процессе: {config.WORKER_POOL_SIZE}")
+    
+    directory = tempfile.mkdtemp(prefix='bench_processes_')
+    try:
+        handled, elapsed = _run_threads(args.events, args.players, directory)
+        thread_rate = handled / elapsed
+        print(f"⏱ Потоки одного процесса: {thread_rate:,.0f} событий/сек.")
+        
+        results = []
+        for workers in args.processes:
+            handled, elapsed = _run_processes(workers, args.events, args.players, directory)
+            if handled != args.events:
+                print(f"❌ {workers} процессов: обработано {handled:,} из {args.events:,}")
+                return 1
+            results.append((workers, handled / elapsed))
+            print(f"⏱ {workers} процессов: {handled / elapsed:,.0f} событий/сек.")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    
+    base_rate = results[0][1] / results[0][0]
+    scaled = True
+    print("\n" + "=" * 64)
+    print(f"{'процессов':>10}{'событий/сек':>14}{'ускорение':>11}{'от линейного':>14}{'к потокам':>12}")
+    for workers, rate in results:
+        speedup = rate / base_rate
+        efficiency = speedup / workers
+        if workers <= cores and efficiency < args.efficiency:
+            scaled = False
+        print(f"{workers:>10}{rate:>14,.0f}{speedup:>10.2f}x{efficiency:>14.0%}{rate / thread_rate:>11.2f}x")
+    
+    print(f"\n{'✅ Процессы масштабируются почти линейно до числа ядер' if scaled else '❌ Масштабирование ниже порога'}")
+    return 0 if scaled else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,172 @@
+"""
+Бенчмарк чтения: ORM-объекты против Core-строк (database/read_queries.py)
+
+В отдельной схеме bench_reads создаются игроки и история одного игрока, затем
+для каждого размера выборки (по умолчанию 1 000, 100 000 и 1 000 000 строк)
+одни и те же данные читаются прежним ORM-путём (объекты моделей, identity map)
+и Core-запросами из read_queries. Печатается число строк в секунду.
+
+Только PostgreSQL. Запуск:
+    python -m database.benchmark_reads
+    python -m database.benchmark_reads --sizes 1000 100000 --repeat 5
+"""
+import argparse
+import time
+
+from sqlalchemy import func, select, text, union_all
+from sqlalchemy.orm import aliased, sessionmaker
+
+from database.bench_schema import add_keep_argument, postgres_required, scratch_schema
+from database.models import Player, Transaction
+from database.read_queries import get_history_page, get_top_players, search_players
+
+BENCH_SCHEMA = 'bench_reads'
+TABLES = ['players', 'transactions']
+
+# Игрок, которому принадлежит вся история
+HISTORY_PLAYER_ID = 1
+
+# Подстрока, которая есть в имени каждого игрока схемы
+SEARCH_QUERY = 'игрок'
+
+
+def _seed(conn, rows):
+    """rows игроков и rows транзакций игрока 1"""
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.players
+            (id, vk_id, first_name, last_name, balance, experience, level, messages_count,
+             notifications_enabled, hide_balance, is_banned, created_at, updated_at)
+        SELECT g, 100000000 + g, 'Игрок', g::text, (random() * 100000)::int, 0, 1, 0,
+               true, false, false, now(), now()
+        FROM generate_series(1, :rows) g
+    """), {'rows': rows})
+    
+    # Половина — исходящие игрока 1, половина — входящие
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.transactions
+            (id, from_player_id, to_player_id, amount, type, reason, is_anonymous, created_at)
+        SELECT g,
+               CASE WHEN g % 2 = 0 THEN :player_id ELSE 2 END,
+               CASE WHEN g % 2 = 0 THEN 2 ELSE :player_id END,
+               1 + (random() * 1000)::int,
+               'TRANSFER'::transactiontype,
+               NULL, false,
+               now() - g * interval '1 second'
+        FROM generate_series(1, :rows) g
+    """), {'rows': rows, 'player_id': HISTORY_PLAYER_ID})
+    
+    for table in TABLES:
+        conn.execute(text(f"ANALYZE {BENCH_SCHEMA}.{table}"))
+
+
+def _orm_history(session, limit):
+    """Прежний ORM-путь истории: тот же UNION ALL, строки — объекты Transaction"""
+    def branch(side_column):
+        return (
+            select(Transaction)
+            .where(side_column == HISTORY_PLAYER_ID)
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+            .limit(limit + 1)
+        )
+    
+    page = union_all(branch(Transaction.from_player_id), branch(Transaction.to_player_id)).subquery('page')
+    row = aliased(Transaction, page)
+    stmt = select(row).order_by(page.c.created_at.desc(), page.c.id.desc()).limit(limit + 1)
+    return session.execute(stmt).scalars().all()[:limit]
+
+
+def _orm_top_players(session, limit):
+    """Прежний ORM-путь топа игроков"""
+    return (
+        session.query(Player)
+        .filter(Player.is_banned == False)
+        .order_by(Player.balance.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def _orm_search(session, limit):
+    """Прежний ORM-путь поиска игроков"""
+    return session.query(Player).filter(
+        func.lower(Player.first_name + ' ' + Player.last_name).like(f'%{SEARCH_QUERY}%')
+    ).limit(limit).all()
+
+
+# Название -> (ORM-путь, Core-путь); функции (session, limit) -> список строк
+READS = {
+    'история': (
+        _orm_history,
+        lambda session, limit: get_history_page(session, HISTORY_PLAYER_ID, limit=limit)[0]
+    ),
+    'топ игроков': (
+        _orm_top_players,
+        lambda session, limit: get_top_players(session, limit=limit, include_hidden=True)
+    ),
+    'поиск': (
+        _orm_search,
+        lambda session, limit: search_players(session, SEARCH_QUERY, limit=limit)
+    ),
+}
+
+
+def _rows_per_second(make_session, read, limit, repeat):
+    """Лучший из repeat прогонов; каждая попытка — новая сессия с пустой identity map"""
+    best = None
+    rows = 0
+    
+    for _ in range(repeat):
+        session = make_session()
+        try:
+            started = time.perf_counter()
+            rows = len(read(session, limit))
+            elapsed = time.perf_counter() - started
+        finally:
+            session.rollback()
+            session.close()
+        best = elapsed if best is None else min(best, elapsed)
+    
+    return rows, rows / best if best else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Чтение: ORM-объекты против Core-строк")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000], help="строк в выборке")
+    parser.add_argument('--repeat', type=int, default=3, help="прогонов на замер (берётся лучший)")
+    add_keep_argument(parser, BENCH_SCHEMA)
+    args = parser.parse_args()
+    
+    if not postgres_required():
+        return 1
+    
+    results = []
+    with scratch_schema(BENCH_SCHEMA, TABLES, keep=args.keep, pool_size=1) as bench_engine:
+        make_session = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=bench_engine)
+        
+        rows = max(args.sizes)
+        print(f"📦 Заполнение схемы {BENCH_SCHEMA}: {rows:,} игроков и транзакций...")
+        started = time.monotonic()
+        with bench_engine.begin() as conn:
+            _seed(conn, rows)
+        print(f"✅ Данные готовы ({time.monotonic() - started:.1f} сек.)")
+        
+        for name, (orm_read, core_read) in READS.items():
+            for size in args.sizes:
+                orm_rows, orm_rate = _rows_per_second(make_session, orm_read, size, args.repeat)
+                core_rows, core_rate = _rows_per_second(make_session, core_read, size, args.repeat)
+                if orm_rows != core_rows:
+                    print(f"⚠️ {name}, {size:,}: ORM вернул {orm_rows:,} строк, Core — {core_rows:,}")
+                results.append((name, size, orm_rate, core_rate))
+                print(f"📊 {name}, {size:,} строк: ORM {orm_rate:,.0f} строк/сек., Core {core_rate:,.0f} строк/сек.")
+    
+    print("\n" + "=" * 72)
+    print(f"{'Чтение':<16}{'строк':>12}{'ORM, строк/сек':>16}{'Core, строк/сек':>17}{'ускорение':>11}")
+    for name, size, orm_rate, core_rate in results:
+        speedup = core_rate / orm_rate if orm_rate else 0
+        print(f"{name:<16}{size:>12,}{orm_rate:>16,.0f}{core_rate:>17,.0f}{speedup:>10.1f}x")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,147 @@
+"""
+Бенчмарк планировщика платежей на виртуальных часах: опрос раз в минуту
+против будильника (services/payment_timer.py)
+
+Невыполненные платежи (по умолчанию 100 000) распределены по сроку случайно,
+с точностью до минуты, как их вводит администратор (--seconds — до секунды). Время не ждётся, а
+переводится: опрос запрашивает БД каждые 60 секунд, будильник — к ближайшему
+сроку и при сверке. БД заменена списком сроков, запросы считаются. Печатаются
+задержка выполнения (срок → запрос, который его выполнил), число запросов
+и пустых запросов (у будильника это сверки).
+
+БД не нужна. Запуск:
+    python -m database.benchmark_scheduler
+    python -m database.benchmark_scheduler --payments 100000 --days 365
+    python -m database.benchmark_scheduler --seconds
+"""
+import argparse
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import random
+import time
+
+from services.payment_timer import PaymentTimer
+
+POLL_INTERVAL = timedelta(minutes=1)
+
+
+class _VirtualDb:
+    """Сроки невыполненных платежей по возрастанию; выполненные — префикс списка"""
+    
+    def __init__(self, times):
+        self.times = sorted(times)
+        self.executed = 0
+        self.queries = 0
+        self.idle_queries = 0
+        self.latencies = []
+    
+    def done(self):
+        return self.executed == len(self.times)
+    
+    def execute_due(self, now):
+        """Запрос наступивших платежей (claim_due_payments) и их выполнение"""
+        self.queries += 1
+        due = bisect_right(self.times, now, lo=self.executed)
+        if due == self.executed:
+            self.idle_queries += 1
+        self.latencies.extend((now - t).total_seconds() for t in self.times[self.executed:due])
+        self.executed = due
+    
+    def next_pending(self):
+        """Запрос срока самого раннего невыполненного платежа (get_next_payment_time)"""
+        self.queries += 1
+        self.idle_queries += 1
+        return None if self.done() else self.times[self.executed]
+
+
+class _VirtualPaymentTimer(PaymentTimer):
+    """Будильник, у которого БД — _VirtualDb, а часы переводит бенчмарк"""
+    
+    def __init__(self, db, clock, resync_minutes):
+        super().__init__(clock=clock, resync_minutes=resync_minutes)
+        self.db = db
+        self._on_due = lambda: db.execute_due(clock())
+    
+    def _load_pending(self):
+        self.db.queries += 1
+        return self.db.times[self.db.executed:]
+    
+    def _load_next(self):
+        return self.db.next_pending()
+
+
+def _payment_times(count, start, days, step, seed):
+    rnd = random.Random(seed)
+    steps = int(timedelta(days=days) / step)
+    return [start + step * rnd.randint(1, steps) for _ in range(count)]
+
+
+def _run_polling(times, start):
+    """Прежний планировщик: запрос каждую минуту"""
+    db = _VirtualDb(times)
+    now = start
+    while not db.done():
+        now += POLL_INTERVAL
+        db.execute_due(now)
+    return db
+
+
+def _run_timer(times, start, resync_minutes):
+    """Будильник: просыпается к ближайшему сроку или сверке"""
+    db = _VirtualDb(times)
+    clock = [start]
+    timer = _VirtualPaymentTimer(db, lambda: clock[0], resync_minutes)
+    timer.seed(start)
+    
+    while not db.done():
+        clock[0] = timer.next_wake()
+        timer.tick(clock[0])
+    return db
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Опрос раз в минуту против будильника платежей")
+    parser.add_argument('--payments', type=int, default=100_000, help="невыполненных платежей")
+    parser.add_argument('--days', type=int, default=30, help="на сколько дней вперёд распределены сроки")
+    parser.add_argument('--resync', type=int, default=10, help="период сверки будильника с БД, минут")
+    parser.add_argument('--seconds', action='store_true', help="сроки с точностью до секунды, а не минуты")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    
+    # Опрос начинается в случайный момент внутри минуты
+    start = datetime(2026, 1, 1) + timedelta(seconds=random.Random(args.seed).uniform(0, 60))
+    step = timedelta(seconds=1) if args.seconds else timedelta(minutes=1)
+    times = _payment_times(args.payments, start.replace(second=0, microsecond=0), args.days, step, args.seed)
+    print(f"📦 {args.payments:,} платежей на {args.days} дн.")
+    
+    results = []
+    for name, run in (
+        ('опрос 1/мин', lambda: _run_polling(times, start)),
+        ('будильник', lambda: _run_timer(times, start, args.resync)),
+    ):
+        started = time.perf_counter()
+        db = run()
+        elapsed = time.perf_counter() - started
+        results.append((name, db, elapsed))
+    
+    print("\n" + "=" * 84)
+    print(f"{'':<14}{'запросов':>10}{'пустых':>10}{'сред., с':>10}{'p99, с':>10}{'макс., с':>10}{'CPU, с':>10}")
+    for name, db, elapsed in results:
+        average = sum(db.latencies) / len(db.latencies) if db.latencies else 0
+        print(
+            f"{name:<14}{db.queries:>10,}{db.idle_queries:>10,}{average:>10.1f}"
+            f"{_percentile(db.latencies, 0.99):>10.1f}{max(db.latencies, default=0):>10.1f}{elapsed:>10.2f}"
+        )
+    
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+"""
+Бенчмарк хранилища состояний FSM: get_state из кэша процесса против чтения из БД
+
+В отдельной схеме bench_states создаётся копия таблицы fsm_states. Часть
+пользователей получает состояние (в том числе с datetime, как scheduled_dt),
+затем хранилище подключается заново — как после перезапуска — и проверяется,
+что записи восстановились без потерь (записи идут и напрямую, и через
+WriteBehindStateStore asyncio-режима). После этого get_state вызывается для
+всех пользователей (активных и без состояния) с прогретым кэшем и без
+него; считаются SQL-запросы на вызов. С прогретым кэшем их должно быть 0,
+иначе код выхода 1.
+
+Только PostgreSQL. Запуск:
+    python -m database.benchmark_states
+    python -m database.benchmark_states --users 100000 --active 0.05
+"""
+import argparse
+from datetime import datetime, timedelta
+import time
+
+from database.bench_schema import add_keep_argument, postgres_required, scratch_schema, StatementCounter
+from database.state_store import DatabaseStateStore, WriteBehindStateStore
+import states
+
+BENCH_SCHEMA = 'bench_states'
+
+FIRST_VK_ID = 100000001
+
+
+def _measure(counter, vk_ids, repeat):
+    """get_state для всех пользователей repeat раз: (вызовов, запросов, вызовов/сек)"""
+    before = counter.count
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for vk_id in vk_ids:
+            states.get_state(vk_id)
+    elapsed = time.perf_counter() - started
+    calls = len(vk_ids) * repeat
+    return calls, counter.count - before, calls / elapsed if elapsed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="get_state: кэш процесса против БД")
+    parser.add_argument('--users', type=int, default=10_000, help="пользователей, для которых вызывается get_state")
+    parser.add_argument('--active', type=float, default=0.1, help="доля пользователей с незавершённым диалогом")
+    parser.add_argument('--repeat', type=int, default=10, help="проходов по пользователям с прогретым кэшем")
+    add_keep_argument(parser, BENCH_SCHEMA)
+    args = parser.parse_args()
+    
+    if not postgres_required():
+        return 1
+    
+    vk_ids = list(range(FIRST_VK_ID, FIRST_VK_ID + args.users))
+    active = vk_ids[:int(args.users * args.active)]
+    scheduled_dt = (datetime.now() + timedelta(days=1)).replace(microsecond=0)
+    
+    results = []
+    ok = True
+    with scratch_schema(BENCH_SCHEMA, ['fsm_states'], keep=args.keep) as bench_engine:
+        store = DatabaseStateStore(bench_engine)
+        counter = StatementCounter(bench_engine)
+        states.use_store(store)
+        
+        before = counter.count
+        started = time.perf_counter()
+        for vk_id in active:
+            states.set_state(
+                vk_id,
+                states.State.WAITING_SCHEDULE_REASON,
+                player_vk_id=vk_id,
+                amount=100,
+                scheduled_dt=scheduled_dt
+            )
+        elapsed = time.perf_counter() - started
+        print(f"📝 set_state: {len(active):,} записей, {counter.count - before:,} запросов, {elapsed:.2f} сек.")
+        
+        # asyncio-режим: set_state только ставит запись в очередь фонового потока
+        writer = WriteBehindStateStore(store)
+        writer.start()
+        states.use_store(writer)
+        started = time.perf_counter()
+        for vk_id in active:
+            states.set_state(
+                vk_id,
+                states.State.WAITING_SCHEDULE_REASON,
+                player_vk_id=vk_id,
+                amount=200,
+                scheduled_dt=scheduled_dt
+            )
+        queued = time.perf_counter() - started
+        writer.stop()
+        print(f"📝 set_state с отложенной записью: {queued:.2f} сек. в вызывающем потоке, "
+              f"{time.perf_counter() - started:.2f} сек. до записи в таблицу")
+        
+        # «Перезапуск»: новый кэш загружается из таблицы
+        before = counter.count
+        states.use_store(store)
+        print(f"🔄 Загрузка кэша: {counter.count - before} запросов")
+        
+        restored = [states.get_state(vk_id) for vk_id in active]
+        round_trip = all(
+            state == states.State.WAITING_SCHEDULE_REASON
+            and data.get('scheduled_dt') == scheduled_dt
+            # Значение из прохода с отложенной записью: очередь дописана в таблицу
+            and data.get('amount') == 200
+            for state, data in restored
+        )
+        ok = ok and round_trip
+        print(f"{'✅' if round_trip else '❌'} Состояния и datetime восстановлены после перезапуска")
+        
+        calls, statements, rate = _measure(counter, vk_ids, args.repeat)
+        results.append(('кэш прогрет', calls, statements, rate))
+        ok = ok and statements == 0
+        
+        # Без загрузки кэша каждый первый get_state ключа — запрос к таблице
+        states.use_store(store, warm=False)
+        calls, statements, rate = _measure(counter, vk_ids, 1)
+        results.append(('кэш пуст', calls, statements, rate))
+    
+    print("\n" + "=" * 64)
+    print(f"{'get_state':<14}{'вызовов':>12}{'запросов':>12}{'на вызов':>10}{'вызовов/сек':>16}")
+    for name, calls, statements, rate in results:
+        print(f"{name:<14}{calls:>12,}{statements:>12,}{statements / calls:>10.2f}{rate:>16,.0f}")
+    
+    print(f"\n{'✅ get_state с прогретым кэшем не обращается к БД' if ok else '❌ Проверка не пройдена'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,209 @@
+"""
+Нагрузочный тест переводов (transfer_balance)
+
+В отдельной схеме bench_transfers создаются копии таблиц игроков, транзакций
+и счётчиков. Несколько потоков одновременно делают случайные переводы между
+игроками (в том числе встречные), после каждого прогона проверяется, что сумма
+балансов не изменилась, отрицательных балансов нет, а число записей в истории
+совпадает с числом успешных переводов. Печатается пропускная способность
+для каждого числа потоков.
+
+Только PostgreSQL. Запуск:
+    python -m database.benchmark_transfers
+    python -m database.benchmark_transfers --workers 1 2 4 8 16 --seconds 20
+    python -m database.benchmark_transfers --players 10 --workers 8   высокая конкуренция
+"""
+import argparse
+import random
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+
+from database.bench_schema import add_keep_argument, postgres_required, scratch_schema
+from database.connection import unit_of_work
+from database.queries import transfer_balance
+from services.transaction_service import DeclinedOperation
+
+BENCH_SCHEMA = 'bench_transfers'
+TABLES = ['players', 'transactions', 'player_stats', 'global_stats']
+
+# Код ошибки PostgreSQL при взаимоблокировке
+DEADLOCK_DETECTED = '40P01'
+
+
+def _seed(conn, players, balance):
+    """Игроки с одинаковым балансом"""
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.players
+            (id, vk_id, first_name, last_name, balance, experience, level, messages_count,
+             notifications_enabled, hide_balance, is_banned, created_at, updated_at)
+        SELECT g, 100000000 + g, 'Игрок', g::text, :balance, 0, 1, 0,
+               true, false, false, now(), now()
+        FROM generate_series(1, :players) g
+    """), {'players': players, 'balance': balance})
+    
+    conn.execute(text(f"""
+        INSERT INTO {BENCH_SCHEMA}.global_stats (id, total_players, total_emission, total_transactions, updated_at)
+        VALUES (1, :players, :emission, 0, now())
+    """), {'players': players, 'emission': players * balance})
+    
+    conn.execute(text(f"ANALYZE {BENCH_SCHEMA}.players"))
+
+
+def _snapshot(conn):
+    """Сумма и минимум балансов, число записей в истории"""
+    return conn.execute(text(f"""
+        SELECT (SELECT sum(balance) FROM {BENCH_SCHEMA}.players) AS total_balance,
+               (SELECT min(balance) FROM {BENCH_SCHEMA}.players) AS min_balance,
+               (SELECT count(*) FROM {BENCH_SCHEMA}.transactions) AS transactions,
+               (SELECT sum(total_transactions) FROM {BENCH_SCHEMA}.global_stats) AS counted
+    """)).first()
+
+
+class _Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ok = 0
+        self.insufficient = 0
+        self.deadlocks = 0
+        self.errors = 0
+        self.latencies = []
+
+
+def _worker(make_session, players, max_amount, deadline, counters):
+    """Случайные переводы до истечения времени"""
+    session = make_session()
+    rnd = random.Random()
+    ok = insufficient = deadlocks = errors = 0
+    latencies = []
+    
+    try:
+        while time.monotonic() < deadline:
+            from_id, to_id = rnd.sample(range(1, players + 1), 2)
+            amount = rnd.randint(1, max_amount)
+            
+            started = time.monotonic()
+            try:
+                # Как transfer_chilliki: коммит на перевод, отказ — откат со снятием блокировок
+                with unit_of_work(session):
+                    if transfer_balance(session, from_id, to_id, amount) is None:
+                        raise DeclinedOperation()
+            except DeclinedOperation:
+                insufficient += 1
+            except DBAPIError as e:
+                if getattr(e.orig, 'pgcode', None) == DEADLOCK_DETECTED:
+                    deadlocks += 1
+                else:
+                    errors += 1
+                    print(f"❌ Ошибка перевода: {e}")
+                continue
+            else:
+                ok += 1
+            latencies.append(time.monotonic() - started)
+    finally:
+        session.close()
+    
+    with counters.lock:
+        counters.ok += ok
+        counters.insufficient += insufficient
+        counters.deadlocks += deadlocks
+        counters.errors += errors
+        counters.latencies += latencies
+
+
+def _run(make_session, workers, players, max_amount, seconds):
+    counters = _Counters()
+    deadline = time.monotonic() + seconds
+    threads = [
+        threading.Thread(target=_worker, args=(make_session, players, max_amount, deadline, counters))
+        for _ in range(workers)
+    ]
+    
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    return counters, time.monotonic() - started
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест атомарных переводов")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16], help="числа потоков")
+    parser.add_argument('--players', type=int, default=1000, help="меньше игроков — больше конфликтов")
+    parser.add_argument('--balance', type=int, default=1000, help="начальный баланс игрока")
+    parser.add_argument('--max-amount', type=int, default=300, help="максимальная сумма перевода")
+    parser.add_argument('--seconds', type=float, default=10, help="длительность прогона")
+    add_keep_argument(parser, BENCH_SCHEMA)
+    args = parser.parse_args()
+    
+    if not postgres_required():
+        return 1
+    
+    results = []
+    conserved = True
+    with scratch_schema(
+        BENCH_SCHEMA, TABLES, keep=args.keep, pool_size=max(args.workers) + 1, max_overflow=0
+    ) as bench_engine:
+        make_session = sessionmaker(autocommit=False, autoflush=False, bind=bench_engine)
+        
+        print(f"📦 Схема {BENCH_SCHEMA}: {args.players:,} игроков по {args.balance:,} чил.")
+        with bench_engine.begin() as conn:
+            _seed(conn, args.players, args.balance)
+            expected_total = _snapshot(conn).total_balance
+        
+        for workers in args.workers:
+            with bench_engine.connect() as conn:
+                before = _snapshot(conn)
+            
+            counters, elapsed = _run(make_session, workers, args.players, args.max_amount, args.seconds)
+            
+            with bench_engine.connect() as conn:
+                after = _snapshot(conn)
+            
+            checks = {
+                'сумма балансов': after.total_balance == expected_total,
+                'нет отрицательных балансов': after.min_balance >= 0,
+                'записей в истории = переводов': after.transactions - before.transactions == counters.ok,
+                'global_stats = истории': after.counted == after.transactions,
+            }
+            failed = [name for name, passed in checks.items() if not passed]
+            conserved = conserved and not failed
+            
+            results.append((workers, counters, elapsed, failed))
+            print(
+                f"{'✅' if not failed else '❌'} {workers} потоков: {counters.ok / elapsed:,.0f} переводов/сек."
+                + (f" — нарушено: {', '.join(failed)}" if failed else "")
+            )
+    
+    base_rate = None
+    print("\n" + "=" * 86)
+    print(f"{'потоков':>8}{'переводов/сек':>16}{'ускорение':>12}{'p50, мс':>10}{'p99, мс':>10}"
+          f"{'отказов':>10}{'deadlock':>10}{'ошибок':>10}")
+    for workers, counters, elapsed, _ in results:
+        rate = counters.ok / elapsed
+        base_rate = base_rate or rate
+        print(
+            f"{workers:>8}{rate:>16,.0f}{rate / base_rate if base_rate else 0:>11.2f}x"
+            f"{_percentile(counters.latencies, 0.5) * 1000:>10.2f}"
+            f"{_percentile(counters.latencies, 0.99) * 1000:>10.2f}"
+            f"{counters.insufficient:>10,}{counters.deadlocks:>10,}{counters.errors:>10,}"
+        )
+    
+    print(f"\n{'✅ Баланс сохранён во всех прогонах' if conserved else '❌ Нарушена согласованность'}")
+    return 0 if conserved else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,30 +1,37 @@
 """
 Подключение к Supabase PostgreSQL
 """
+from contextlib import contextmanager
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session
 from database.models import Base
+from database.migrations import run_migrations
 import config
 
 # Создание движка БД
 engine = create_engine(
     config.DATABASE_URL,
-    pool_size=10,
+    pool_size=max(10, config.WORKER_POOL_SIZE + 2),  # Воркеры диспетчера + планировщик
     max_overflow=20,
     pool_pre_ping=True,  # Проверка соединения перед использованием
     echo=False  # Логирование SQL запросов (False в продакшене)
 )
 
 # Создание фабрики сессий
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: после коммита загруженные объекты остаются валидными,
+# иначе каждое обращение к атрибуту после коммита — повторный SELECT.
+# Значения, изменённые SQL-выражением в обход ORM, читаются с populate_existing
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 # Thread-safe сессия
 Session = scoped_session(SessionLocal)
 
 
 def init_db():
-    """Инициализация базы данных (создание таблиц)"""
+    """Инициализация базы данных (создание таблиц и миграции)"""
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
     print("✅ База данных инициализирована!")
 
 
@@ -43,4 +50,32 @@ def close_session(session):
     try:
         session.close()
     except Exception as e:
-        print(f"❌ Ошибка при закрытии сессии: {e}")
\ No newline at end of file
+        print(f"❌ Ошибка при закрытии сессии: {e}")
+
+
+# Глубина вложенности единиц работы в session.info
+UOW_DEPTH_KEY = 'unit_of_work_depth'
+
+
+@contextmanager
+def unit_of_work(session):
+    """
+    Одна бизнес-операция — один коммит
+    Функции database/queries.py только выполняют flush; коммит (или откат при
+    исключении) — при выходе из внешнего блока. Вложенные блоки присоединяются
+    к внешнему, поэтому сервисы можно вызывать и отдельно, и из обработчиков.
+    Уведомления и обновление кэшей — после блока, когда изменения уже закоммичены
+    """
+    depth = session.info.get(UOW_DEPTH_KEY, 0)
+    session.info[UOW_DEPTH_KEY] = depth + 1
+    
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except BaseException:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        session.info[UOW_DEPTH_KEY] = depth
@@ -0,0 +1,209 @@
+"""
+Версионные миграции схемы
+
+create_all создаёт только отсутствующие таблицы и не меняет существующие,
+поэтому индексы и изменения таблиц применяются отсюда. Применённые версии
+хранятся в schema_migrations. Индексы на Postgres строятся CONCURRENTLY —
+без блокировки записи в таблицу.
+
+Запуск:
+    python -m database.migrations          применить новые миграции
+    python -m database.migrations status   список миграций
+"""
+import sys
+import time
+
+from sqlalchemy import text
+
+# Ключ advisory lock: миграции не выполняются одновременно из нескольких процессов
+MIGRATION_LOCK_KEY = 7310041
+
+
+# Индексы горячих запросов: (имя, таблица, колонки, уникальный)
+INDEXES = {
+    'uq_achievements_player_type': ('achievements', 'player_id, achievement_type', True),
+    # История игрока: keyset по (created_at, id) отдельно для исходящих и входящих
+    'ix_transactions_from_player_created': ('transactions', 'from_player_id, created_at, id', False),
+    'ix_transactions_to_player_created': ('transactions', 'to_player_id, created_at, id', False),
+    'ix_transactions_created_at': ('transactions', 'created_at', False),
+    # Последний ожидающий запрос (handle_admin_price_response)
+    'ix_purchase_requests_status_created': ('purchase_requests', 'status, created_at', False),
+    # Платежи к выполнению (claim_due_payments)
+    'ix_scheduled_payments_executed_scheduled': ('scheduled_payments', 'executed, scheduled_for', False),
+}
+
+
+def _sql(statement):
+    """Шаг миграции: один SQL-запрос"""
+    def step(conn):
+        conn.execute(text(statement))
+    return step
+
+
+def _index(name):
+    """Шаг миграции: индекс из INDEXES (CONCURRENTLY на Postgres)"""
+    def step(conn):
+        table, columns, unique = INDEXES[name]
+        concurrently = ''
+        
+        if conn.dialect.name == 'postgresql':
+            concurrently = 'CONCURRENTLY '
+            # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс — пересоздаём
+            invalid = conn.execute(text("""
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name AND NOT i.indisvalid
+            """), {'name': name}).first()
+            if invalid:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        
+        conn.execute(text(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})"
+        ))
+    return step
+
+
+# Сумма исходящих переводов по истории для уже существующих строк player_stats.
+# Таблица блокируется от параллельных обновлений, как в rebuild_player_stats:
+# перевод, записанный во время пересчёта, не теряется
+RECOMPUTE_TRANSFER_TOTAL = """
+    BEGIN;
+    LOCK TABLE player_stats IN SHARE ROW EXCLUSIVE MODE;
+    UPDATE player_stats ps
+    SET transfer_total = t.total
+    FROM (
+        SELECT from_player_id, sum(amount) AS total
+        FROM transactions
+        WHERE type = 'TRANSFER' AND from_player_id IS NOT NULL
+        GROUP BY from_player_id
+    ) t
+    WHERE ps.player_id = t.from_player_id AND ps.transfer_total <> t.total;
+    COMMIT;
+"""
+
+
+# (версия, описание, шаги). Шаги должны быть идемпотентны: миграция,
+# прерванная до записи в schema_migrations, выполняется заново целиком
+MIGRATIONS = [
+    (1, 'Уникальность достижения игрока', [
+        # Дубликаты (остаются самые ранние) мешают уникальному индексу
+        _sql("""
+            DELETE FROM achievements a
+            USING achievements b
+            WHERE a.player_id = b.player_id
+              AND a.achievement_type = b.achievement_type
+              AND a.id > b.id
+        """),
+        _index('uq_achievements_player_type')
+    ]),
+    (2, 'player_stats.transfer_total', [
+        _sql("ALTER TABLE player_stats ADD COLUMN IF NOT EXISTS transfer_total INTEGER NOT NULL DEFAULT 0"),
+        _sql(RECOMPUTE_TRANSFER_TOTAL)
+    ]),
+    (3, 'Индексы истории транзакций', [
+        _index('ix_transactions_from_player_created'),
+        _index('ix_transactions_to_player_created'),
+        _index('ix_transactions_created_at')
+    ]),
+    (4, 'Индекс ожидающих запросов на покупку', [
+        _index('ix_purchase_requests_status_created')
+    ]),
+    (5, 'Индекс запланированных платежей', [
+        _index('ix_scheduled_payments_executed_scheduled')
+    ]),
+    (6, 'Глобальная статистика', [
+        # Таблицу создаёт create_all; строка заполняется точным пересчётом
+        _sql("""
+            INSERT INTO global_stats (id, total_players, total_emission, total_transactions, updated_at, reconciled_at)
+            SELECT 1,
+                   (SELECT count(*) FROM players),
+                   (SELECT coalesce(sum(balance), 0) FROM players),
+                   (SELECT count(*) FROM transactions),
+                   CURRENT_TIMESTAMP,
+                   CURRENT_TIMESTAMP
+            ON CONFLICT (id) DO NOTHING
+        """)
+    ]),
+    (7, 'Запланированные начисления сегменту', [
+        _sql("ALTER TABLE scheduled_payments ALTER COLUMN player_id DROP NOT NULL"),
+        _sql("ALTER TABLE scheduled_payments ADD COLUMN IF NOT EXISTS segment VARCHAR(20)"),
+        _sql("ALTER TABLE scheduled_payments ADD COLUMN IF NOT EXISTS min_level INTEGER"),
+        _sql("ALTER TABLE scheduled_payments ADD COLUMN IF NOT EXISTS vk_ids INTEGER[]")
+    ]),
+]
+
+
+def _ensure_migrations_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+
+def get_applied_versions(conn):
+    """Версии уже применённых миграций"""
+    _ensure_migrations_table(conn)
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine):
+    """
+    Применить все новые миграции
+    Возвращает список применённых версий
+    """
+    applied = []
+    
+    # AUTOCOMMIT: CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        is_postgres = conn.dialect.name == 'postgresql'
+        if is_postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        
+        try:
+            done = get_applied_versions(conn)
+            
+            for version, name, steps in MIGRATIONS:
+                if version in done:
+                    continue
+                
+                started = time.monotonic()
+                print(f"🔧 Миграция {version}: {name}...")
+                
+                for step in steps:
+                    step(conn)
+                
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                    {'version': version, 'name': name}
+                )
+                applied.append(version)
+                print(f"✅ Миграция {version} применена ({time.monotonic() - started:.2f} сек.)")
+        
+        finally:
+            if is_postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATION_LOCK_KEY})
+    
+    return applied
+
+
+def main(argv):
+    from database.connection import engine, init_db
+    
+    if argv and argv[0] == 'status':
+        with engine.begin() as conn:
+            done = get_applied_versions(conn)
+        
+        for version, name, _ in MIGRATIONS:
+            mark = '✅' if version in done else '⏳'
+            print(f"{mark} {version}: {name}")
+        return 0
+    
+    # init_db создаёт таблицы и применяет миграции
+    init_db()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,7 @@
 """
 SQLAlchemy модели для базы данных
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, ForeignKey, Enum, UniqueConstraint, Index, ARRAY
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import enum
@@ -48,6 +48,12 @@ class Player(Base):
 class Transaction(Base):
     """История транзакций"""
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Имена совпадают с database/migrations.py
+        Index('ix_transactions_from_player_created', 'from_player_id', 'created_at', 'id'),
+        Index('ix_transactions_to_player_created', 'to_player_id', 'created_at', 'id'),
+        Index('ix_transactions_created_at', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     
@@ -66,9 +72,47 @@ class Transaction(Base):
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
 
+class PlayerStats(Base):
+    """Агрегированная статистика игрока (обновляется вместе с каждой транзакцией)"""
+    __tablename__ = 'player_stats'
+
+    player_id = Column(Integer, ForeignKey('players.id'), primary_key=True)
+    
+    total_received = Column(Integer, default=0, nullable=False)
+    total_spent = Column(Integer, default=0, nullable=False)
+    transfer_count = Column(Integer, default=0, nullable=False)  # Исходящие переводы
+    transfer_total = Column(Integer, default=0, nullable=False)  # Сумма исходящих переводов
+    purchase_count = Column(Integer, default=0, nullable=False)
+    largest_purchase = Column(Integer, default=0, nullable=False)
+    tx_count = Column(Integer, default=0, nullable=False)  # Все транзакции с участием игрока
+    
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class GlobalStats(Base):
+    """
+    Глобальная статистика экономики: GLOBAL_STATS_SHARDS строк-шардов, значение — их сумма
+    Каждая сессия прибавляет изменения к своему шарду вместе с записью в историю,
+    сверка точным пересчётом записывает итог в строку id = 1 и обнуляет остальные
+    """
+    __tablename__ = 'global_stats'
+
+    id = Column(Integer, primary_key=True)
+    
+    total_players = Column(Integer, default=0, nullable=False)
+    total_emission = Column(BigInteger, default=0, nullable=False)  # Сумма балансов всех игроков
+    total_transactions = Column(BigInteger, default=0, nullable=False)
+    
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    reconciled_at = Column(DateTime, nullable=True)  # Последний точный пересчёт
+
+
 class PurchaseRequest(Base):
     """Запросы на покупку способностей/предметов"""
     __tablename__ = 'purchase_requests'
+    __table_args__ = (
+        Index('ix_purchase_requests_status_created', 'status', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     player_id = Column(Integer, ForeignKey('players.id'), nullable=False)
@@ -92,6 +136,10 @@ class PurchaseRequest(Base):
 class Achievement(Base):
     """Достижения игроков"""
     __tablename__ = 'achievements'
+    __table_args__ = (
+        # Каждое достижение выдаётся игроку один раз (выдача идемпотентна)
+        UniqueConstraint('player_id', 'achievement_type', name='uq_achievements_player_type'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     player_id = Column(Integer, ForeignKey('players.id'), nullable=False)
@@ -105,14 +153,34 @@ class Achievement(Base):
     earned_at = Column(DateTime, server_default=func.now(), nullable=False)
 
 
+class PaymentSegment:
+    """Получатели запланированного начисления (ScheduledPayment.segment)"""
+    PLAYER = None           # Один игрок (player_id)
+    ALL = 'all'             # Все игроки
+    LEVEL = 'level'         # Игроки с уровнем от min_level
+    PLAYERS = 'players'     # Игроки из списка vk_ids
+
+
 class ScheduledPayment(Base):
-    """Запланированные начисления"""
+    """
+    Запланированные начисления
+    Одному игроку или сегменту: сегмент хранится одной строкой
+    и раскрывается в начисления только при выполнении
+    """
     __tablename__ = 'scheduled_payments'
+    __table_args__ = (
+        Index('ix_scheduled_payments_executed_scheduled', 'executed', 'scheduled_for'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    player_id = Column(Integer, ForeignKey('players.id'), nullable=False)
+    player_id = Column(Integer, ForeignKey('players.id'), nullable=True)  # Только для одного игрока
     admin_id = Column(Integer, nullable=False)  # VK ID администратора
     
+    # Сегмент (PaymentSegment); NULL — один игрок
+    segment = Column(String(20), nullable=True)
+    min_level = Column(Integer, nullable=True)
+    vk_ids = Column(ARRAY(Integer), nullable=True)
+    
     amount = Column(Integer, nullable=False)
     reason = Column(Text, nullable=True)
     
@@ -123,6 +191,39 @@ class ScheduledPayment(Base):
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
 
+class Broadcast(Base):
+    """Массовая рассылка (прогресс сохраняется для продолжения после сбоя)"""
+    __tablename__ = 'broadcasts'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    admin_id = Column(Integer, nullable=False)  # VK ID администратора
+    message = Column(Text, nullable=False)
+    
+    # Статус: pending, running, completed, failed
+    status = Column(String(20), default='pending', nullable=False)
+    
+    # Прогресс: id последнего игрока в подтверждённой пачке
+    last_player_id = Column(Integer, default=0, nullable=False)
+    total_recipients = Column(Integer, default=0, nullable=False)
+    sent_count = Column(Integer, default=0, nullable=False)
+    failed_count = Column(Integer, default=0, nullable=False)
+    
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class FsmState(Base):
+    """Состояния диалогов и ожидающие подтверждения (states.py, хранилище database)"""
+    __tablename__ = 'fsm_states'
+
+    kind = Column(String(20), primary_key=True)  # states / confirmations
+    key = Column(String(64), primary_key=True)  # Ключ в JSON: 123 или "abc"
+    payload = Column(Text, nullable=False)  # Сериализованная запись (database/state_store.py)
+    
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
 class ItemTemplate(Base):
     """Шаблоны предметов/способностей (для будущего расширения)"""
     __tablename__ = 'item_templates'
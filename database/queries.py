@@ -1,9 +1,24 @@
 """
 Готовые запросы к базе данных
+Функции не коммитят: изменения только отправляются в БД (flush), коммит —
+один на бизнес-операцию в сервисном слое (database.connection.unit_of_work)
 """
-from sqlalchemy import desc, func
-from database.models import Player, Transaction, PurchaseRequest, Achievement, ScheduledPayment
+from sqlalchemy import func, update, insert, select, values, column, case, literal, null, true, false, exists, union_all, text, Integer, String, Text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database.models import (
+    Player,
+    PlayerStats,
+    GlobalStats,
+    Transaction,
+    TransactionType,
+    PurchaseRequest,
+    Achievement,
+    ScheduledPayment,
+    PaymentSegment,
+    Broadcast
+)
 from datetime import datetime, timedelta
+import random
 import config
 
 
@@ -19,7 +34,8 @@ def get_or_create_player(session, vk_id, first_name, last_name):
             balance=config.STARTING_BALANCE
         )
         session.add(player)
-        session.commit()
+        bump_global_stats(session, players=1, emission=config.STARTING_BALANCE)
+        session.flush()
         print(f"✅ Создан новый игрок: {first_name} {last_name} (VK ID: {vk_id})")
     
     return player
@@ -34,8 +50,8 @@ def update_player_balance(session, player_id, new_balance):
     """Обновить баланс игрока"""
     player = session.query(Player).filter_by(id=player_id).first()
     if player:
+        bump_global_stats(session, emission=new_balance - player.balance)
         player.balance = new_balance
-        session.commit()
         return True
     return False
 
@@ -51,35 +67,428 @@ def create_transaction(session, from_player_id, to_player_id, amount, transactio
         is_anonymous=is_anonymous
     )
     session.add(transaction)
-    session.commit()
+    record_transaction_stats(session, from_player_id, to_player_id, amount, transaction_type)
+    
+    # Начисление (нет отправителя) увеличивает эмиссию, списание (нет получателя) — уменьшает
+    emission = (amount if to_player_id else 0) - (amount if from_player_id else 0)
+    bump_global_stats(session, emission=emission, transactions=1)
+    
+    session.flush()
     return transaction
 
 
-def get_player_transactions(session, player_id, limit=10, transaction_filter=None):
-    """Получить транзакции игрока с фильтром"""
-    query = session.query(Transaction).filter(
-        (Transaction.from_player_id == player_id) | (Transaction.to_player_id == player_id)
+def transfer_balance(session, from_player_id, to_player_id, amount, is_anonymous=False):
+    """
+    Атомарный перевод между игроками
+    Списание с проверкой баланса (UPDATE ... WHERE balance >= amount RETURNING), зачисление,
+    запись в историю и счётчики — одним запросом в одной транзакции БД.
+    Строки обоих игроков предварительно блокируются в порядке id, поэтому встречные
+    переводы не взаимоблокируются
+    Возвращает (баланс отправителя, баланс получателя, id транзакции) или None,
+    если средств недостаточно (ничего не изменено, блокировки снимет коммит/откат вызывающего)
+    LookupError — одного из игроков уже нет (например, удалён админом после подтверждения):
+    без него списание не должно попасть в коммит
+    """
+    locked = session.execute(
+        select(Player.id)
+        .where(Player.id.in_([from_player_id, to_player_id]))
+        .order_by(Player.id)
+        .with_for_update()
+    ).all()
+    if len(locked) < 2:
+        raise LookupError("Игрок не найден")
+    
+    debit = (
+        update(Player)
+        .where(Player.id == from_player_id, Player.balance >= amount)
+        .values(balance=Player.balance - amount)
+        .returning(Player.id, Player.balance)
+        .cte('debit')
+    )
+    credit = (
+        update(Player)
+        .where(Player.id == to_player_id, exists(select(debit.c.id)))
+        .values(balance=Player.balance + amount)
+        .returning(Player.id, Player.balance)
+        .cte('credit')
+    )
+    ledger = (
+        insert(Transaction).from_select(
+            ['from_player_id', 'to_player_id', 'amount', 'type', 'reason', 'is_anonymous'],
+            select(
+                debit.c.id,
+                credit.c.id,
+                literal(amount, Integer),
+                literal(TransactionType.TRANSFER, Transaction.type.type),
+                literal(None, Text),
+                literal(is_anonymous)
+            ).select_from(debit.join(credit, true()))
+        )
+        .returning(Transaction.id)
+        .cte('ledger')
+    )
+    
+    # Счётчики участников и глобальная статистика — только если перевод состоялся
+    stats_columns = [
+        'player_id', 'total_received', 'total_spent', 'transfer_count',
+        'transfer_total', 'purchase_count', 'largest_purchase', 'tx_count'
+    ]
+    value, zero, one = literal(amount, Integer), literal(0, Integer), literal(1, Integer)
+    sender_stats = _accumulate_player_stats(pg_insert(PlayerStats).from_select(
+        stats_columns,
+        select(debit.c.id, zero, value, one, value, zero, zero, one).where(exists(select(ledger.c.id)))
+    )).returning(PlayerStats.player_id).cte('sender_stats')
+    receiver_stats = _accumulate_player_stats(pg_insert(PlayerStats).from_select(
+        stats_columns,
+        select(credit.c.id, value, zero, zero, zero, zero, zero, one).where(exists(select(ledger.c.id)))
+    )).returning(PlayerStats.player_id).cte('receiver_stats')
+    global_stats = _accumulate_global_stats(pg_insert(GlobalStats).from_select(
+        ['id', 'total_players', 'total_emission', 'total_transactions'],
+        select(literal(global_stats_shard(session), Integer), zero, zero, one).where(exists(select(ledger.c.id)))
+    )).returning(GlobalStats.id).cte('global_stats_bump')
+    
+    # CTE со счётчиками упоминаются в запросе, иначе SQLAlchemy их не выведет
+    row = session.execute(
+        select(
+            debit.c.balance.label('sender_balance'),
+            credit.c.balance.label('receiver_balance'),
+            ledger.c.id.label('transaction_id'),
+            select(func.count()).select_from(sender_stats).scalar_subquery(),
+            select(func.count()).select_from(receiver_stats).scalar_subquery(),
+            select(func.count()).select_from(global_stats).scalar_subquery()
+        ).select_from(debit.join(credit, true()).join(ledger, true()))
+    ).first()
+    
+    if row is None:
+        return None
+    return row.sender_balance, row.receiver_balance, row.transaction_id
+
+
+def change_balance(session, player_id, amount, transaction_type, reason=None):
+    """
+    Атомарное начисление или списание одному игроку без отправителя/получателя
+    Относительный UPDATE (balance = balance ± amount, для списания — WHERE balance >= amount),
+    запись в историю и счётчики — одним запросом, как в transfer_balance: параллельный
+    перевод или платёж того же игрока не перезаписывается
+    transaction_type: ADMIN_GIVE / SCHEDULED_GIVE — начисление, ADMIN_TAKE / PURCHASE — списание
+    Возвращает (новый баланс, id транзакции) или None, если средств недостаточно
+    или игрока нет (ничего не изменено)
+    """
+    is_debit = transaction_type in (TransactionType.ADMIN_TAKE, TransactionType.PURCHASE)
+    is_purchase = transaction_type == TransactionType.PURCHASE
+    
+    changed = update(Player).where(Player.id == player_id)
+    if is_debit:
+        changed = changed.where(Player.balance >= amount).values(balance=Player.balance - amount)
+    else:
+        changed = changed.values(balance=Player.balance + amount)
+    changed = changed.returning(Player.id, Player.balance).cte('changed')
+    
+    ledger = (
+        insert(Transaction).from_select(
+            ['from_player_id', 'to_player_id', 'amount', 'type', 'reason', 'is_anonymous'],
+            select(
+                changed.c.id if is_debit else null(),
+                null() if is_debit else changed.c.id,
+                literal(amount, Integer),
+                literal(transaction_type, Transaction.type.type),
+                literal(reason, Text),
+                false()
+            )
+        )
+        .returning(Transaction.id)
+        .cte('ledger')
+    )
+    
+    value, zero, one = literal(amount, Integer), literal(0, Integer), literal(1, Integer)
+    player_stats = _accumulate_player_stats(pg_insert(PlayerStats).from_select(
+        [
+            'player_id', 'total_received', 'total_spent', 'transfer_count',
+            'transfer_total', 'purchase_count', 'largest_purchase', 'tx_count'
+        ],
+        select(
+            changed.c.id,
+            zero if is_debit else value,
+            value if is_debit else zero,
+            zero,
+            zero,
+            one if is_purchase else zero,
+            value if is_purchase else zero,
+            one
+        ).where(exists(select(ledger.c.id)))
+    )).returning(PlayerStats.player_id).cte('player_stats_bump')
+    global_stats = _accumulate_global_stats(pg_insert(GlobalStats).from_select(
+        ['id', 'total_players', 'total_emission', 'total_transactions'],
+        select(
+            literal(global_stats_shard(session), Integer),
+            zero,
+            literal(-amount if is_debit else amount, Integer),
+            one
+        ).where(exists(select(ledger.c.id)))
+    )).returning(GlobalStats.id).cte('global_stats_bump')
+    
+    # CTE со счётчиками упоминаются в запросе, иначе SQLAlchemy их не выведет
+    row = session.execute(
+        select(
+            changed.c.balance,
+            ledger.c.id.label('transaction_id'),
+            select(func.count()).select_from(player_stats).scalar_subquery(),
+            select(func.count()).select_from(global_stats).scalar_subquery()
+        ).select_from(changed.join(ledger, true()))
+    ).first()
+    
+    if row is None:
+        return None
+    return row.balance, row.transaction_id
+
+
+def _upsert_player_stats(session, player_id, total_received=0, total_spent=0,
+                         transfer_count=0, transfer_total=0, purchase_count=0, largest_purchase=0):
+    """Прибавить транзакцию к статистике игрока (создаёт строку при первой транзакции)"""
+    stmt = pg_insert(PlayerStats).values(
+        player_id=player_id,
+        total_received=total_received,
+        total_spent=total_spent,
+        transfer_count=transfer_count,
+        transfer_total=transfer_total,
+        purchase_count=purchase_count,
+        largest_purchase=largest_purchase,
+        tx_count=1
+    )
+    session.execute(_accumulate_player_stats(stmt))
+
+
+def _accumulate_player_stats(stmt):
+    """ON CONFLICT для вставки в player_stats: прибавить значения к существующей строке"""
+    return stmt.on_conflict_do_update(
+        index_elements=[PlayerStats.player_id],
+        set_={
+            'total_received': PlayerStats.total_received + stmt.excluded.total_received,
+            'total_spent': PlayerStats.total_spent + stmt.excluded.total_spent,
+            'transfer_count': PlayerStats.transfer_count + stmt.excluded.transfer_count,
+            'transfer_total': PlayerStats.transfer_total + stmt.excluded.transfer_total,
+            'purchase_count': PlayerStats.purchase_count + stmt.excluded.purchase_count,
+            'largest_purchase': func.greatest(PlayerStats.largest_purchase, stmt.excluded.largest_purchase),
+            'tx_count': PlayerStats.tx_count + stmt.excluded.tx_count,
+            'updated_at': func.now()
+        }
     )
+
+
+def record_transaction_stats(session, from_player_id, to_player_id, amount, transaction_type):
+    """
+    Обновить статистику участников транзакции
+    Вызывается до коммита — в той же транзакции БД, что и запись в историю
+    """
+    is_transfer = transaction_type == TransactionType.TRANSFER
+    is_purchase = transaction_type == TransactionType.PURCHASE
     
-    # Применение фильтра
-    if transaction_filter == 'переводы':
-        query = query.filter(Transaction.type == 'transfer')
-    elif transaction_filter == 'покупки':
-        query = query.filter(Transaction.type == 'purchase')
-    elif transaction_filter == 'админ':
-        query = query.filter(Transaction.type.in_(['admin_give', 'admin_take']))
+    if from_player_id:
+        _upsert_player_stats(
+            session,
+            from_player_id,
+            total_spent=amount,
+            transfer_count=1 if is_transfer else 0,
+            transfer_total=amount if is_transfer else 0,
+            purchase_count=1 if is_purchase else 0,
+            largest_purchase=amount if is_purchase else 0
+        )
     
-    return query.order_by(desc(Transaction.created_at)).limit(limit).all()
+    if to_player_id:
+        _upsert_player_stats(session, to_player_id, total_received=amount)
+
+
+def get_player_stats(session, player_id):
+    """Статистика игрока (None, если транзакций ещё не было)"""
+    # populate_existing: строка обновляется SQL-выражением в обход identity map
+    return session.get(PlayerStats, player_id, populate_existing=True)
 
 
-def get_top_players(session, limit=10, include_hidden=False):
-    """Получить топ игроков по балансу"""
-    query = session.query(Player).filter(Player.is_banned == False)
+def rebuild_player_stats(session):
+    """
+    Пересобрать статистику всех игроков по истории транзакций
+    Одним INSERT ... SELECT с агрегацией; таблица блокируется от параллельных
+    обновлений, чтобы не потерять транзакции, записанные во время пересборки
+    Возвращает количество игроков со статистикой
+    """
+    is_transfer = case((Transaction.type == TransactionType.TRANSFER, 1), else_=0)
+    transfer_amount = case((Transaction.type == TransactionType.TRANSFER, Transaction.amount), else_=0)
+    is_purchase = case((Transaction.type == TransactionType.PURCHASE, 1), else_=0)
+    purchase_amount = case((Transaction.type == TransactionType.PURCHASE, Transaction.amount), else_=0)
+    
+    sides = union_all(
+        select(
+            Transaction.from_player_id.label('player_id'),
+            literal(0, Integer).label('received'),
+            Transaction.amount.label('spent'),
+            is_transfer.label('transfers'),
+            transfer_amount.label('transfer_amount'),
+            is_purchase.label('purchases'),
+            purchase_amount.label('purchase_amount')
+        ).where(Transaction.from_player_id.isnot(None)),
+        select(
+            Transaction.to_player_id.label('player_id'),
+            Transaction.amount.label('received'),
+            literal(0, Integer).label('spent'),
+            literal(0, Integer).label('transfers'),
+            literal(0, Integer).label('transfer_amount'),
+            literal(0, Integer).label('purchases'),
+            literal(0, Integer).label('purchase_amount')
+        ).where(Transaction.to_player_id.isnot(None))
+    ).subquery('sides')
+    
+    aggregated = select(
+        sides.c.player_id,
+        func.sum(sides.c.received),
+        func.sum(sides.c.spent),
+        func.sum(sides.c.transfers),
+        func.sum(sides.c.transfer_amount),
+        func.sum(sides.c.purchases),
+        func.max(sides.c.purchase_amount),
+        func.count()
+    ).group_by(sides.c.player_id)
     
-    if not include_hidden:
-        query = query.filter(Player.hide_balance == False)
+    stmt = pg_insert(PlayerStats).from_select(
+        ['player_id', 'total_received', 'total_spent', 'transfer_count', 'transfer_total',
+         'purchase_count', 'largest_purchase', 'tx_count'],
+        aggregated
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PlayerStats.player_id],
+        set_={
+            'total_received': stmt.excluded.total_received,
+            'total_spent': stmt.excluded.total_spent,
+            'transfer_count': stmt.excluded.transfer_count,
+            'transfer_total': stmt.excluded.transfer_total,
+            'purchase_count': stmt.excluded.purchase_count,
+            'largest_purchase': stmt.excluded.largest_purchase,
+            'tx_count': stmt.excluded.tx_count,
+            'updated_at': func.now()
+        }
+    )
     
-    return query.order_by(desc(Player.balance)).limit(limit).all()
+    session.execute(text('LOCK TABLE player_stats IN SHARE ROW EXCLUSIVE MODE'))
+    result = session.execute(stmt)
+    return result.rowcount
+
+
+def segment_condition(segment, min_level=None, vk_ids=None):
+    """Условие на игроков сегмента (PaymentSegment); None — все игроки"""
+    if segment == PaymentSegment.ALL:
+        return None
+    if segment == PaymentSegment.LEVEL:
+        return Player.level >= min_level
+    if segment == PaymentSegment.PLAYERS:
+        return Player.vk_id.in_(vk_ids)
+    raise ValueError(f"Неизвестный сегмент: {segment}")
+
+
+def credit_players(session, amount, transaction_type, reason=None, condition=None):
+    """
+    Начислить сумму игрокам set-based одним запросом, без загрузки игроков в память:
+    строки сегмента блокируются в порядке id (SELECT ... ORDER BY id FOR UPDATE),
+    затем UPDATE ... FROM них RETURNING id, а история, статистика получателей и
+    глобальные счётчики строятся из его результата (как в transfer_balance) —
+    условие сегмента вычисляется один раз, и игрок, попавший в сегмент между
+    запросами, не получит запись в истории без начисления
+    condition — условие на Player (segment_condition), None — все игроки
+    Возвращает количество затронутых игроков
+    """
+    # Блокировки в порядке id, как в transfer_balance: начисление сегменту не взаимоблокируется с переводами
+    locked = select(Player.id).order_by(Player.id).with_for_update()
+    if condition is not None:
+        locked = locked.where(condition)
+    locked = locked.cte('locked')
+    
+    credited = (
+        update(Player)
+        .where(Player.id == locked.c.id)
+        .values(balance=Player.balance + amount)
+        .returning(Player.id)
+        .cte('credited')
+    )
+    
+    ledger = (
+        insert(Transaction).from_select(
+            ['from_player_id', 'to_player_id', 'amount', 'type', 'reason', 'is_anonymous'],
+            select(
+                null(),
+                credited.c.id,
+                literal(amount, Integer),
+                literal(transaction_type, Transaction.type.type),
+                literal(reason, Text),
+                false()
+            )
+        )
+        .returning(Transaction.id)
+        .cte('ledger')
+    )
+    
+    stats = pg_insert(PlayerStats).from_select(
+        ['player_id', 'total_received', 'tx_count'],
+        select(credited.c.id, literal(amount, Integer), literal(1, Integer))
+    )
+    player_stats = stats.on_conflict_do_update(
+        index_elements=[PlayerStats.player_id],
+        set_={
+            'total_received': PlayerStats.total_received + stats.excluded.total_received,
+            'tx_count': PlayerStats.tx_count + 1,
+            'updated_at': func.now()
+        }
+    ).returning(PlayerStats.player_id).cte('player_stats_bump')
+    
+    # Шард не блокируется, если начислять некому
+    global_stats = _accumulate_global_stats(pg_insert(GlobalStats).from_select(
+        ['id', 'total_players', 'total_emission', 'total_transactions'],
+        select(
+            literal(global_stats_shard(session), Integer),
+            literal(0, Integer),
+            func.count() * amount,
+            func.count()
+        ).select_from(credited).having(func.count() > 0)
+    )).returning(GlobalStats.id).cte('global_stats_bump')
+    
+    # CTE с историей и счётчиками упоминаются в запросе, иначе SQLAlchemy их не выведет
+    rows = session.execute(
+        select(
+            select(func.count()).select_from(credited).scalar_subquery(),
+            select(func.count()).select_from(ledger).scalar_subquery(),
+            select(func.count()).select_from(player_stats).scalar_subquery(),
+            select(func.count()).select_from(global_stats).scalar_subquery()
+        )
+    ).scalar()
+    
+    # Балансы уже загруженных в сессию игроков перечитываются при следующем обращении
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Player):
+            session.expire(obj, ['balance'])
+    
+    return rows
+
+
+def iter_notification_recipients(session, batch_size=1000, condition=None):
+    """
+    Постраничный обход VK ID игроков с включёнными уведомлениями (keyset по id)
+    condition — дополнительное условие на Player (segment_condition)
+    Возвращает генератор списков vk_id
+    """
+    last_id = 0
+    while True:
+        query = (
+            select(Player.id, Player.vk_id)
+            .where(Player.id > last_id, Player.notifications_enabled == True, Player.is_banned == False)
+            .order_by(Player.id)
+            .limit(batch_size)
+        )
+        if condition is not None:
+            query = query.where(condition)
+        rows = session.execute(query).all()
+        
+        if not rows:
+            return
+        
+        last_id = rows[-1].id
+        yield [row.vk_id for row in rows]
 
 
 def create_purchase_request(session, player_id, item_description):
@@ -90,7 +499,7 @@ def create_purchase_request(session, player_id, item_description):
         status='pending'
     )
     session.add(request)
-    session.commit()
+    session.flush()
     return request
 
 
@@ -99,65 +508,247 @@ def get_pending_purchase_requests(session):
     return session.query(PurchaseRequest).filter_by(status='pending').all()
 
 
-def add_achievement(session, player_id, achievement_type, title, description, icon):
-    """Добавить достижение игроку"""
-    # Проверка, есть ли уже такое достижение
-    existing = session.query(Achievement).filter_by(
-        player_id=player_id,
-        achievement_type=achievement_type
-    ).first()
+def get_player_achievements(session, player_id):
+    """Получить все достижения игрока"""
+    return session.query(Achievement).filter_by(player_id=player_id).all()
+
+
+def get_player_achievement_types(session, player_id):
+    """Типы уже полученных игроком достижений"""
+    rows = session.execute(
+        select(Achievement.achievement_type).where(Achievement.player_id == player_id)
+    ).scalars()
+    return set(rows)
+
+
+def award_achievements(session, player_id, entries):
+    """
+    Выдать игроку несколько достижений одним запросом
+    entries: [(achievement_type, title, description, icon)]
+    Уже имеющиеся пропускаются; возвращает только действительно выданные
+    """
+    stmt = pg_insert(Achievement).values([
+        {
+            'player_id': player_id,
+            'achievement_type': achievement_type,
+            'title': title,
+            'description': description,
+            'icon': icon
+        }
+        for achievement_type, title, description, icon in entries
+    ])
+    stmt = stmt.on_conflict_do_nothing(
+        index_elements=[Achievement.player_id, Achievement.achievement_type]
+    ).returning(Achievement.achievement_type)
     
-    if existing:
-        return None  # Достижение уже есть
+    inserted = set(session.execute(stmt).scalars())
     
-    achievement = Achievement(
-        player_id=player_id,
-        achievement_type=achievement_type,
-        title=title,
-        description=description,
-        icon=icon
+    return [
+        Achievement(
+            player_id=player_id,
+            achievement_type=achievement_type,
+            title=title,
+            description=description,
+            icon=icon
+        )
+        for achievement_type, title, description, icon in entries
+        if achievement_type in inserted
+    ]
+
+
+def award_achievement_to_all(session, achievement_type, title, description, icon, metric, threshold):
+    """
+    Выдать достижение всем игрокам, у которых metric >= threshold
+    Один INSERT ... SELECT по players + player_stats, уже имеющиеся пропускаются
+    metric: balance или счётчик player_stats
+    Возвращает [(player_id, vk_id, notifications_enabled)] получивших
+    """
+    if metric == 'balance':
+        metric_value = Player.balance
+    else:
+        metric_value = func.coalesce(getattr(PlayerStats, metric), 0)
+    
+    eligible = select(
+        Player.id,
+        literal(achievement_type, String),
+        literal(title, String),
+        literal(description, Text),
+        literal(icon, String)
+    ).select_from(
+        Player.__table__.outerjoin(PlayerStats.__table__, PlayerStats.player_id == Player.id)
+    ).where(metric_value >= threshold)
+    
+    awarded = pg_insert(Achievement).from_select(
+        ['player_id', 'achievement_type', 'title', 'description', 'icon'],
+        eligible
+    ).on_conflict_do_nothing(
+        index_elements=[Achievement.player_id, Achievement.achievement_type]
+    ).returning(Achievement.player_id).cte('awarded')
+    
+    rows = session.execute(
+        select(Player.id, Player.vk_id, Player.notifications_enabled)
+        .join(awarded, awarded.c.player_id == Player.id)
+    ).all()
+    return rows
+
+
+def calculate_level(experience):
+    """Уровень по опыту (простая формула: 100 XP на уровень)"""
+    return (experience // 100) + 1
+
+
+def apply_message_increments(session, increments):
+    """
+    Применить накопленные счётчики сообщений и опыта одним UPDATE
+    increments: {player_id: (messages, experience)}
+    """
+    if not increments:
+        return 0
+    
+    rows = [(player_id, messages, xp) for player_id, (messages, xp) in increments.items()]
+    deltas = values(
+        column('player_id', Integer),
+        column('messages', Integer),
+        column('xp', Integer),
+        name='deltas'
+    ).data(rows)
+    
+    new_experience = Player.experience + deltas.c.xp
+    new_level = new_experience / 100 + 1
+    
+    result = session.execute(
+        update(Player)
+        .where(Player.id == deltas.c.player_id)
+        .values(
+            messages_count=Player.messages_count + deltas.c.messages,
+            experience=new_experience,
+            level=case((new_level > Player.level, new_level), else_=Player.level)
+        )
+        .execution_options(synchronize_session=False)
     )
-    session.add(achievement)
-    session.commit()
-    return achievement
+    return result.rowcount
 
 
-def get_player_achievements(session, player_id):
-    """Получить все достижения игрока"""
-    return session.query(Achievement).filter_by(player_id=player_id).all()
+# Строка, в которую сверка записывает точные значения; остальные шарды обнуляются
+GLOBAL_STATS_ID = 1
 
+# Шард сессии в session.info
+GLOBAL_STATS_SHARD_KEY = 'global_stats_shard'
 
-def increment_message_count(session, player_id):
-    """Увеличить счётчик сообщений игрока (для опыта)"""
-    player = session.query(Player).filter_by(id=player_id).first()
-    if player:
-        player.messages_count += 1
-        player.experience += 10  # 10 XP за сообщение
-        
-        # Расчёт уровня (простая формула: 100 XP на уровень)
-        new_level = (player.experience // 100) + 1
-        if new_level > player.level:
-            player.level = new_level
-            session.commit()
-            return True, new_level  # Уровень повышен
-        
-        session.commit()
-        return False, player.level
-    return False, 1
+
+def global_stats_shard(session):
+    """
+    Строка-шард global_stats, которую обновляет эта сессия
+    Одна на сессию (scoped_session — одна на поток-воркер): транзакция блокирует
+    только один шард, поэтому две транзакции не ждут шарды друг друга по кругу
+    """
+    shard = session.info.get(GLOBAL_STATS_SHARD_KEY)
+    if shard is None:
+        shard = session.info[GLOBAL_STATS_SHARD_KEY] = random.randint(1, config.GLOBAL_STATS_SHARDS)
+    return shard
+
+
+def _accumulate_global_stats(stmt):
+    """ON CONFLICT для вставки в global_stats: прибавить значения к строке шарда"""
+    return stmt.on_conflict_do_update(
+        index_elements=[GlobalStats.id],
+        set_={
+            'total_players': GlobalStats.total_players + stmt.excluded.total_players,
+            'total_emission': GlobalStats.total_emission + stmt.excluded.total_emission,
+            'total_transactions': GlobalStats.total_transactions + stmt.excluded.total_transactions,
+            'updated_at': func.now()
+        }
+    )
+
+
+def bump_global_stats(session, players=0, emission=0, transactions=0):
+    """
+    Прибавить изменения к глобальным счётчикам
+    Вызывается в той же транзакции БД, что и изменение балансов.
+    Обновляется шард сессии (строка создаётся при первом обращении): строка
+    блокируется до коммита, но параллельные транзакции других воркеров
+    обновляют другие шарды и друг друга не ждут
+    """
+    session.execute(_accumulate_global_stats(pg_insert(GlobalStats).values(
+        id=global_stats_shard(session),
+        total_players=players,
+        total_emission=emission,
+        total_transactions=transactions
+    )))
+
+
+def _global_stats_totals(session, lock=False):
+    """Суммы счётчиков по всем шардам (None, если строк ещё нет)"""
+    if lock:
+        # Блокировка всех шардов в порядке id: счётчики не меняются до коммита
+        session.execute(select(GlobalStats.id).order_by(GlobalStats.id).with_for_update()).all()
+    
+    return session.execute(
+        select(
+            func.sum(GlobalStats.total_players).label('total_players'),
+            func.sum(GlobalStats.total_emission).label('total_emission'),
+            func.sum(GlobalStats.total_transactions).label('total_transactions')
+        )
+    ).first()
+
+
+def reconcile_global_stats(session):
+    """
+    Точный пересчёт глобальных счётчиков по таблицам игроков и транзакций
+    Исправляет расхождения от изменений в обход create_transaction (ручные правки в БД)
+    Точные значения записываются в строку GLOBAL_STATS_ID, остальные шарды обнуляются
+    Возвращает поправки {счётчик: точное значение - накопленное}
+    """
+    # Все шарды существуют заранее: транзакция, создающая шард во время сверки,
+    # иначе не была бы ни заблокирована, ни обнулена
+    session.execute(
+        pg_insert(GlobalStats).from_select(
+            ['id', 'total_players', 'total_emission', 'total_transactions'],
+            select(
+                func.generate_series(1, config.GLOBAL_STATS_SHARDS),
+                literal(0, Integer), literal(0, Integer), literal(0, Integer)
+            )
+        ).on_conflict_do_nothing(index_elements=[GlobalStats.id])
+    )
+    
+    current = _global_stats_totals(session, lock=True)
+    
+    exact = session.execute(
+        select(
+            select(func.count(Player.id)).scalar_subquery().label('total_players'),
+            select(func.coalesce(func.sum(Player.balance), 0)).scalar_subquery().label('total_emission'),
+            select(func.count(Transaction.id)).scalar_subquery().label('total_transactions')
+        )
+    ).first()
+    
+    session.execute(
+        update(GlobalStats)
+        .values(
+            total_players=case((GlobalStats.id == GLOBAL_STATS_ID, exact.total_players), else_=0),
+            total_emission=case((GlobalStats.id == GLOBAL_STATS_ID, exact.total_emission), else_=0),
+            total_transactions=case((GlobalStats.id == GLOBAL_STATS_ID, exact.total_transactions), else_=0),
+            updated_at=func.now(),
+            reconciled_at=func.now()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    
+    return {key: exact._mapping[key] - (current._mapping[key] or 0) for key in exact._mapping.keys()}
 
 
 def get_global_stats(session):
-    """Получить глобальную статистику"""
-    total_players = session.query(func.count(Player.id)).scalar()
-    total_emission = session.query(func.sum(Player.balance)).scalar() or 0
-    avg_balance = session.query(func.avg(Player.balance)).scalar() or 0
-    total_transactions = session.query(func.count(Transaction.id)).scalar()
+    """Получить глобальную статистику (сумма GLOBAL_STATS_SHARDS коротких строк)"""
+    stats = _global_stats_totals(session)
+    
+    total_players = stats.total_players or 0
+    total_emission = stats.total_emission or 0
+    avg_balance = total_emission / total_players if total_players else 0
     
     return {
         'total_players': total_players,
         'total_emission': total_emission,
         'avg_balance': round(avg_balance, 2),
-        'total_transactions': total_transactions
+        'total_transactions': stats.total_transactions or 0
     }
 
 
@@ -167,7 +758,6 @@ def ban_player(session, vk_id, reason=None):
     if player:
         player.is_banned = True
         player.ban_reason = reason
-        session.commit()
         return True
     return False
 
@@ -178,7 +768,6 @@ def unban_player(session, vk_id):
     if player:
         player.is_banned = False
         player.ban_reason = None
-        session.commit()
         return True
     return False
 
@@ -188,49 +777,254 @@ def delete_player(session, vk_id):
     player = get_player_by_vk_id(session, vk_id)
     if player:
         # Удаление связанных записей
-        session.query(Transaction).filter(
+        deleted_transactions = session.query(Transaction).filter(
             (Transaction.from_player_id == player.id) | (Transaction.to_player_id == player.id)
         ).delete()
         session.query(PurchaseRequest).filter_by(player_id=player.id).delete()
         session.query(Achievement).filter_by(player_id=player.id).delete()
         session.query(ScheduledPayment).filter_by(player_id=player.id).delete()
+        session.query(PlayerStats).filter_by(player_id=player.id).delete()
         
         # Удаление самого игрока
         session.delete(player)
-        session.commit()
+        bump_global_stats(session, players=-1, emission=-player.balance, transactions=-deleted_transactions)
         return True
     return False
 
 
-def create_scheduled_payment(session, player_id, admin_id, amount, scheduled_for, reason=None):
-    """Создать запланированное начисление"""
+def create_scheduled_payment(session, player_id, admin_id, amount, scheduled_for, reason=None,
+                             segment=None, min_level=None, vk_ids=None):
+    """
+    Создать запланированное начисление
+    Одному игроку (player_id) или сегменту (segment, min_level / vk_ids, player_id=None)
+    """
     payment = ScheduledPayment(
         player_id=player_id,
         admin_id=admin_id,
+        segment=segment,
+        min_level=min_level,
+        vk_ids=vk_ids,
         amount=amount,
         scheduled_for=scheduled_for,
         reason=reason
     )
     session.add(payment)
-    session.commit()
+    session.flush()
     return payment
 
 
-def get_due_scheduled_payments(session):
-    """Получить все платежи, которые должны быть выполнены"""
-    now = datetime.now()
-    return session.query(ScheduledPayment).filter(
-        ScheduledPayment.scheduled_for <= now,
-        ScheduledPayment.executed == False
+def get_pending_payment_times(session):
+    """Сроки всех невыполненных платежей (для будильника планировщика)"""
+    return session.execute(
+        select(ScheduledPayment.scheduled_for).where(ScheduledPayment.executed == False)
+    ).scalars().all()
+
+
+def get_next_payment_time(session):
+    """Срок самого раннего невыполненного платежа или None"""
+    return session.execute(
+        select(func.min(ScheduledPayment.scheduled_for)).where(ScheduledPayment.executed == False)
+    ).scalar()
+
+
+def claim_due_payments(session, limit, now=None):
+    """
+    Забрать до limit наступивших платежей: отметить выполненными в текущей транзакции БД
+    FOR UPDATE SKIP LOCKED — строки, которые обрабатывает другой экземпляр бота,
+    пропускаются, а после его коммита уже не проходят условие executed = false.
+    Откат транзакции возвращает платежи в очередь
+    Возвращает [Row(id, player_id, segment, min_level, vk_ids, amount, reason)]
+    """
+    now = now or datetime.now()
+    due = (
+        select(ScheduledPayment.id)
+        .where(ScheduledPayment.executed == False, ScheduledPayment.scheduled_for <= now)
+        .order_by(ScheduledPayment.scheduled_for, ScheduledPayment.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .cte('due')
+    )
+    return session.execute(
+        update(ScheduledPayment)
+        .where(ScheduledPayment.id == due.c.id)
+        .values(executed=True, executed_at=now)
+        .returning(
+            ScheduledPayment.id, ScheduledPayment.player_id, ScheduledPayment.segment,
+            ScheduledPayment.min_level, ScheduledPayment.vk_ids, ScheduledPayment.amount, ScheduledPayment.reason
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def apply_scheduled_payments(session, payments):
+    """
+    Начислить забранные платежи set-based одним запросом: UPDATE игроков, а история,
+    статистика и глобальные счётчики строятся из его RETURNING (как в credit_players) —
+    сколько бы ни было платежей
+    Строки игроков блокируются в порядке id, как в transfer_balance
+    payments: платежи одному игроку из claim_due_payments (сегменты — apply_segment_payment)
+    Возвращает {player_id: Row} игроков с новыми балансами (удалённых игроков в нём нет)
+    """
+    totals = {}
+    for payment in payments:
+        amount, count = totals.get(payment.player_id, (0, 0))
+        totals[payment.player_id] = (amount + payment.amount, count + 1)
+    
+    session.execute(
+        select(Player.id)
+        .where(Player.id.in_(list(totals)))
+        .order_by(Player.id)
+        .with_for_update()
+    ).all()
+    
+    credits = values(
+        column('player_id', Integer),
+        column('amount', Integer),
+        column('payments', Integer),
+        name='credits'
+    ).data([(player_id, amount, count) for player_id, (amount, count) in totals.items()])
+    
+    credited = (
+        update(Player)
+        .where(Player.id == credits.c.player_id)
+        .values(balance=Player.balance + credits.c.amount)
+        .returning(
+            Player.id, Player.vk_id, Player.first_name, Player.last_name, Player.balance,
+            Player.is_banned, Player.hide_balance, Player.notifications_enabled
+        )
+        .cte('credited')
+    )
+    
+    # История, статистика и эмиссия — только для игроков, которым UPDATE начислил
+    # (игрока могли удалить после планирования — его платёж ничего не начисляет)
+    claimed = values(
+        column('player_id', Integer),
+        column('amount', Integer),
+        column('reason', Text),
+        name='claimed'
+    ).data([(payment.player_id, payment.amount, payment.reason) for payment in payments])
+    
+    ledger = (
+        insert(Transaction).from_select(
+            ['from_player_id', 'to_player_id', 'amount', 'type', 'reason', 'is_anonymous'],
+            select(
+                null(),
+                claimed.c.player_id,
+                claimed.c.amount,
+                literal(TransactionType.SCHEDULED_GIVE, Transaction.type.type),
+                claimed.c.reason,
+                false()
+            ).select_from(claimed.join(credited, credited.c.id == claimed.c.player_id))
+        )
+        .returning(Transaction.id)
+        .cte('ledger')
+    )
+    
+    zero = literal(0, Integer)
+    player_stats = _accumulate_player_stats(pg_insert(PlayerStats).from_select(
+        [
+            'player_id', 'total_received', 'total_spent', 'transfer_count',
+            'transfer_total', 'purchase_count', 'largest_purchase', 'tx_count'
+        ],
+        select(credits.c.player_id, credits.c.amount, zero, zero, zero, zero, zero, credits.c.payments)
+        .select_from(credits.join(credited, credited.c.id == credits.c.player_id))
+    )).returning(PlayerStats.player_id).cte('player_stats_bump')
+    
+    # Шард не блокируется, если начислять некому
+    global_stats = _accumulate_global_stats(pg_insert(GlobalStats).from_select(
+        ['id', 'total_players', 'total_emission', 'total_transactions'],
+        select(
+            literal(global_stats_shard(session), Integer),
+            zero,
+            func.sum(credits.c.amount),
+            func.sum(credits.c.payments)
+        )
+        .select_from(credits.join(credited, credited.c.id == credits.c.player_id))
+        .having(func.count() > 0)
+    )).returning(GlobalStats.id).cte('global_stats_bump')
+    
+    # CTE с историей и счётчиками упоминаются в запросе, иначе SQLAlchemy их не выведет
+    players = session.execute(
+        select(
+            credited,
+            select(func.count()).select_from(ledger).scalar_subquery().label('ledger'),
+            select(func.count()).select_from(player_stats).scalar_subquery().label('player_stats'),
+            select(func.count()).select_from(global_stats).scalar_subquery().label('global_stats')
+        )
     ).all()
+    
+    return {player.id: player for player in players}
 
 
-def mark_payment_executed(session, payment_id):
-    """Отметить платёж как выполненный"""
-    payment = session.query(ScheduledPayment).filter_by(id=payment_id).first()
-    if payment:
-        payment.executed = True
-        payment.executed_at = datetime.now()
-        session.commit()
-        return True
-    return False
\ No newline at end of file
+def apply_segment_payment(session, payment):
+    """
+    Раскрыть платёж сегменту в начисления тем же set-based путём, что и массовое начисление
+    Возвращает количество игроков, получивших начисление
+    """
+    return credit_players(
+        session,
+        payment.amount,
+        TransactionType.SCHEDULED_GIVE,
+        payment.reason,
+        segment_condition(payment.segment, payment.min_level, payment.vk_ids)
+    )
+
+
+def count_broadcast_recipients(session):
+    """Количество получателей рассылки (все незаблокированные игроки)"""
+    return session.query(func.count(Player.id)).filter(Player.is_banned == False).scalar()
+
+
+def get_broadcast_recipients_after(session, last_player_id, limit):
+    """Следующая пачка получателей рассылки: [(player_id, vk_id)] по возрастанию id"""
+    return session.execute(
+        select(Player.id, Player.vk_id)
+        .where(Player.id > last_player_id, Player.is_banned == False)
+        .order_by(Player.id)
+        .limit(limit)
+    ).all()
+
+
+def create_broadcast(session, admin_id, message, total_recipients):
+    """Создать рассылку"""
+    broadcast = Broadcast(
+        admin_id=admin_id,
+        message=message,
+        status='pending',
+        total_recipients=total_recipients
+    )
+    session.add(broadcast)
+    session.flush()
+    return broadcast
+
+
+def get_unfinished_broadcasts(session):
+    """Рассылки, прерванные до завершения"""
+    return session.query(Broadcast).filter(
+        Broadcast.status.in_(['pending', 'running'])
+    ).order_by(Broadcast.id).all()
+
+
+def ack_broadcast_batch(session, broadcast_id, last_player_id, sent, failed):
+    """Подтвердить отправку пачки: сдвинуть курсор и счётчики"""
+    session.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id)
+        .values(
+            status='running',
+            last_player_id=last_player_id,
+            sent_count=Broadcast.sent_count + sent,
+            failed_count=Broadcast.failed_count + failed
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def finish_broadcast(session, broadcast_id, status='completed'):
+    """Отметить рассылку завершённой"""
+    session.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id)
+        .values(status=status, finished_at=datetime.now())
+        .execution_options(synchronize_session=False)
+    )
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+Запросы чтения для экранов: история операций, топ игроков, поиск
+
+Core select по таблицам с нужными колонками вместо ORM-объектов: строки не
+проходят через identity map и не превращаются в объекты моделей. Каждый запрос
+строится один раз с bindparam и переиспользуется — ключ кэша запроса вычисляется
+один раз, скомпилированный SQL берётся из кэша движка.
+Возвращают Row — кортеж с доступом к колонкам по имени (row.amount)
+"""
+from sqlalchemy import select, bindparam, union_all, tuple_, func, Integer, DateTime, String
+
+from database.models import Player, Transaction, TransactionType
+
+players = Player.__table__
+transactions = Transaction.__table__
+
+# Колонки, которые показывает история (format_transaction_history)
+HISTORY_COLUMNS = (
+    transactions.c.id,
+    transactions.c.from_player_id,
+    transactions.c.to_player_id,
+    transactions.c.amount,
+    transactions.c.type,
+    transactions.c.reason,
+    transactions.c.created_at
+)
+
+# Колонки игрока для списков (совпадают с LeaderboardEntry)
+PLAYER_LIST_COLUMNS = (
+    players.c.id,
+    players.c.vk_id,
+    players.c.first_name,
+    players.c.last_name,
+    players.c.balance
+)
+
+# Фильтры истории -> типы транзакций
+HISTORY_FILTERS = {
+    'переводы': [TransactionType.TRANSFER],
+    'покупки': [TransactionType.PURCHASE],
+    'админ': [TransactionType.ADMIN_GIVE, TransactionType.ADMIN_TAKE],
+}
+
+# Спецсимвол для экранирования % и _ в поиске (не обратная косая черта —
+# её запись в литерале зависит от standard_conforming_strings)
+LIKE_ESCAPE = '/'
+
+# (с фильтром типов, направление) -> запрос страницы истории
+_history_statements = {}
+
+
+def _build_history_statement(filtered, direction):
+    """
+    Запрос страницы истории: исходящие и входящие отдельно по своим индексам, UNION ALL
+    direction: None (первая страница), 'before' (старее курсора), 'after' (новее курсора)
+    """
+    newer = direction == 'after'
+    
+    def branch(side_column):
+        query = select(*HISTORY_COLUMNS).where(side_column == bindparam('player_id', type_=Integer))
+        if filtered:
+            query = query.where(transactions.c.type.in_(bindparam('types', expanding=True)))
+        if direction is not None:
+            key = tuple_(transactions.c.created_at, transactions.c.id)
+            cursor = tuple_(
+                bindparam('cursor_created_at', type_=DateTime),
+                bindparam('cursor_id', type_=Integer)
+            )
+            query = query.where(key > cursor if newer else key < cursor)
+        if newer:
+            query = query.order_by(transactions.c.created_at, transactions.c.id)
+        else:
+            query = query.order_by(transactions.c.created_at.desc(), transactions.c.id.desc())
+        return query.limit(bindparam('limit', type_=Integer))
+    
+    page = union_all(
+        branch(transactions.c.from_player_id),
+        branch(transactions.c.to_player_id)
+    ).subquery('page')
+    
+    stmt = select(*page.c)
+    if newer:
+        stmt = stmt.order_by(page.c.created_at, page.c.id)
+    else:
+        stmt = stmt.order_by(page.c.created_at.desc(), page.c.id.desc())
+    return stmt.limit(bindparam('limit', type_=Integer))
+
+
+def history_statement(filtered=False, direction=None):
+    """Готовый запрос страницы истории (строится при первом обращении)"""
+    key = (filtered, direction)
+    stmt = _history_statements.get(key)
+    if stmt is None:
+        stmt = _history_statements.setdefault(key, _build_history_statement(filtered, direction))
+    return stmt
+
+
+def get_history_page(session, player_id, limit=10, transaction_filter=None, before=None, after=None):
+    """
+    Страница истории игрока (keyset по (created_at, id), новые сверху)
+    before / after — курсор (created_at, id): более старые / более новые записи
+    Возвращает (rows, has_more) — has_more: есть ли записи дальше в том же направлении
+    """
+    types = HISTORY_FILTERS.get(transaction_filter)
+    cursor = after if after is not None else before
+    direction = 'after' if after is not None else 'before' if before is not None else None
+    
+    params = {'player_id': player_id, 'limit': limit + 1}
+    if types:
+        params['types'] = list(types)
+    if cursor is not None:
+        params['cursor_created_at'], params['cursor_id'] = cursor
+    
+    rows = session.connection().execute(history_statement(bool(types), direction), params).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    if direction == 'after':
+        rows.reverse()
+    
+    return rows, has_more
+
+
+_TOP_PLAYERS = (
+    select(*PLAYER_LIST_COLUMNS)
+    .where(players.c.is_banned == False)
+    .order_by(players.c.balance.desc())
+    .limit(bindparam('limit', type_=Integer))
+)
+
+_TOP_VISIBLE_PLAYERS = _TOP_PLAYERS.where(players.c.hide_balance == False)
+
+
+def get_top_players(session, limit=10, include_hidden=False):
+    """Топ игроков по балансу (для игроков — services/leaderboard.py, без запроса)"""
+    stmt = _TOP_PLAYERS if include_hidden else _TOP_VISIBLE_PLAYERS
+    return session.connection().execute(stmt, {'limit': limit}).all()
+
+
+_SEARCH_PLAYERS = (
+    select(*PLAYER_LIST_COLUMNS)
+    .where(
+        func.lower(players.c.first_name + ' ' + players.c.last_name)
+        .like(bindparam('pattern', type_=String), escape=LIKE_ESCAPE)
+    )
+    .order_by(players.c.id)
+    .limit(bindparam('limit', type_=Integer))
+)
+
+
+def search_players(session, search_query, limit=10):
+    """Игроки, в имени и фамилии которых встречается строка (без учёта регистра)"""
+    escaped = (
+        search_query.lower()
+        .replace(LIKE_ESCAPE, LIKE_ESCAPE * 2)
+        .replace('%', LIKE_ESCAPE + '%')
+        .replace('_', LIKE_ESCAPE + '_')
+    )
+    return session.connection().execute(_SEARCH_PLAYERS, {'pattern': f'%{escaped}%', 'limit': limit}).all()
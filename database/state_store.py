@@ -0,0 +1,225 @@
+"""
+Хранилища состояний FSM (states.py)
+
+Запись состояния сериализуется в компактный JSON; datetime (например,
+scheduled_dt) кодируется как {"$dt": "ISO"} и восстанавливается при чтении.
+Хранилища работают с готовыми строками и ничего не кэшируют — кэш
+в states.py.
+
+memory    — словарь процесса или общий словарь процессов (multiprocessing.Manager().dict())
+database  — таблица fsm_states; каждая запись — отдельная транзакция на своём
+            соединении, независимо от сессии обработчика
+
+WriteBehindStateStore — отложенная запись поверх любого из них (asyncio-режим)
+"""
+from datetime import datetime
+import json
+import threading
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database.models import FsmState
+
+fsm_states = FsmState.__table__
+
+DATETIME_TAG = '$dt'
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {DATETIME_TAG: value.isoformat()}
+    raise TypeError(f"Значение {type(value).__name__} нельзя сохранить в состоянии")
+
+
+def _decode(obj):
+    if len(obj) == 1 and DATETIME_TAG in obj:
+        return datetime.fromisoformat(obj[DATETIME_TAG])
+    return obj
+
+
+def dumps(value):
+    """Запись или ключ -> компактная JSON-строка"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_encode)
+
+
+def loads(payload):
+    return json.loads(payload, object_hook=_decode)
+
+
+class MemoryStateStore:
+    """Хранилище в словаре: (kind, key) -> сериализованная запись"""
+    
+    def __init__(self, mapping=None):
+        self.mapping = {} if mapping is None else mapping
+    
+    def load(self, kind, key):
+        return self.mapping.get((kind, key))
+    
+    def load_all(self, kind):
+        return [(key, payload) for (entry_kind, key), payload in self.mapping.items() if entry_kind == kind]
+    
+    def save(self, kind, key, payload):
+        self.mapping[(kind, key)] = payload
+    
+    def delete(self, kind, key, payload=None):
+        """
+        payload — удалить, только если запись не перезаписана с тех пор (совпадает с payload)
+        В общем словаре процессов проверка и удаление — два обращения к менеджеру
+        """
+        if payload is not None and self.mapping.get((kind, key)) != payload:
+            return
+        self.mapping.pop((kind, key), None)
+
+
+class DatabaseStateStore:
+    """Хранилище в таблице fsm_states (PostgreSQL)"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+    
+    def load(self, kind, key):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(fsm_states.c.payload)
+                .where(fsm_states.c.kind == kind, fsm_states.c.key == dumps(key))
+            ).scalar()
+    
+    def load_all(self, kind):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(fsm_states.c.key, fsm_states.c.payload).where(fsm_states.c.kind == kind)
+            ).all()
+        return [(loads(row.key), row.payload) for row in rows]
+    
+    def save(self, kind, key, payload):
+        stmt = pg_insert(fsm_states).values(kind=kind, key=dumps(key), payload=payload)
+        with self.engine.begin() as conn:
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=[fsm_states.c.kind, fsm_states.c.key],
+                set_={'payload': stmt.excluded.payload, 'updated_at': func.now()}
+            ))
+    
+    def delete(self, kind, key, payload=None):
+        """payload — удалить, только если запись не перезаписана с тех пор (совпадает с payload)"""
+        stmt = delete(fsm_states).where(fsm_states.c.kind == kind, fsm_states.c.key == dumps(key))
+        if payload is not None:
+            stmt = stmt.where(fsm_states.c.payload == payload)
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+
+
+class WriteBehindStateStore:
+    """
+    Отложенная запись поверх другого хранилища (asyncio-режим)
+    save/delete только ставят запись в очередь и сразу возвращаются — цикл событий
+    не ждёт транзакцию БД. Очередь пишет фоновый поток; повторные записи ключа
+    до сброса схлопываются в последнюю. load и load_all видят ещё не записанные значения
+    """
+    
+    def __init__(self, store):
+        self.store = store
+        
+        # (kind, key) -> ('save', запись) или ('delete', ожидаемая запись / None):
+        # ждут потока / пишутся сейчас
+        self._pending = {}
+        self._writing = {}
+        
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+    
+    def start(self):
+        """Запуск фоновой записи"""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._write_loop, name='fsm-store-writer', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Остановка: очередь дописывается до конца"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+    
+    def load(self, kind, key):
+        # Условное удаление в очереди решается по значению под ним
+        expected = set()
+        with self._cond:
+            for queued in (self._pending, self._writing):
+                action, payload = queued.get((kind, key), (None, None))
+                if action == 'save':
+                    return None if payload in expected else payload
+                if action == 'delete':
+                    if payload is None:
+                        return None
+                    expected.add(payload)
+        
+        payload = self.store.load(kind, key)
+        return None if payload in expected else payload
+    
+    def load_all(self, kind):
+        with self._cond:
+            queued = [dict(self._writing), dict(self._pending)]
+        
+        entries = dict(self.store.load_all(kind))
+        for layer in queued:
+            for (entry_kind, key), (action, payload) in layer.items():
+                if entry_kind != kind:
+                    continue
+                if action == 'save':
+                    entries[key] = payload
+                elif payload is None or entries.get(key) == payload:
+                    entries.pop(key, None)
+        return list(entries.items())
+    
+    def save(self, kind, key, payload):
+        self._enqueue(kind, key, ('save', payload))
+    
+    def delete(self, kind, key, payload=None):
+        with self._cond:
+            action, queued = self._pending.get((kind, key), (None, None))
+            if payload is not None and action == 'save':
+                # Более новая запись в очереди не удаляется; совпадающая — не дойдёт до хранилища
+                if queued != payload:
+                    return
+                payload = None
+            self._pending[(kind, key)] = ('delete', payload)
+            self._cond.notify()
+    
+    def flush(self):
+        """Записать очередь во внутреннее хранилище; возвращает число записей"""
+        with self._cond:
+            self._writing, self._pending = self._pending, {}
+            batch = self._writing
+        
+        for (kind, key), (action, payload) in batch.items():
+            try:
+                if action == 'save':
+                    self.store.save(kind, key, payload)
+                else:
+                    self.store.delete(kind, key, payload)
+            except Exception as e:
+                # Состояние остаётся в кэше процесса, но не переживёт перезапуск
+                print(f"❌ Ошибка записи состояния {kind}/{key}: {e}")
+        
+        with self._cond:
+            self._writing = {}
+        return len(batch)
+    
+    def _enqueue(self, kind, key, operation):
+        with self._cond:
+            self._pending[(kind, key)] = operation
+            self._cond.notify()
+    
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            self.flush()
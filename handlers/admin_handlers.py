@@ -2,25 +2,29 @@
 Обработчики команд администратора
 """
 from database.queries import (
-    get_player_by_vk_id,
     get_global_stats,
-    get_top_players,
     ban_player,
     unban_player,
     delete_player,
     create_scheduled_payment
 )
-from database.connection import get_session
+from database.connection import get_session, unit_of_work
+from database.read_queries import get_top_players, search_players
 from keyboards.vk_keyboards import (
     get_admin_menu_keyboard,
     get_admin_management_keyboard,
     get_confirmation_keyboard
 )
-from services.transaction_service import admin_give_chilliki, admin_take_chilliki
+from services.transaction_service import admin_give_chilliki, admin_take_chilliki, gift_all_chilliki
+from services.profile_cache import profile_cache
+from services.broadcast_service import broadcast_service
+from services.outbox import outbox
+from services.leaderboard import leaderboard
 from utils.validators import validate_amount, validate_vk_id, validate_datetime_format
 from utils.formatters import format_stats, format_leaderboard, format_balance
 from utils.notifications import notify_ban, notify_unban
 from middleware.auth import require_admin
+from middleware.context import get_player
 from middleware.rate_limiter import rate_limit
 import states
 
@@ -51,7 +55,7 @@ def handle_admin_give_player(vk, event, session, player_input):
         )
         return
     
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = get_player(session, player_vk_id)
     if not player:
         vk.messages.send(
             user_id=event.user_id,
@@ -150,7 +154,7 @@ def handle_admin_take_player(vk, event, session, player_input):
         )
         return
     
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = get_player(session, player_vk_id)
     if not player:
         vk.messages.send(
             user_id=event.user_id,
@@ -234,7 +238,15 @@ def handle_admin_stats(vk, event, session):
     stats_msg += f"👥 Всего игроков: {format_balance(stats['total_players'])}\n"
     stats_msg += f"💰 Общая эмиссия: {format_balance(stats['total_emission'])} чил.\n"
     stats_msg += f"📊 Средний баланс: {format_balance(int(stats['avg_balance']))} чил.\n"
-    stats_msg += f"📈 Всего транзакций: {format_balance(stats['total_transactions'])}\n\n"
+    stats_msg += f"📈 Всего транзакций: {format_balance(stats['total_transactions'])}\n"
+    
+    cache_stats = profile_cache.get_stats()
+    stats_msg += f"🗂 Кэш профилей: {format_balance(cache_stats['size'])} шт., "
+    stats_msg += f"попаданий {int(cache_stats['hit_rate'] * 100)}%, вытеснено {format_balance(cache_stats['evictions'])}\n"
+    
+    outbox_stats = outbox.get_stats()
+    stats_msg += f"📤 Исходящие: в очереди {format_balance(outbox_stats['queue_depth'])}, "
+    stats_msg += f"отправлено {format_balance(outbox_stats['sent'])}, ошибок {format_balance(outbox_stats['failed'])}\n\n"
     stats_msg += "🏆 Топ-5 игроков:\n"
     
     for i, player in enumerate(top_players, 1):
@@ -285,7 +297,7 @@ def handle_ban_player(vk, event, session, player_input):
         )
         return
     
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = get_player(session, player_vk_id)
     if not player:
         vk.messages.send(
             user_id=event.user_id,
@@ -310,9 +322,11 @@ def handle_ban_reason(vk, event, session, reason_input):
     player_vk_id = states.get_state_data(event.user_id, 'player_vk_id')
     reason = None if reason_input == '-' else reason_input
     
-    success = ban_player(session, player_vk_id, reason)
+    with unit_of_work(session):
+        success = ban_player(session, player_vk_id, reason)
     
     if success:
+        leaderboard.update(get_player(session, player_vk_id))
         notify_ban(vk, player_vk_id, reason)
         vk.messages.send(
             user_id=event.user_id,
@@ -356,7 +370,7 @@ def handle_delete_player_confirm(vk, event, session, player_input):
         )
         return
     
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = get_player(session, player_vk_id)
     if not player:
         vk.messages.send(
             user_id=event.user_id,
@@ -366,9 +380,12 @@ def handle_delete_player_confirm(vk, event, session, player_input):
         states.clear_state(event.user_id)
         return
     
-    success = delete_player(session, player_vk_id)
+    player_id = player.id
+    with unit_of_work(session):
+        success = delete_player(session, player_vk_id)
     
     if success:
+        leaderboard.remove(player_id)
         vk.messages.send(
             user_id=event.user_id,
             message=f"✅ Профиль игрока {player.first_name} {player.last_name} удалён",
@@ -387,10 +404,10 @@ def handle_delete_player_confirm(vk, event, session, player_input):
     """
 Дополнительные команды администратора
 """
-from sqlalchemy import func
-from database.models import Player
+from database.models import PaymentSegment
 from database.queries import create_scheduled_payment
-from utils.validators import validate_datetime_format
+from services.payment_timer import payment_timer
+from utils.validators import validate_datetime_format, validate_payment_target
 from datetime import datetime
 
 
@@ -401,15 +418,34 @@ def handle_schedule_start(vk, event, session):
     
     vk.messages.send(
         user_id=event.user_id,
-        message="⏰ Запланировать начисление\n\nУкажите VK ID игрока:",
+        message=(
+            "⏰ Запланировать начисление\n\n"
+            "Укажите получателей:\n"
+            "• VK ID игрока\n"
+            "• «все» — все игроки\n"
+            "• «уровень 5» — игроки с уровнем от 5\n"
+            "• несколько VK ID через запятую"
+        ),
         random_id=0
     )
 
 
+def _describe_schedule_target(player, data):
+    """Получатели запланированного начисления для сообщений администратору"""
+    segment = data.get('segment')
+    if segment == PaymentSegment.ALL:
+        return "все игроки"
+    if segment == PaymentSegment.LEVEL:
+        return f"игроки с уровнем от {data['min_level']}"
+    if segment == PaymentSegment.PLAYERS:
+        return f"игроки по списку ({len(data['vk_ids'])} VK ID)"
+    return f"{player.first_name} {player.last_name}"
+
+
 @require_admin
 def handle_schedule_player(vk, event, session, player_input):
-    """Обработка VK ID для планировщика"""
-    valid, player_vk_id, error = validate_vk_id(player_input)
+    """Обработка получателей для планировщика (игрок или сегмент)"""
+    valid, target, error = validate_payment_target(player_input)
     
     if not valid:
         vk.messages.send(
@@ -419,25 +455,23 @@ def handle_schedule_player(vk, event, session, player_input):
         )
         return
     
-    player = get_player_by_vk_id(session, player_vk_id)
-    if not player:
-        vk.messages.send(
-            user_id=event.user_id,
-            message=f"❌ Игрок с ID {player_vk_id} не найден",
-            random_id=0
-        )
-        return
+    # Сегмент раскрывается в игроков только при выполнении платежа
+    player = None
+    if 'player_vk_id' in target:
+        player = get_player(session, target['player_vk_id'])
+        if not player:
+            vk.messages.send(
+                user_id=event.user_id,
+                message=f"❌ Игрок с ID {target['player_vk_id']} не найден",
+                random_id=0
+            )
+            return
     
-    states.update_state_data(event.user_id, player_vk_id=player_vk_id)
-    states.set_state(
-        event.user_id,
-        states.State.WAITING_SCHEDULE_AMOUNT,
-        player_vk_id=player_vk_id
-    )
+    states.set_state(event.user_id, states.State.WAITING_SCHEDULE_AMOUNT, **target)
     
     vk.messages.send(
         user_id=event.user_id,
-        message=f"✅ Игрок: {player.first_name} {player.last_name}\n\nУкажите сумму:",
+        message=f"✅ Получатели: {_describe_schedule_target(player, target)}\n\nУкажите сумму:",
         random_id=0
     )
 
@@ -455,13 +489,8 @@ def handle_schedule_amount(vk, event, session, amount_input):
         )
         return
     
-    states.update_state_data(event.user_id, amount=amount)
-    states.set_state(
-        event.user_id,
-        states.State.WAITING_SCHEDULE_DATETIME,
-        player_vk_id=states.get_state_data(event.user_id, 'player_vk_id'),
-        amount=amount
-    )
+    _, data = states.get_state(event.user_id)
+    states.set_state(event.user_id, states.State.WAITING_SCHEDULE_DATETIME, **data, amount=amount)
     
     vk.messages.send(
         user_id=event.user_id,
@@ -491,14 +520,8 @@ def handle_schedule_datetime(vk, event, session, datetime_input):
         )
         return
     
-    states.update_state_data(event.user_id, scheduled_dt=scheduled_dt)
-    states.set_state(
-        event.user_id,
-        states.State.WAITING_SCHEDULE_REASON,
-        player_vk_id=states.get_state_data(event.user_id, 'player_vk_id'),
-        amount=states.get_state_data(event.user_id, 'amount'),
-        scheduled_dt=scheduled_dt
-    )
+    _, data = states.get_state(event.user_id)
+    states.set_state(event.user_id, states.State.WAITING_SCHEDULE_REASON, **data, scheduled_dt=scheduled_dt)
     
     vk.messages.send(
         user_id=event.user_id,
@@ -509,26 +532,43 @@ def handle_schedule_datetime(vk, event, session, datetime_input):
 
 @require_admin
 def handle_schedule_reason(vk, event, session, reason_input):
-    """Создание запланированного начисления"""
-    player_vk_id = states.get_state_data(event.user_id, 'player_vk_id')
-    amount = states.get_state_data(event.user_id, 'amount')
-    scheduled_dt = states.get_state_data(event.user_id, 'scheduled_dt')
+    """Создание запланированного начисления (одна строка и для сегмента)"""
+    _, data = states.get_state(event.user_id)
+    amount = data['amount']
+    scheduled_dt = data['scheduled_dt']
     reason = None if reason_input == '-' else reason_input
     
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = None
+    if data.get('segment') is None:
+        player = get_player(session, data['player_vk_id'])
+        if not player:
+            # Игрока удалили, пока админ заполнял начисление
+            states.clear_state(event.user_id)
+            vk.messages.send(
+                user_id=event.user_id,
+                message=f"❌ Игрок с ID {data['player_vk_id']} не найден",
+                keyboard=get_admin_menu_keyboard(),
+                random_id=0
+            )
+            return
     
-    payment = create_scheduled_payment(
-        session,
-        player.id,
-        event.user_id,
-        amount,
-        scheduled_dt,
-        reason
-    )
+    with unit_of_work(session):
+        payment = create_scheduled_payment(
+            session,
+            player.id if player else None,
+            event.user_id,
+            amount,
+            scheduled_dt,
+            reason,
+            segment=data.get('segment'),
+            min_level=data.get('min_level'),
+            vk_ids=data.get('vk_ids')
+        )
+    payment_timer.schedule(payment.scheduled_for)
     
     if payment:
         msg = f"✅ Запланировано начисление\n\n"
-        msg += f"Игрок: {player.first_name} {player.last_name}\n"
+        msg += f"Получатели: {_describe_schedule_target(player, data)}\n"
         msg += f"Сумма: {format_balance(amount)} чил.\n"
         msg += f"Дата: {scheduled_dt.strftime('%d.%m.%Y %H:%M')}\n"
         if reason:
@@ -560,32 +600,14 @@ def handle_broadcast_start(vk, event, session):
 
 @require_admin
 def handle_broadcast_send(vk, event, session, message_text):
-    """Отправка рассылки"""
-    # Получение всех игроков
-    players = session.query(Player).filter_by(is_banned=False).all()
-    
-    sent_count = 0
-    failed_count = 0
-    
-    broadcast_msg = f"📢 Сообщение от администратора:\n\n{message_text}"
-    
-    for player in players:
-        try:
-            vk.messages.send(
-                user_id=player.vk_id,
-                message=broadcast_msg,
-                random_id=0
-            )
-            sent_count += 1
-        except Exception as e:
-            failed_count += 1
-            print(f"❌ Ошибка отправки {player.vk_id}: {e}")
+    """Отправка рассылки (фоновая, пачками)"""
+    broadcast = broadcast_service.start_broadcast(session, vk, event.user_id, message_text)
     
     states.clear_state(event.user_id)
     
-    result_msg = f"✅ Рассылка завершена\n\n"
-    result_msg += f"Отправлено: {sent_count}\n"
-    result_msg += f"Ошибок: {failed_count}"
+    result_msg = f"📢 Рассылка #{broadcast.id} запущена\n\n"
+    result_msg += f"Получателей: {format_balance(broadcast.total_recipients)}\n"
+    result_msg += "О завершении придёт отдельное сообщение"
     
     vk.messages.send(
         user_id=event.user_id,
@@ -620,41 +642,19 @@ def handle_gift_all_amount(vk, event, session, amount_input):
         )
         return
     
-    # Получение всех игроков
-    players = session.query(Player).all()
-    
-    for player in players:
-        player.balance += amount
-        
-        # Создание транзакции
-        create_transaction(
-            session,
-            from_player_id=None,
-            to_player_id=player.id,
-            amount=amount,
-            transaction_type=TransactionType.ADMIN_GIVE,
-            reason=f"Массовое начисление от администратора"
-        )
-    
-    session.commit()
-    
-    # Уведомление игроков
-    for player in players:
-        if player.notifications_enabled:
-            try:
-                vk.messages.send(
-                    user_id=player.vk_id,
-                    message=f"🎁 Вам начислено {format_balance(amount)} чилликов!\n💰 Ваш баланс: {format_balance(player.balance)} чил.",
-                    random_id=0
-                )
-            except:
-                pass
+    success, message = gift_all_chilliki(
+        session,
+        vk,
+        event.user_id,
+        amount,
+        reason="Массовое начисление от администратора"
+    )
     
     states.clear_state(event.user_id)
     
     vk.messages.send(
         user_id=event.user_id,
-        message=f"✅ Начислено {format_balance(amount)} чилликов всем игрокам ({len(players)} чел.)",
+        message=message,
         keyboard=get_admin_menu_keyboard(),
         random_id=0
     )
@@ -679,7 +679,7 @@ def handle_find_player_search(vk, event, session, search_query):
     valid, vk_id, _ = validate_vk_id(search_query)
     
     if valid:
-        player = get_player_by_vk_id(session, vk_id)
+        player = get_player(session, vk_id)
         if player:
             msg = format_player_profile(player, include_achievements=False)
             vk.messages.send(
@@ -692,9 +692,7 @@ def handle_find_player_search(vk, event, session, search_query):
             return
     
     # Поиск по имени
-    players = session.query(Player).filter(
-        func.lower(Player.first_name + ' ' + Player.last_name).like(f'%{search_query.lower()}%')
-    ).limit(10).all()
+    players = search_players(session, search_query, limit=10)
     
     if not players:
         vk.messages.send(
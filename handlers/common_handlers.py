@@ -1,9 +1,14 @@
 """
 Общие обработчики команд (для всех пользователей)
 """
-from database.queries import get_or_create_player, increment_message_count
+from database.connection import unit_of_work
+from database.queries import get_or_create_player
 from keyboards.vk_keyboards import get_main_menu_keyboard, get_admin_menu_keyboard
 from middleware.auth import is_admin
+from middleware.context import get_player
+from services.profile_cache import get_user_profile
+from services.xp_buffer import xp_buffer
+from services.leaderboard import leaderboard
 from utils.formatters import format_level_up
 from utils.notifications import send_notification
 import states
@@ -11,13 +16,17 @@ import states
 
 def handle_start(vk, event, session):
     """Обработка команды /start или 'начать'"""
-    # Получение информации о пользователе
-    user_info = vk.users.get(user_ids=event.user_id)[0]
+    # Получение информации о пользователе (из кэша профилей)
+    user_info = get_user_profile(vk, event.user_id)
     first_name = user_info['first_name']
     last_name = user_info['last_name']
     
     # Создание/получение профиля
-    player = get_or_create_player(session, event.user_id, first_name, last_name)
+    player = get_player(session, event.user_id)
+    if player is None:
+        with unit_of_work(session):
+            player = get_or_create_player(session, event.user_id, first_name, last_name)
+    leaderboard.ensure(player)
     
     # Приветствие
     if is_admin(event.user_id):
@@ -111,15 +120,18 @@ def handle_cancel(vk, event, session):
 
 def track_message(vk, event, session):
     """Отслеживание сообщений для начисления опыта"""
-    player = get_or_create_player(
-        session,
-        event.user_id,
-        "Игрок",  # Будет обновлено при /start
-        ""
-    )
+    player = get_player(session, event.user_id)
+    if player is None:
+        with unit_of_work(session):
+            player = get_or_create_player(
+                session,
+                event.user_id,
+                "Игрок",  # Будет обновлено при /start
+                ""
+            )
     
-    # Начисление опыта за сообщение
-    level_up, new_level = increment_message_count(session, player.id)
+    # Начисление опыта за сообщение (запись в БД — пакетно, в фоне)
+    level_up, new_level = xp_buffer.add_message(player)
     
     # Уведомление о повышении уровня
     if level_up:
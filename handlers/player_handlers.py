@@ -1,11 +1,13 @@
 """
 Обработчики команд игрока
 """
+from datetime import datetime
+
+from database.connection import unit_of_work
+from database.read_queries import get_history_page
 from database.queries import (
-    get_player_by_vk_id,
-    get_player_transactions,
-    get_top_players,
     get_player_achievements,
+    get_player_stats,
     get_global_stats
 )
 from keyboards.vk_keyboards import (
@@ -13,6 +15,7 @@ from keyboards.vk_keyboards import (
     get_confirmation_keyboard,
     get_amount_keyboard,
     get_history_filter_keyboard,
+    get_history_page_keyboard,
     get_settings_keyboard
 )
 from utils.formatters import (
@@ -23,17 +26,21 @@ from utils.formatters import (
 )
 from utils.validators import validate_amount, validate_vk_id
 from services.transaction_service import transfer_chilliki
-from services.achievement_service import check_achievements
+from services.leaderboard import leaderboard
 from middleware.auth import require_not_banned
+from middleware.context import get_player
 from middleware.rate_limiter import rate_limit
 import states
 
+# Записей на странице истории
+HISTORY_PAGE_SIZE = 10
+
 
 @require_not_banned
 @rate_limit
 def handle_balance(vk, event, session):
     """Просмотр баланса и профиля"""
-    player = get_player_by_vk_id(session, event.user_id)
+    player = get_player(session, event.user_id)
     
     if not player:
         vk.messages.send(
@@ -85,7 +92,7 @@ def handle_transfer_receiver(vk, event, session, receiver_input):
         return
     
     # Проверка существования получателя
-    receiver = get_player_by_vk_id(session, receiver_vk_id)
+    receiver = get_player(session, receiver_vk_id)
     if not receiver:
         vk.messages.send(
             user_id=event.user_id,
@@ -122,8 +129,8 @@ def handle_transfer_amount(vk, event, session, amount_input):
     
     # Получение данных
     receiver_vk_id = states.get_state_data(event.user_id, 'receiver_vk_id')
-    sender = get_player_by_vk_id(session, event.user_id)
-    receiver = get_player_by_vk_id(session, receiver_vk_id)
+    sender = get_player(session, event.user_id)
+    receiver = get_player(session, receiver_vk_id)
     
     # Проверка баланса
     if sender.balance < amount:
@@ -171,11 +178,6 @@ def handle_transfer_confirm(vk, event, session):
     # Очистка состояния
     states.clear_state(event.user_id)
     
-    # Проверка достижений
-    if success:
-        sender = get_player_by_vk_id(session, event.user_id)
-        check_achievements(session, vk, sender)
-    
     vk.messages.send(
         user_id=event.user_id,
         message=message,
@@ -200,45 +202,117 @@ def handle_history(vk, event, session):
 
 @require_not_banned
 def handle_history_filter(vk, event, session, filter_type):
-    """Обработка фильтра истории"""
-    player = get_player_by_vk_id(session, event.user_id)
-    
+    """Обработка фильтра истории: первая страница"""
     # Маппинг фильтров
     filter_map = {
-        '➡️ Переводы': 'переводы',
+        '➡️ переводы': 'переводы',
         'переводы': 'переводы',
-        '🛒 Покупки': 'покупки',
+        '🛒 покупки': 'покупки',
         'покупки': 'покупки',
-        '👑 Админ': 'админ',
+        '👑 админ': 'админ',
         'админ': 'админ',
-        '📋 Все': None,
+        '📋 все': None,
         'все': None
     }
     
     transaction_filter = filter_map.get(filter_type.lower())
     
-    # Получение транзакций
-    transactions = get_player_transactions(session, player.id, limit=10, transaction_filter=transaction_filter)
+    _send_history_page(vk, event, session, transaction_filter, page=1)
+
+
+@require_not_banned
+def handle_history_page(vk, event, session, action):
+    """Листание истории: курсоры страницы хранятся в состоянии"""
+    _, data = states.get_state(event.user_id)
+    
+    if 'меню' in action:
+        states.clear_state(event.user_id)
+        vk.messages.send(
+            user_id=event.user_id,
+            message="📋 Главное меню",
+            keyboard=get_main_menu_keyboard(),
+            random_id=0
+        )
+        return
+    
+    transaction_filter = data.get('filter')
+    page = data.get('page', 1)
     
-    # Форматирование
-    history_msg = format_transaction_history(transactions, player.id)
+    if 'старее' in action and data.get('oldest'):
+        _send_history_page(vk, event, session, transaction_filter, page=page + 1, before=_parse_cursor(data['oldest']))
+    elif 'новее' in action and data.get('newest') and page > 1:
+        _send_history_page(vk, event, session, transaction_filter, page=page - 1, after=_parse_cursor(data['newest']))
+    else:
+        _send_history_page(vk, event, session, transaction_filter, page=1)
+
+
+def _send_history_page(vk, event, session, transaction_filter, page, before=None, after=None):
+    """Показать страницу истории и запомнить её границы"""
+    player = get_player(session, event.user_id)
+    
+    transactions, has_more = get_history_page(
+        session,
+        player.id,
+        limit=HISTORY_PAGE_SIZE,
+        transaction_filter=transaction_filter,
+        before=before,
+        after=after
+    )
     
-    states.clear_state(event.user_id)
+    # has_more относится к направлению запроса: листая к новым, старые страницы точно есть
+    has_newer = page > 1
+    has_older = True if after is not None else has_more
+    
+    if not transactions:
+        states.clear_state(event.user_id)
+        vk.messages.send(
+            user_id=event.user_id,
+            message=format_transaction_history(transactions, player.id),
+            keyboard=get_main_menu_keyboard(),
+            random_id=0
+        )
+        return
+    
+    states.set_state(
+        event.user_id,
+        states.State.BROWSING_HISTORY,
+        filter=transaction_filter,
+        page=page,
+        newest=_format_cursor(transactions[0]),
+        oldest=_format_cursor(transactions[-1])
+    )
     
     vk.messages.send(
         user_id=event.user_id,
-        message=history_msg,
-        keyboard=get_main_menu_keyboard(),
+        message=format_transaction_history(transactions, player.id, page=page),
+        keyboard=get_history_page_keyboard(has_newer=has_newer, has_older=has_older),
         random_id=0
     )
 
 
+def _format_cursor(transaction):
+    """Курсор страницы (created_at, id) в виде, пригодном для хранения в состоянии"""
+    return [transaction.created_at.isoformat(), transaction.id]
+
+
+def _parse_cursor(cursor):
+    created_at, transaction_id = cursor
+    return datetime.fromisoformat(created_at), transaction_id
+
+
 @require_not_banned
 @rate_limit
 def handle_leaderboard(vk, event, session):
-    """Таблица лидеров"""
-    top_players = get_top_players(session, limit=10)
-    leaderboard_msg = format_leaderboard(top_players)
+    """Таблица лидеров (из индекса в памяти)"""
+    leaderboard_msg = format_leaderboard(leaderboard.top(10))
+    
+    player = get_player(session, event.user_id)
+    position = leaderboard.rank(player.id) if player else None
+    if position:
+        rank, total = position
+        leaderboard_msg += f"\n📍 Вы на {format_balance(rank)} месте из {format_balance(total)}"
+    elif player and player.hide_balance:
+        leaderboard_msg += "\n👁️ Ваш баланс скрыт из таблицы"
     
     vk.messages.send(
         user_id=event.user_id,
@@ -252,32 +326,22 @@ def handle_leaderboard(vk, event, session):
 @rate_limit
 def handle_stats(vk, event, session):
     """Статистика игрока"""
-    player = get_player_by_vk_id(session, event.user_id)
-    transactions = get_player_transactions(session, player.id, limit=1000)
+    player = get_player(session, event.user_id)
+    stats = get_player_stats(session, player.id)
     achievements = get_player_achievements(session, player.id)
     
-    # Подсчёт статистики
-    total_received = sum(t.amount for t in transactions if t.to_player_id == player.id)
-    total_spent = sum(t.amount for t in transactions if t.from_player_id == player.id)
-    total_transfers = len([t for t in transactions if t.type.value == 'transfer' and t.from_player_id == player.id])
-    total_purchases = len([t for t in transactions if t.type.value == 'purchase'])
-    
-    # Самая крупная покупка
-    purchases = [t for t in transactions if t.type.value == 'purchase']
-    largest_purchase = max(purchases, key=lambda t: t.amount) if purchases else None
-    
     stats_msg = f"📊 Статистика: {player.first_name} {player.last_name}\n\n"
     stats_msg += f"💰 Текущий баланс: {format_balance(player.balance)} чил.\n"
     stats_msg += f"⭐ Уровень: {player.level}\n"
     stats_msg += f"✨ Опыт: {format_balance(player.experience)} XP\n"
     stats_msg += f"💬 Сообщений: {format_balance(player.messages_count)}\n\n"
-    stats_msg += f"📈 Всего получено: {format_balance(total_received)} чил.\n"
-    stats_msg += f"📉 Всего потрачено: {format_balance(total_spent)} чил.\n"
-    stats_msg += f"➡️ Переводов: {total_transfers}\n"
-    stats_msg += f"🛒 Покупок: {total_purchases}\n"
+    stats_msg += f"📈 Всего получено: {format_balance(stats.total_received if stats else 0)} чил.\n"
+    stats_msg += f"📉 Всего потрачено: {format_balance(stats.total_spent if stats else 0)} чил.\n"
+    stats_msg += f"➡️ Переводов: {stats.transfer_count if stats else 0}\n"
+    stats_msg += f"🛒 Покупок: {stats.purchase_count if stats else 0}\n"
     
-    if largest_purchase:
-        stats_msg += f"💎 Крупнейшая покупка: {format_balance(largest_purchase.amount)} чил.\n"
+    if stats and stats.largest_purchase:
+        stats_msg += f"💎 Крупнейшая покупка: {format_balance(stats.largest_purchase)} чил.\n"
     
     stats_msg += f"\n🏆 Достижений: {len(achievements)}"
     
@@ -293,7 +357,7 @@ def handle_stats(vk, event, session):
 @rate_limit
 def handle_settings(vk, event, session):
     """Настройки"""
-    player = get_player_by_vk_id(session, event.user_id)
+    player = get_player(session, event.user_id)
     
     settings_msg = "⚙️ Настройки\n\n"
     settings_msg += f"🔔 Уведомления: {'Включены' if player.notifications_enabled else 'Выключены'}\n"
@@ -310,9 +374,9 @@ def handle_settings(vk, event, session):
 @require_not_banned
 def handle_toggle_notifications(vk, event, session):
     """Переключение уведомлений"""
-    player = get_player_by_vk_id(session, event.user_id)
-    player.notifications_enabled = not player.notifications_enabled
-    session.commit()
+    player = get_player(session, event.user_id)
+    with unit_of_work(session):
+        player.notifications_enabled = not player.notifications_enabled
     
     status = "включены" if player.notifications_enabled else "выключены"
     vk.messages.send(
@@ -326,9 +390,10 @@ def handle_toggle_notifications(vk, event, session):
 @require_not_banned
 def handle_toggle_hide_balance(vk, event, session):
     """Переключение скрытия баланса"""
-    player = get_player_by_vk_id(session, event.user_id)
-    player.hide_balance = not player.hide_balance
-    session.commit()
+    player = get_player(session, event.user_id)
+    with unit_of_work(session):
+        player.hide_balance = not player.hide_balance
+    leaderboard.update(player)
     
     status = "скрыт" if player.hide_balance else "виден"
     vk.messages.send(
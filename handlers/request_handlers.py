@@ -1,8 +1,9 @@
 """
 Обработчики запросов на покупку способностей/предметов
 """
-from database.queries import create_purchase_request, get_player_by_vk_id
-from database.models import PurchaseRequest
+from database.connection import unit_of_work
+from database.queries import create_purchase_request
+from database.models import Player, PurchaseRequest
 from keyboards.vk_keyboards import (
     get_category_keyboard,
     get_confirmation_keyboard,
@@ -12,6 +13,7 @@ from services.transaction_service import purchase_item
 from utils.validators import parse_price_from_admin
 from utils.notifications import notify_purchase_approved, notify_purchase_rejected
 from middleware.auth import require_not_banned, is_admin
+from middleware.context import get_player
 from middleware.rate_limiter import rate_limit, hourly_limit
 import states
 import config
@@ -74,7 +76,7 @@ def handle_purchase_category(vk, event, session, category):
 @require_not_banned
 def handle_purchase_request(vk, event, session, description):
     """Обработка описания запроса"""
-    player = get_player_by_vk_id(session, event.user_id)
+    player = get_player(session, event.user_id)
     category = states.get_state_data(event.user_id, 'category')
     
     # Формирование полного описания
@@ -84,7 +86,8 @@ def handle_purchase_request(vk, event, session, description):
         full_description = description
     
     # Создание запроса
-    purchase_request = create_purchase_request(session, player.id, full_description)
+    with unit_of_work(session):
+        purchase_request = create_purchase_request(session, player.id, full_description)
     
     # Уведомление игрока
     vk.messages.send(
@@ -139,15 +142,24 @@ def handle_admin_price_response(vk, event, session, text):
         )
         return
     
-    player = get_player_by_vk_id(session, pending_request.player_id)
+    # player_id — внутренний id игрока, а не VK ID: загрузка по первичному ключу
+    player = session.get(Player, pending_request.player_id)
+    
+    if not player:
+        vk.messages.send(
+            user_id=event.user_id,
+            message="❌ Игрок, отправивший запрос, не найден",
+            random_id=0
+        )
+        return
     
     # Проверка на отклонение
     if text.lower().startswith('отклонено:') or text.lower().startswith('отклонить:'):
         reason = text.split(':', 1)[1].strip() if ':' in text else "Не указана"
         
-        pending_request.status = 'rejected'
-        pending_request.admin_response = reason
-        session.commit()
+        with unit_of_work(session):
+            pending_request.status = 'rejected'
+            pending_request.admin_response = reason
         
         # Уведомление игрока
         notify_purchase_rejected(vk, session, player.vk_id, pending_request.item_description, reason)
@@ -168,9 +180,9 @@ def handle_admin_price_response(vk, event, session, text):
         return
     
     # Установка цены
-    pending_request.price = price
-    pending_request.status = 'approved'
-    session.commit()
+    with unit_of_work(session):
+        pending_request.price = price
+        pending_request.status = 'approved'
     
     # Проверка баланса игрока
     if player.balance < price:
@@ -255,24 +267,19 @@ def handle_purchase_confirm(vk, event, session):
         states.clear_state(event.user_id)
         return
     
-    player = get_player_by_vk_id(session, event.user_id)
+    player = get_player(session, event.user_id)
     
-    # Выполнение покупки
+    # Выполнение покупки (запрос отмечается выполненным в том же коммите)
     success, message = purchase_item(
         session,
         vk,
         player.vk_id,
         purchase_request.item_description,
-        purchase_request.price
+        purchase_request.price,
+        purchase_request=purchase_request
     )
     
     if success:
-        purchase_request.status = 'completed'
-        session.commit()
-        
-        # Проверка достижений
-        check_achievements(session, vk, player)
-        
         # Уведомление администраторов
         admin_msg = f"✅ Покупка завершена\n\n"
         admin_msg += f"Игрок: {player.first_name} {player.last_name}\n"
@@ -112,6 +112,22 @@ def get_history_filter_keyboard():
     return keyboard.get_keyboard()
 
 
+def get_history_page_keyboard(has_newer=False, has_older=False):
+    """Навигация по страницам истории"""
+    keyboard = VkKeyboard(one_time=False)
+    
+    if has_newer:
+        keyboard.add_button('⬅️ Новее', color=VkKeyboardColor.PRIMARY)
+    if has_older:
+        keyboard.add_button('Старее ➡️', color=VkKeyboardColor.PRIMARY)
+    if has_newer or has_older:
+        keyboard.add_line()
+    
+    keyboard.add_button('🔙 В меню', color=VkKeyboardColor.SECONDARY)
+    
+    return keyboard.get_keyboard()
+
+
 def get_settings_keyboard(notifications_on=True):
     """Клавиатура настроек"""
     keyboard = VkKeyboard(one_time=False)
@@ -0,0 +1,26 @@
+"""
+Адаптер синхронных обработчиков для asyncio-режима
+"""
+from functools import wraps
+
+from services.async_vk import GreenletVkApi
+from services.outbox import outbox
+
+
+def async_handler(func):
+    """
+    Декоратор: превращает обработчик (vk, event, session) в асинхронный
+    с сигнатурой (async_vk, event, async_session).
+    
+    Обработчик выполняется через AsyncSession.run_sync() в гринлете:
+    запросы к БД и вызовы VK API не блокируют цикл событий и не
+    требуют отдельного потока на каждое событие. Сообщения уходят
+    через очередь исходящих и не ждут ответа VK.
+    """
+    @wraps(func)
+    async def wrapper(vk, event, session, *args, **kwargs):
+        sync_vk = outbox.wrap(GreenletVkApi(vk))
+        return await session.run_sync(
+            lambda sync_session: func(sync_vk, event, sync_session, *args, **kwargs)
+        )
+    return wrapper
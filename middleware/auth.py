@@ -2,7 +2,7 @@
 Middleware для проверки прав доступа
 """
 import config
-from database.queries import get_player_by_vk_id
+from middleware.context import get_player
 
 
 def is_admin(vk_id):
@@ -12,7 +12,7 @@ def is_admin(vk_id):
 
 def check_player_banned(session, vk_id):
     """Проверка, заблокирован ли игрок"""
-    player = get_player_by_vk_id(session, vk_id)
+    player = get_player(session, vk_id)
     if player and player.is_banned:
         return True, player.ban_reason
     return False, None
@@ -0,0 +1,68 @@
+"""
+Контекст обработки одного события
+Игроки загружаются из БД один раз и переиспользуются middleware, обработчиками и уведомлениями
+"""
+from database.queries import get_player_by_vk_id
+
+# Ключ контекста в session.info
+CONTEXT_KEY = 'request_context'
+
+
+class RequestContext:
+    """Данные, загруженные в рамках одного входящего события"""
+    
+    def __init__(self, session, vk_id, player=None):
+        self.session = session
+        self.vk_id = vk_id
+        
+        # vk_id -> Player (или None, если игрока нет)
+        self._players = {}
+        if player is not None:
+            self._players[vk_id] = player
+    
+    @property
+    def player(self):
+        """Игрок, отправивший сообщение"""
+        return self.get_player(self.vk_id)
+    
+    def get_player(self, vk_id):
+        """Игрок по VK ID (запрос к БД — только при первом обращении)"""
+        if vk_id not in self._players:
+            self._players[vk_id] = get_player_by_vk_id(self.session, vk_id)
+        return self._players[vk_id]
+    
+    def remember_player(self, player):
+        """Запомнить игрока, загруженного или созданного в другом месте"""
+        self._players[player.vk_id] = player
+    
+    def forget_player(self, vk_id):
+        """Сбросить игрока (например, после удаления)"""
+        self._players.pop(vk_id, None)
+
+
+def begin_request(session, vk_id, player=None):
+    """Создать контекст события и привязать его к сессии"""
+    context = RequestContext(session, vk_id, player)
+    session.info[CONTEXT_KEY] = context
+    
+    # Загруженные объекты остаются валидными после commit внутри события:
+    # фабрики сессий создаются с expire_on_commit=False
+    return context
+
+
+def end_request(session):
+    """Завершить контекст события"""
+    session.info.pop(CONTEXT_KEY, None)
+
+
+def get_context(session):
+    """Текущий контекст события (или None вне обработки события)"""
+    return session.info.get(CONTEXT_KEY)
+
+
+def get_player(session, vk_id):
+    """Игрок по VK ID — из контекста события, если он есть"""
+    context = get_context(session)
+    if context is None:
+        return get_player_by_vk_id(session, vk_id)
+    return context.get_player(vk_id)
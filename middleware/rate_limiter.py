@@ -3,32 +3,49 @@ Rate Limiter - защита от спама
 """
 from datetime import datetime, timedelta
 from collections import defaultdict
+import threading
 import config
 
 # In-memory хранилище для rate limiting
 user_requests = defaultdict(list)
 user_hourly_requests = defaultdict(list)
 
+# Проверка и запись запроса должны быть атомарными при параллельной обработке
+_lock = threading.Lock()
+
+
+def use_shared_storage(shared_requests, shared_hourly_requests):
+    """
+    Подключить общие хранилища (multiprocessing.Manager().dict())
+    для режима нескольких процессов
+    """
+    global user_requests, user_hourly_requests
+    user_requests = shared_requests
+    user_hourly_requests = shared_hourly_requests
+
 
 def check_rate_limit(vk_id):
     """
     Проверка rate limit для пользователя
     Возвращает (allowed, wait_time)
     """
-    now = datetime.now()
-    
-    # Очистка старых запросов (старше RATE_LIMIT_SECONDS)
-    cutoff_time = now - timedelta(seconds=config.RATE_LIMIT_SECONDS)
-    user_requests[vk_id] = [t for t in user_requests[vk_id] if t > cutoff_time]
-    
-    # Проверка лимита по секундам
-    if len(user_requests[vk_id]) >= 1:
-        wait_time = config.RATE_LIMIT_SECONDS - (now - user_requests[vk_id][0]).total_seconds()
-        return False, max(0, wait_time)
-    
-    # Добавление текущего запроса
-    user_requests[vk_id].append(now)
-    return True, 0
+    with _lock:
+        now = datetime.now()
+        
+        # Очистка старых запросов (старше RATE_LIMIT_SECONDS)
+        cutoff_time = now - timedelta(seconds=config.RATE_LIMIT_SECONDS)
+        requests = [t for t in user_requests.get(vk_id, []) if t > cutoff_time]
+        
+        # Проверка лимита по секундам
+        if len(requests) >= 1:
+            user_requests[vk_id] = requests
+            wait_time = config.RATE_LIMIT_SECONDS - (now - requests[0]).total_seconds()
+            return False, max(0, wait_time)
+        
+        # Добавление текущего запроса (запись целиком — хранилище может быть общим)
+        requests.append(now)
+        user_requests[vk_id] = requests
+        return True, 0
 
 
 def check_hourly_limit(vk_id, limit=None):
@@ -39,20 +56,23 @@ def check_hourly_limit(vk_id, limit=None):
     if limit is None:
         limit = config.MAX_REQUESTS_PER_HOUR
     
-    now = datetime.now()
-    
-    # Очистка старых запросов (старше 1 часа)
-    cutoff_time = now - timedelta(hours=1)
-    user_hourly_requests[vk_id] = [t for t in user_hourly_requests[vk_id] if t > cutoff_time]
-    
-    # Проверка лимита
-    if len(user_hourly_requests[vk_id]) >= limit:
-        return False, 0
-    
-    # Добавление текущего запроса
-    user_hourly_requests[vk_id].append(now)
-    remaining = limit - len(user_hourly_requests[vk_id])
-    return True, remaining
+    with _lock:
+        now = datetime.now()
+        
+        # Очистка старых запросов (старше 1 часа)
+        cutoff_time = now - timedelta(hours=1)
+        requests = [t for t in user_hourly_requests.get(vk_id, []) if t > cutoff_time]
+        
+        # Проверка лимита
+        if len(requests) >= limit:
+            user_hourly_requests[vk_id] = requests
+            return False, 0
+        
+        # Добавление текущего запроса
+        requests.append(now)
+        user_hourly_requests[vk_id] = requests
+        remaining = limit - len(requests)
+        return True, remaining
 
 
 def rate_limit(func):
@@ -1,145 +1,237 @@
 """
 Система достижений
+Правила проверяются по событиям транзакций и инкрементальным счётчикам (player_stats),
+уже полученные достижения кэшируются и не проверяются повторно
 """
-from database.queries import add_achievement, get_player_transactions
-from database.models import TransactionType
+import threading
+
+from database.connection import unit_of_work
+from database.queries import (
+    get_player_stats,
+    get_player_achievement_types,
+    award_achievements,
+    award_achievement_to_all
+)
+from database.models import Achievement, TransactionType
 from utils.formatters import format_achievement_earned
-from utils.notifications import send_notification
+from utils.notifications import send_notification, send_bulk_notification
 
 
-# Определение достижений
+# Определение достижений: metric — счётчик, threshold — порог (metric >= threshold)
+# Счётчики: balance (баланс игрока), tx_count, purchase_count, transfer_total (из player_stats)
 ACHIEVEMENTS = {
     'first_purchase': {
         'title': 'Первая покупка',
         'description': 'Совершили первую покупку',
-        'icon': '🏆'
+        'icon': '🏆',
+        'metric': 'purchase_count',
+        'threshold': 1
     },
     'generous': {
         'title': 'Щедрость',
         'description': 'Перевели более 1000 чилликов',
-        'icon': '💸'
+        'icon': '💸',
+        'metric': 'transfer_total',
+        'threshold': 1000
     },
     'accumulator': {
         'title': 'Накопитель',
         'description': 'Достигли 500 чилликов на балансе',
-        'icon': '🔥'
+        'icon': '🔥',
+        'metric': 'balance',
+        'threshold': 500
     },
     'activist': {
         'title': 'Активист',
         'description': 'Совершили 100 транзакций',
-        'icon': '⚡'
+        'icon': '⚡',
+        'metric': 'tx_count',
+        'threshold': 100
     },
     'rich': {
         'title': 'Богач',
         'description': 'Достигли 1000 чилликов на балансе',
-        'icon': '💎'
+        'icon': '💎',
+        'metric': 'balance',
+        'threshold': 1000
     },
     'mega_generous': {
         'title': 'Мега-щедрость',
         'description': 'Перевели более 5000 чилликов',
-        'icon': '🌟'
+        'icon': '🌟',
+        'metric': 'transfer_total',
+        'threshold': 5000
     }
 }
 
+# Счётчики, которые меняет любая транзакция
+COMMON_METRICS = {'balance', 'tx_count'}
 
-def check_achievements(session, vk, player):
-    """
-    Проверка и начисление достижений
-    Возвращает список новых достижений
-    """
-    new_achievements = []
-    
-    # Получение транзакций игрока
-    transactions = get_player_transactions(session, player.id, limit=1000)
-    
-    # Подсчёт статистики
-    total_transfers = sum(t.amount for t in transactions if t.type == TransactionType.TRANSFER and t.from_player_id == player.id)
-    total_purchases = len([t for t in transactions if t.type == TransactionType.PURCHASE])
-    total_transactions_count = len(transactions)
-    
-    # Проверка достижений
-    
-    # Первая покупка
-    if total_purchases >= 1:
-        ach = add_achievement(
-            session,
-            player.id,
-            'first_purchase',
-            ACHIEVEMENTS['first_purchase']['title'],
-            ACHIEVEMENTS['first_purchase']['description'],
-            ACHIEVEMENTS['first_purchase']['icon']
-        )
-        if ach:
-            new_achievements.append(ach)
+# Счётчики, которые меняет исходящая транзакция определённого типа
+OUTGOING_METRICS = {
+    TransactionType.TRANSFER: {'transfer_total'},
+    TransactionType.PURCHASE: {'purchase_count'}
+}
+
+
+def affected_metrics(transaction_type, outgoing):
+    """Какие счётчики участника меняет транзакция"""
+    metrics = set(COMMON_METRICS)
+    if outgoing:
+        metrics |= OUTGOING_METRICS.get(transaction_type, set())
+    return metrics
+
+
+class AchievementEngine:
+    """Проверка правил достижений с кэшем полученных достижений"""
     
-    # Щедрость (1000+ переводов)
-    if total_transfers >= 1000:
-        ach = add_achievement(
-            session,
-            player.id,
-            'generous',
-            ACHIEVEMENTS['generous']['title'],
-            ACHIEVEMENTS['generous']['description'],
-            ACHIEVEMENTS['generous']['icon']
-        )
-        if ach:
-            new_achievements.append(ach)
+    def __init__(self, rules=None):
+        self.rules = rules if rules is not None else ACHIEVEMENTS
+        
+        # player_id -> set(achievement_type), уже полученные
+        self._earned = {}
+        self._lock = threading.Lock()
     
-    # Мега-щедрость (5000+ переводов)
-    if total_transfers >= 5000:
-        ach = add_achievement(
-            session,
-            player.id,
-            'mega_generous',
-            ACHIEVEMENTS['mega_generous']['title'],
-            ACHIEVEMENTS['mega_generous']['description'],
-            ACHIEVEMENTS['mega_generous']['icon']
-        )
-        if ach:
-            new_achievements.append(ach)
+    def on_transaction(self, session, vk, transaction_type, from_player=None, to_player=None):
+        """
+        Событие транзакции: проверить правила участников по изменившимся счётчикам
+        Вызывается после коммита транзакции (выдача достижений — отдельная единица работы)
+        Возвращает список новых достижений
+        """
+        new_achievements = []
+        
+        # Транзакция уже закоммичена: ошибка достижений не должна её «отменять» для вызывающего
+        try:
+            if from_player:
+                new_achievements += self.evaluate(session, vk, from_player, affected_metrics(transaction_type, True))
+            if to_player:
+                new_achievements += self.evaluate(session, vk, to_player, affected_metrics(transaction_type, False))
+        except Exception as e:
+            print(f"❌ Ошибка проверки достижений: {e}")
+        
+        return new_achievements
     
-    # Накопитель (500+ баланс)
-    if player.balance >= 500:
-        ach = add_achievement(
-            session,
-            player.id,
-            'accumulator',
-            ACHIEVEMENTS['accumulator']['title'],
-            ACHIEVEMENTS['accumulator']['description'],
-            ACHIEVEMENTS['accumulator']['icon']
-        )
-        if ach:
-            new_achievements.append(ach)
+    def evaluate(self, session, vk, player, metrics=None):
+        """
+        Проверить правила игрока (только по указанным счётчикам, None — все)
+        Возвращает список новых достижений
+        """
+        earned = self._get_earned(session, player.id)
+        
+        candidates = [
+            (achievement_type, rule)
+            for achievement_type, rule in self.rules.items()
+            if achievement_type not in earned and (metrics is None or rule['metric'] in metrics)
+        ]
+        if not candidates:
+            return []
+        
+        # Счётчики player_stats читаются одним запросом и только если они нужны
+        stats = None
+        if any(rule['metric'] != 'balance' for _, rule in candidates):
+            stats = get_player_stats(session, player.id)
+        
+        entries = []
+        for achievement_type, rule in candidates:
+            if self._metric_value(player, stats, rule['metric']) >= rule['threshold']:
+                entries.append((achievement_type, rule['title'], rule['description'], rule['icon']))
+        
+        if not entries:
+            return []
+        
+        with unit_of_work(session):
+            new_achievements = award_achievements(session, player.id, entries)
+        
+        with self._lock:
+            self._earned.setdefault(player.id, set()).update(entry[0] for entry in entries)
+        
+        # Отправка уведомлений о новых достижениях
+        for ach in new_achievements:
+            msg = format_achievement_earned(ach)
+            send_notification(vk, player.vk_id, msg)
+        
+        return new_achievements
     
-    # Богач (1000+ баланс)
-    if player.balance >= 1000:
-        ach = add_achievement(
-            session,
-            player.id,
-            'rich',
-            ACHIEVEMENTS['rich']['title'],
-            ACHIEVEMENTS['rich']['description'],
-            ACHIEVEMENTS['rich']['icon']
-        )
-        if ach:
-            new_achievements.append(ach)
+    def backfill(self, session, vk, metrics=None, achievement_types=None):
+        """
+        Выдать достижения всем игрокам, которые уже выполнили условие
+        (новые правила, массовые начисления). Одно правило — один запрос к БД,
+        уведомления уходят пачками по 100 получателей
+        metrics / achievement_types — ограничить проверяемые правила
+        Возвращает {achievement_type: количество выданных}
+        """
+        results = {}
+        
+        for achievement_type, rule in self.rules.items():
+            if metrics is not None and rule['metric'] not in metrics:
+                continue
+            if achievement_types is not None and achievement_type not in achievement_types:
+                continue
+            
+            # Коммит на правило: уведомления уходят только о сохранённых достижениях
+            with unit_of_work(session):
+                awarded = award_achievement_to_all(
+                    session,
+                    achievement_type,
+                    rule['title'],
+                    rule['description'],
+                    rule['icon'],
+                    rule['metric'],
+                    rule['threshold']
+                )
+            results[achievement_type] = len(awarded)
+            
+            if not awarded:
+                continue
+            
+            with self._lock:
+                for row in awarded:
+                    earned = self._earned.get(row.id)
+                    if earned is not None:
+                        earned.add(achievement_type)
+            
+            msg = format_achievement_earned(
+                Achievement(title=rule['title'], description=rule['description'], icon=rule['icon'])
+            )
+            recipients = [row.vk_id for row in awarded if row.notifications_enabled]
+            send_bulk_notification(vk, recipients, msg)
+            
+            print(f"🏆 Достижение '{achievement_type}' выдано игрокам: {len(awarded)}")
+        
+        return results
     
-    # Активист (100+ транзакций)
-    if total_transactions_count >= 100:
-        ach = add_achievement(
-            session,
-            player.id,
-            'activist',
-            ACHIEVEMENTS['activist']['title'],
-            ACHIEVEMENTS['activist']['description'],
-            ACHIEVEMENTS['activist']['icon']
-        )
-        if ach:
-            new_achievements.append(ach)
+    def forget(self, player_id):
+        """Сбросить кэш игрока (например, после удаления или внешней выдачи достижений)"""
+        with self._lock:
+            self._earned.pop(player_id, None)
     
-    # Отправка уведомлений о новых достижениях
-    for ach in new_achievements:
-        msg = format_achievement_earned(ach)
-        send_notification(vk, player.vk_id, msg)
+    def _get_earned(self, session, player_id):
+        with self._lock:
+            earned = self._earned.get(player_id)
+        
+        if earned is None:
+            earned = get_player_achievement_types(session, player_id)
+            with self._lock:
+                earned = self._earned.setdefault(player_id, earned)
+        
+        return set(earned)
     
-    return new_achievements
\ No newline at end of file
+    @staticmethod
+    def _metric_value(player, stats, metric):
+        if metric == 'balance':
+            return player.balance
+        if stats is None:
+            return 0
+        return getattr(stats, metric)
+
+
+# Общий движок достижений процесса
+achievement_engine = AchievementEngine()
+
+
+def check_achievements(session, vk, player):
+    """
+    Проверка всех правил достижений игрока
+    Возвращает список новых достижений
+    """
+    return achievement_engine.evaluate(session, vk, player)
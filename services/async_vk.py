@@ -0,0 +1,172 @@
+"""
+Асинхронный клиент VK API и LongPoll для asyncio-режима
+"""
+import asyncio
+
+import aiohttp
+from sqlalchemy.util import await_only
+from vk_api.longpoll import Event
+
+import config
+
+API_URL = 'https://api.vk.com/method/'
+API_VERSION = '5.92'  # Та же версия, что у vk_api.VkApi по умолчанию
+
+
+class AsyncVkApiError(Exception):
+    """Ошибка, возвращённая VK API"""
+    
+    def __init__(self, error):
+        self.error = error
+        self.code = error.get('error_code')
+        super().__init__(f"[{self.code}] {error.get('error_msg')}")
+
+
+class AsyncVkApi:
+    """
+    Асинхронные вызовы методов VK API.
+    Поддерживает тот же синтаксис, что vk_api: await vk.messages.send(...)
+    """
+    
+    def __init__(self, token, http_session):
+        self.token = token
+        self.http = http_session
+    
+    async def method(self, method, values=None):
+        """Вызов метода API"""
+        params = dict(values or {})
+        params['access_token'] = self.token
+        params['v'] = API_VERSION
+        
+        async with self.http.post(API_URL + method, data=params) as response:
+            payload = await response.json(content_type=None)
+        
+        if 'error' in payload:
+            raise AsyncVkApiError(payload['error'])
+        return payload['response']
+    
+    def __getattr__(self, name):
+        return _AsyncMethodGroup(self, name)
+
+
+class _AsyncMethodGroup:
+    """Группа методов: vk.messages, vk.users и т.д."""
+    
+    def __init__(self, api, group):
+        self._api = api
+        self._group = group
+    
+    def __getattr__(self, name):
+        method = f'{self._group}.{name}'
+        
+        def call(**values):
+            return self._api.method(method, values)
+        
+        return call
+
+
+class GreenletVkApi:
+    """
+    Синхронный фасад над AsyncVkApi для существующих обработчиков.
+    Работает внутри AsyncSession.run_sync(): вызов не блокирует поток,
+    а передаёт управление циклу событий до получения ответа.
+    """
+    
+    def __init__(self, async_api):
+        self._api = async_api
+    
+    def method(self, method, values=None):
+        return await_only(self._api.method(method, values))
+    
+    def wait_future(self, future):
+        """Дождаться concurrent.futures.Future, отдав управление циклу событий"""
+        return await_only(asyncio.wrap_future(future))
+    
+    def __getattr__(self, name):
+        return _GreenletMethodGroup(self._api, name)
+
+
+class _GreenletMethodGroup:
+    """Группа методов для GreenletVkApi"""
+    
+    def __init__(self, api, group):
+        self._api = api
+        self._group = group
+    
+    def __getattr__(self, name):
+        method = f'{self._group}.{name}'
+        
+        def call(**values):
+            return await_only(self._api.method(method, values))
+        
+        return call
+
+
+class AsyncVkLongPoll:
+    """Асинхронный LongPoll (тот же протокол, что у vk_api.longpoll.VkLongPoll)"""
+    
+    def __init__(self, api, http_session, wait=25, mode=234, group_id=None):
+        self.api = api
+        self.http = http_session
+        self.wait = wait
+        self.mode = mode
+        self.group_id = group_id or config.VK_GROUP_ID
+        
+        self.url = None
+        self.key = None
+        self.ts = None
+    
+    async def update_longpoll_server(self, update_ts=True):
+        """Получение адреса и ключа LongPoll-сервера"""
+        response = await self.api.method('messages.getLongPollServer', {
+            'lp_version': 3,
+            'group_id': self.group_id
+        })
+        self.key = response['key']
+        self.url = f"https://{response['server']}"
+        
+        if update_ts:
+            self.ts = response['ts']
+    
+    async def check(self):
+        """Получить события от сервера один раз"""
+        params = {
+            'act': 'a_check',
+            'key': self.key,
+            'ts': self.ts,
+            'wait': self.wait,
+            'mode': self.mode,
+            'version': 3
+        }
+        timeout = aiohttp.ClientTimeout(total=self.wait + 10)
+        
+        async with self.http.get(self.url, params=params, timeout=timeout) as response:
+            payload = await response.json(content_type=None)
+        
+        if 'failed' not in payload:
+            self.ts = payload['ts']
+            return [Event(raw) for raw in payload['updates']]
+        
+        if payload['failed'] == 1:
+            self.ts = payload['ts']
+        elif payload['failed'] == 2:
+            await self.update_longpoll_server(update_ts=False)
+        elif payload['failed'] == 3:
+            await self.update_longpoll_server()
+        
+        return []
+    
+    async def listen(self):
+        """Асинхронный генератор событий"""
+        await self.update_longpoll_server()
+        
+        while True:
+            try:
+                events = await self.check()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"⚠️ Ошибка LongPoll, переподключение: {e}")
+                await asyncio.sleep(1)
+                continue
+            
+            for event in events:
+                yield event
@@ -0,0 +1,220 @@
+"""
+Фоновые массовые рассылки
+Пачки по 100 получателей (peer_ids), ограничение частоты запросов,
+продолжение с последней подтверждённой пачки после перезапуска
+
+Рассылка отправляет своей сессией VK без встроенной задержки vk_api
+(~3 запроса/сек): темп задаёт только RateGovernor. BROADCAST_RPS не может
+превышать остаток лимита группы после очереди исходящих (VK_GROUP_RPS_LIMIT - OUTBOX_RPS)
+"""
+import queue
+import threading
+import time
+
+import vk_api
+from vk_api.exceptions import ApiError
+
+from database.connection import get_session, close_session, unit_of_work
+from database.models import Broadcast
+from database.queries import (
+    count_broadcast_recipients,
+    get_broadcast_recipients_after,
+    create_broadcast,
+    get_unfinished_broadcasts,
+    ack_broadcast_batch,
+    finish_broadcast
+)
+from utils.formatters import format_balance
+from utils.notifications import send_notification, BULK_SEND_SIZE, BULK_API_VERSION
+import config
+
+# Коды ошибок VK, после которых пачку стоит повторить: частота запросов, flood control, внутренняя ошибка
+RETRYABLE_ERROR_CODES = {6, 9, 10}
+MAX_BATCH_ATTEMPTS = 3
+
+# Как часто сообщать админу о прогрессе
+PROGRESS_REPORT_SECONDS = 30
+
+
+class RateGovernor:
+    """Не больше rps запросов в секунду (равномерно)"""
+    
+    def __init__(self, rps):
+        self.interval = 1.0 / rps
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def broadcast_rps_limit():
+    """Доля лимита группы, оставленная рассылкам"""
+    return max(1.0, config.VK_GROUP_RPS_LIMIT - config.OUTBOX_RPS)
+
+
+class BroadcastService:
+    """Очередь рассылок с одним фоновым исполнителем"""
+    
+    def __init__(self, rps=None):
+        self.rps = min(rps or config.BROADCAST_RPS, broadcast_rps_limit())
+        self.governor = RateGovernor(self.rps)
+        self._queue = queue.Queue()
+        self.vk = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def start(self, resume=True, token=None, rps=None):
+        """
+        Создать синхронный клиент VK, которым рассылает фоновый поток
+        resume — продолжить рассылки, прерванные остановкой бота
+        rps — переопределить темп (например, доля темпа рассылок для процесса-воркера)
+        """
+        if rps:
+            self.rps = rps
+            self.governor = RateGovernor(rps)
+        
+        vk_session = vk_api.VkApi(token=token or config.VK_GROUP_TOKEN)
+        # Темп задаёт RateGovernor, встроенная задержка vk_api срезала бы BROADCAST_RPS до ~3
+        vk_session.RPS_DELAY = 0
+        self.vk = vk_session.get_api()
+        
+        if config.BROADCAST_RPS > broadcast_rps_limit():
+            print(f"⚠️ BROADCAST_RPS={config.BROADCAST_RPS:g} больше остатка лимита группы, рассылки: {broadcast_rps_limit():g} запросов/сек")
+        
+        if resume:
+            self.resume()
+    
+    def start_broadcast(self, session, vk, admin_vk_id, message):
+        """
+        Создать рассылку и поставить её в очередь
+        Возвращает созданную рассылку
+        """
+        with unit_of_work(session):
+            total = count_broadcast_recipients(session)
+            broadcast = create_broadcast(session, admin_vk_id, message, total)
+        
+        # Фоновый поток читает рассылку своей сессией — только после коммита
+        self._submit(broadcast.id, vk)
+        return broadcast
+    
+    def resume(self):
+        """Продолжить рассылки, прерванные остановкой бота"""
+        session = get_session()
+        try:
+            broadcast_ids = [b.id for b in get_unfinished_broadcasts(session)]
+        finally:
+            close_session(session)
+        
+        for broadcast_id in broadcast_ids:
+            self._submit(broadcast_id)
+        
+        if broadcast_ids:
+            print(f"📢 Продолжение прерванных рассылок: {len(broadcast_ids)}")
+    
+    def _submit(self, broadcast_id, vk=None):
+        # В async-режиме клиент обработчика привязан к event loop — берём свой
+        self._queue.put((self.vk or vk, broadcast_id))
+        
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker_loop, name='broadcast', daemon=True)
+                self._thread.start()
+    
+    def _worker_loop(self):
+        while True:
+            vk, broadcast_id = self._queue.get()
+            try:
+                self._run(vk, broadcast_id)
+            except Exception as e:
+                print(f"❌ Ошибка рассылки #{broadcast_id}: {e}")
+    
+    def _run(self, vk, broadcast_id):
+        """Выполнение рассылки с места последней подтверждённой пачки"""
+        session = get_session()
+        
+        try:
+            broadcast = session.get(Broadcast, broadcast_id)
+            if broadcast is None or broadcast.status not in ('pending', 'running'):
+                return
+            
+            admin_id = broadcast.admin_id
+            total = broadcast.total_recipients
+            text = f"📢 Сообщение от администратора:\n\n{broadcast.message}"
+            last_player_id = broadcast.last_player_id
+            sent = broadcast.sent_count
+            failed = broadcast.failed_count
+            last_report = time.monotonic()
+            
+            while True:
+                batch = get_broadcast_recipients_after(session, last_player_id, BULK_SEND_SIZE)
+                if not batch:
+                    break
+                
+                # Детерминированный random_id: VK отбросит дубликаты при повторе пачки после сбоя
+                random_id = (broadcast_id * 1000003 + batch[0].id) % 2147483647
+                batch_sent, batch_failed = self._send_batch(vk, [row.vk_id for row in batch], text, random_id)
+                
+                last_player_id = batch[-1].id
+                sent += batch_sent
+                failed += batch_failed
+                with unit_of_work(session):
+                    ack_broadcast_batch(session, broadcast_id, last_player_id, batch_sent, batch_failed)
+                
+                if time.monotonic() - last_report >= PROGRESS_REPORT_SECONDS:
+                    last_report = time.monotonic()
+                    send_notification(
+                        vk,
+                        admin_id,
+                        f"📢 Рассылка #{broadcast_id}: {format_balance(sent + failed)} из {format_balance(total)}"
+                    )
+            
+            with unit_of_work(session):
+                finish_broadcast(session, broadcast_id)
+            
+            result_msg = f"✅ Рассылка #{broadcast_id} завершена\n\n"
+            result_msg += f"Отправлено: {sent}\n"
+            result_msg += f"Ошибок: {failed}"
+            send_notification(vk, admin_id, result_msg)
+        
+        finally:
+            close_session(session)
+    
+    def _send_batch(self, vk, vk_ids, text, random_id):
+        """
+        Отправка одной пачки с повтором при ограничениях частоты
+        Возвращает (sent, failed)
+        """
+        for attempt in range(1, MAX_BATCH_ATTEMPTS + 1):
+            self.governor.wait()
+            try:
+                response = vk.messages.send(
+                    peer_ids=','.join(str(vk_id) for vk_id in vk_ids),
+                    message=text,
+                    random_id=random_id,
+                    v=BULK_API_VERSION
+                )
+            except ApiError as e:
+                if e.code in RETRYABLE_ERROR_CODES and attempt < MAX_BATCH_ATTEMPTS:
+                    time.sleep(attempt)
+                    continue
+                print(f"❌ Ошибка отправки пачки рассылки: {e}")
+                return 0, len(vk_ids)
+            except Exception as e:
+                print(f"❌ Ошибка отправки пачки рассылки: {e}")
+                return 0, len(vk_ids)
+            
+            # Ответ — список результатов по каждому получателю
+            failed = sum(1 for item in response if isinstance(item, dict) and item.get('error'))
+            return len(vk_ids) - failed, failed
+        
+        return 0, len(vk_ids)
+
+
+# Общий сервис рассылок процесса
+broadcast_service = BroadcastService()
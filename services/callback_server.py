@@ -0,0 +1,136 @@
+"""
+Приём событий через VK Callback API (HTTP-вебхук)
+Альтернатива LongPoll: несколько экземпляров бота можно поставить за балансировщик
+"""
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hmac
+import json
+import threading
+
+import config
+from utils.events import MessageEvent
+
+# Последние обработанные event_id (VK повторяет запрос, если не получил 'ok')
+DEDUP_WINDOW = 10000
+
+
+class CallbackServer:
+    """HTTP-сервер Callback API, передающий сообщения в диспетчер событий"""
+    
+    def __init__(self, dispatcher, host=None, port=None):
+        self.dispatcher = dispatcher
+        self.host = host or config.CALLBACK_HOST
+        self.port = port or config.CALLBACK_PORT
+        
+        self._seen_ids = set()
+        self._seen_order = deque()
+        self._lock = threading.Lock()
+        self._httpd = None
+    
+    def serve_forever(self):
+        """Запуск сервера (блокирует текущий поток)"""
+        server = self
+        
+        class Handler(CallbackRequestHandler):
+            callback_server = server
+        
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        print(f"✅ Callback API сервер слушает {self.host}:{self.port}")
+        self._httpd.serve_forever()
+    
+    def shutdown(self):
+        """Остановка сервера"""
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+    
+    def handle_payload(self, payload):
+        """
+        Обработка тела запроса от VK
+        Возвращает (http_status, response_text)
+        """
+        if payload.get('group_id') != config.VK_GROUP_ID:
+            return 403, 'wrong group'
+        
+        event_type = payload.get('type')
+        
+        # Подтверждение адреса сервера
+        if event_type == 'confirmation':
+            return 200, config.CALLBACK_CONFIRMATION_CODE
+        
+        if config.CALLBACK_SECRET and not hmac.compare_digest(
+            str(payload.get('secret', '')), config.CALLBACK_SECRET
+        ):
+            return 403, 'wrong secret'
+        
+        if event_type != 'message_new':
+            return 200, 'ok'
+        
+        if self._is_duplicate(payload.get('event_id')):
+            return 200, 'ok'
+        
+        # Начиная с версии API 5.103 сообщение лежит в object.message
+        obj = payload.get('object') or {}
+        message = obj.get('message', obj)
+        
+        # Только сообщения от пользователей
+        if message.get('from_id', 0) > 0:
+            self.dispatcher.submit(MessageEvent(
+                message['from_id'],
+                message.get('text', ''),
+                message.get('peer_id'),
+                message.get('id')
+            ))
+        
+        return 200, 'ok'
+    
+    def _is_duplicate(self, event_id):
+        """Проверка повторной доставки события"""
+        if not event_id:
+            return False
+        
+        with self._lock:
+            if event_id in self._seen_ids:
+                return True
+            
+            self._seen_ids.add(event_id)
+            self._seen_order.append(event_id)
+            if len(self._seen_order) > DEDUP_WINDOW:
+                self._seen_ids.discard(self._seen_order.popleft())
+        
+        return False
+
+
+class CallbackRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик HTTP-запросов: разбор JSON и мгновенный ответ"""
+    
+    callback_server = None
+    
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length))
+        except (ValueError, TypeError):
+            self._respond(400, 'bad request')
+            return
+        
+        # VK присылает объект; массив, строка или число — не событие
+        if not isinstance(payload, dict):
+            self._respond(400, 'bad request')
+            return
+        
+        status, text = self.callback_server.handle_payload(payload)
+        self._respond(status, text)
+    
+    def _respond(self, status, text):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # Не логируем каждый запрос VK
+        pass
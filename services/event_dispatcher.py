@@ -0,0 +1,198 @@
+"""
+Диспетчер входящих событий
+Параллельная обработка (пул потоков или asyncio) с сохранением порядка для каждого пользователя
+"""
+from collections import deque
+import asyncio
+import queue
+import threading
+
+import config
+
+
+# Сигнал остановки воркера
+_STOP = object()
+
+
+class EventDispatcher:
+    """
+    Пул воркеров между LongPoll и маршрутизацией.
+    События одного пользователя выполняются строго по очереди,
+    события разных пользователей — параллельно.
+    """
+    
+    def __init__(self, handler, pool_size=None):
+        self.handler = handler
+        self.pool_size = pool_size or config.WORKER_POOL_SIZE
+        
+        # user_id -> очередь ещё не обработанных событий пользователя.
+        # Ключ присутствует, пока пользователь стоит в очереди или обрабатывается.
+        self._pending = {}
+        # Пользователи, готовые к обработке (не более одного воркера на пользователя)
+        self._ready = queue.Queue()
+        
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._queued = 0
+        self._active = 0
+        self._processed = 0
+        self._workers = []
+    
+    def start(self):
+        """Запуск воркеров"""
+        for i in range(self.pool_size):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f'event-worker-{i}',
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        
+        print(f"✅ Диспетчер событий запущен ({self.pool_size} воркеров)")
+    
+    def stop(self, timeout=None):
+        """Остановка: дожидаемся обработки очереди и завершаем воркеры"""
+        with self._idle:
+            self._idle.wait_for(lambda: self._queued == 0 and self._active == 0, timeout=timeout)
+        
+        for _ in self._workers:
+            self._ready.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        
+        self._workers = []
+        print(f"⏸️ Диспетчер событий остановлен (обработано событий: {self._processed})")
+    
+    def submit(self, event):
+        """Поставить событие в очередь"""
+        user_id = event.user_id
+        
+        with self._lock:
+            self._queued += 1
+            if user_id in self._pending:
+                # Пользователь уже в работе — событие выполнится после предыдущих
+                self._pending[user_id].append(event)
+                return
+            self._pending[user_id] = deque([event])
+        
+        self._ready.put(user_id)
+    
+    def queue_depth(self):
+        """Количество событий, ожидающих обработки"""
+        with self._lock:
+            return self._queued
+    
+    def get_stats(self):
+        """Метрики диспетчера"""
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'queue_depth': self._queued,
+                'active': self._active,
+                'users_in_queue': len(self._pending),
+                'processed': self._processed
+            }
+    
+    def _worker_loop(self):
+        """Цикл воркера"""
+        while True:
+            user_id = self._ready.get()
+            if user_id is _STOP:
+                return
+            
+            with self._lock:
+                event = self._pending[user_id].popleft()
+                self._queued -= 1
+                self._active += 1
+            
+            try:
+                self.handler(event)
+            except Exception as e:
+                print(f"❌ Ошибка воркера при обработке события от {user_id}: {e}")
+            
+            with self._idle:
+                self._active -= 1
+                self._processed += 1
+                
+                if self._pending[user_id]:
+                    # У пользователя есть следующие события — возвращаем его в очередь
+                    self._ready.put(user_id)
+                else:
+                    del self._pending[user_id]
+                
+                if self._queued == 0 and self._active == 0:
+                    self._idle.notify_all()
+
+
+class AsyncEventDispatcher:
+    """
+    Вариант диспетчера для asyncio-режима.
+    На каждого пользователя с событиями в очереди — одна задача,
+    общее число одновременно выполняемых обработчиков ограничено семафором.
+    """
+    
+    def __init__(self, handler, max_in_flight=None):
+        self.handler = handler
+        self.max_in_flight = max_in_flight or config.ASYNC_MAX_IN_FLIGHT
+        
+        self._pending = {}
+        self._tasks = set()
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._queued = 0
+        self._active = 0
+        self._processed = 0
+    
+    async def stop(self):
+        """Дождаться обработки всех поставленных событий"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        print(f"⏸️ Диспетчер событий остановлен (обработано событий: {self._processed})")
+    
+    def submit(self, event):
+        """Поставить событие в очередь"""
+        user_id = event.user_id
+        self._queued += 1
+        
+        if user_id in self._pending:
+            self._pending[user_id].append(event)
+            return
+        
+        self._pending[user_id] = deque([event])
+        task = asyncio.create_task(self._drain_user(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    def queue_depth(self):
+        """Количество событий, ожидающих обработки"""
+        return self._queued
+    
+    def get_stats(self):
+        """Метрики диспетчера"""
+        return {
+            'max_in_flight': self.max_in_flight,
+            'queue_depth': self._queued,
+            'active': self._active,
+            'users_in_queue': len(self._pending),
+            'processed': self._processed
+        }
+    
+    async def _drain_user(self, user_id):
+        """Последовательная обработка событий одного пользователя"""
+        events = self._pending[user_id]
+        
+        while events:
+            event = events.popleft()
+            self._queued -= 1
+            
+            async with self._semaphore:
+                self._active += 1
+                try:
+                    await self.handler(event)
+                except Exception as e:
+                    print(f"❌ Ошибка при обработке события от {user_id}: {e}")
+                finally:
+                    self._active -= 1
+                    self._processed += 1
+        
+        del self._pending[user_id]
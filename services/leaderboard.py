@@ -0,0 +1,180 @@
+"""
+Таблица лидеров в памяти
+Упорядоченный индекс по (баланс, id): топ-N и место игрока без запросов к БД.
+Обновляется при каждом изменении баланса, бана или скрытия баланса
+и периодически пересобирается из БД (изменения из других процессов)
+"""
+from collections import namedtuple
+import threading
+
+from sortedcontainers import SortedList
+from sqlalchemy import select
+
+from database.connection import get_session, close_session
+from database.models import Player
+import config
+
+# Запись таблицы: поля совпадают с Player, чтобы форматтеры работали с обоими
+LeaderboardEntry = namedtuple('LeaderboardEntry', ['id', 'vk_id', 'first_name', 'last_name', 'balance'])
+
+
+class Leaderboard:
+    """Индекс игроков по убыванию баланса (при равенстве — по id)"""
+    
+    def __init__(self, refresh_interval=None):
+        self.refresh_interval = refresh_interval or config.LEADERBOARD_REFRESH_SECONDS
+        
+        # Ключи (-balance, id): первый элемент — лидер
+        self._keys = SortedList()
+        # player_id -> LeaderboardEntry
+        self._entries = {}
+        
+        self._lock = threading.Lock()
+        # Пересборки идут по одной: журнал изменений у них общий
+        self._rebuild_lock = threading.Lock()
+        # Пока пересборка читает БД: player_id -> LeaderboardEntry или None (удалён из индекса)
+        self._journal = None
+        # Массовое начисление во время чтения: прочитанные балансы могли его не учесть
+        self._rescan = False
+        
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Построение индекса и запуск периодической пересборки"""
+        self.refresh()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name='leaderboard', daemon=True)
+        self._thread.start()
+        print(f"✅ Таблица лидеров построена: {len(self._entries)} игроков")
+    
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+    
+    def refresh(self):
+        """Пересобрать индекс из БД"""
+        session = get_session()
+        try:
+            self.rebuild(session)
+        finally:
+            close_session(session)
+    
+    def request_refresh(self):
+        """Пересобрать индекс в фоновом потоке, не дожидаясь интервала (после начисления сегменту)"""
+        self._wake.set()
+    
+    def rebuild(self, session):
+        """
+        Пересобрать индекс из БД в рамках переданной сессии
+        Изменения, пришедшие через update/remove во время чтения, применяются
+        поверх прочитанного; массовое начисление во время чтения — читаем заново
+        """
+        with self._rebuild_lock:
+            while True:
+                with self._lock:
+                    self._journal = {}
+                    self._rescan = False
+                
+                try:
+                    rows = session.execute(
+                        select(Player.id, Player.vk_id, Player.first_name, Player.last_name, Player.balance)
+                        .where(Player.is_banned == False, Player.hide_balance == False)
+                    ).all()
+                except BaseException:
+                    with self._lock:
+                        self._journal = None
+                    raise
+                
+                entries = {row.id: LeaderboardEntry(*row) for row in rows}
+                
+                with self._lock:
+                    journal, self._journal = self._journal, None
+                    if self._rescan:
+                        continue
+                    
+                    for player_id, entry in journal.items():
+                        if entry is None:
+                            entries.pop(player_id, None)
+                        else:
+                            entries[player_id] = entry
+                    
+                    self._entries = entries
+                    self._keys = SortedList((-entry.balance, entry.id) for entry in entries.values())
+                    return
+    
+    def credit_all(self, amount):
+        """Учесть начисление amount всем игрокам: порядок не меняется, сдвигаются только балансы"""
+        with self._lock:
+            self._entries = {
+                player_id: entry._replace(balance=entry.balance + amount)
+                for player_id, entry in self._entries.items()
+            }
+            self._keys = SortedList((key - amount, player_id) for key, player_id in self._keys)
+            if self._journal is not None:
+                self._rescan = True
+    
+    def update(self, player):
+        """Учесть изменение игрока (баланс, бан, скрытие баланса, имя)"""
+        with self._lock:
+            self._remove(player.id)
+            entry = None
+            if not player.is_banned and not player.hide_balance:
+                entry = LeaderboardEntry(player.id, player.vk_id, player.first_name, player.last_name, player.balance)
+                self._entries[player.id] = entry
+                self._keys.add((-entry.balance, entry.id))
+            if self._journal is not None:
+                self._journal[player.id] = entry
+    
+    def ensure(self, player):
+        """Добавить игрока, если его ещё нет в индексе (новый игрок)"""
+        if player.id in self._entries or player.is_banned or player.hide_balance:
+            return
+        self.update(player)
+    
+    def remove(self, player_id):
+        """Убрать игрока из индекса"""
+        with self._lock:
+            self._remove(player_id)
+            if self._journal is not None:
+                self._journal[player_id] = None
+    
+    def top(self, limit=10):
+        """Первые limit игроков"""
+        with self._lock:
+            return [self._entries[player_id] for _, player_id in self._keys[:limit]]
+    
+    def rank(self, player_id):
+        """
+        Место игрока
+        Возвращает (место, всего игроков) или None, если игрока нет в таблице
+        """
+        with self._lock:
+            entry = self._entries.get(player_id)
+            if entry is None:
+                return None
+            return self._keys.index((-entry.balance, entry.id)) + 1, len(self._keys)
+    
+    def _remove(self, player_id):
+        entry = self._entries.pop(player_id, None)
+        if entry is not None:
+            self._keys.discard((-entry.balance, entry.id))
+    
+    def _refresh_loop(self):
+        while True:
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+            if self._stop_event.is_set():
+                break
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"❌ Ошибка пересборки таблицы лидеров: {e}")
+
+
+# Общая таблица лидеров процесса
+leaderboard = Leaderboard()
@@ -0,0 +1,232 @@
+"""
+Очередь исходящих сообщений
+Все messages.send уходят в один фоновый поток: частота запросов ограничена
+token bucket, а накопившиеся сообщения упаковываются по 25 в один execute
+"""
+from collections import deque
+import json
+import threading
+import time
+
+import vk_api
+from vk_api.exceptions import ApiError
+
+import config
+
+# execute принимает не больше 25 обращений к API
+EXECUTE_MAX_CALLS = 25
+# Версия API для execute (совпадает с версией массовых рассылок)
+EXECUTE_API_VERSION = '5.131'
+# Ограничение на размер кода VKScript в одном execute
+EXECUTE_MAX_CODE_LENGTH = 60000
+
+# Коды ошибок VK, после которых запрос стоит повторить: частота запросов, flood control, внутренняя ошибка
+RETRYABLE_ERROR_CODES = {6, 9, 10}
+MAX_SEND_ATTEMPTS = 3
+
+
+class TokenBucket:
+    """Token bucket: в среднем rate запросов в секунду, всплеск до capacity"""
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Дождаться и забрать один токен"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class QueuedMessages:
+    """Раздел messages, в котором send ставится в очередь"""
+    
+    def __init__(self, messages, outbox):
+        self._messages = messages
+        self._outbox = outbox
+    
+    def send(self, **params):
+        self._outbox.send(**params)
+    
+    def __getattr__(self, name):
+        return getattr(self._messages, name)
+
+
+class QueuedVkApi:
+    """Клиент VK для обработчиков: messages.send — через очередь, остальное — напрямую"""
+    
+    def __init__(self, vk, outbox):
+        self.wrapped = vk
+        self.messages = QueuedMessages(vk.messages, outbox)
+    
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+class OutboundQueue:
+    """Очередь исходящих сообщений с одним отправляющим потоком"""
+    
+    def __init__(self, rps=None, batch_size=EXECUTE_MAX_CALLS):
+        self.rps = rps or config.OUTBOX_RPS
+        self.batch_size = min(batch_size, EXECUTE_MAX_CALLS)
+        self.bucket = TokenBucket(self.rps)
+        
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._api = None
+        
+        # Статистика
+        self.sent = 0
+        self.failed = 0
+        self.requests = 0
+        self.batched_requests = 0
+    
+    def start(self, rps=None, token=None):
+        """
+        Запуск отправляющего потока со своей сессией VK
+        rps — переопределить лимит (например, доля лимита группы для процесса-воркера)
+        """
+        if rps:
+            self.rps = rps
+            self.bucket = TokenBucket(rps)
+        
+        vk_session = vk_api.VkApi(token=token or config.VK_GROUP_TOKEN)
+        # Темп задаёт token bucket, встроенная задержка vk_api (~3 запроса/сек) не нужна
+        vk_session.RPS_DELAY = 0
+        self._api = vk_session.get_api()
+        
+        self._running = True
+        self._thread = threading.Thread(target=self._send_loop, name='outbox', daemon=True)
+        self._thread.start()
+        print(f"✅ Очередь исходящих запущена ({self.rps:g} запросов/сек, до {self.batch_size} сообщений в execute)")
+    
+    def stop(self, timeout=10):
+        """Остановка: дождаться отправки того, что уже в очереди"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        print("⏸️ Очередь исходящих остановлена")
+    
+    @property
+    def running(self):
+        return self._running
+    
+    def wrap(self, vk):
+        """Обернуть клиент VK так, чтобы messages.send шёл через очередь"""
+        if not self._running:
+            return vk
+        return QueuedVkApi(vk, self)
+    
+    def send(self, **params):
+        """Поставить messages.send в очередь (не ждёт ответа VK)"""
+        # None в параметрах vk_api не отправляет — в execute их тоже быть не должно
+        params = {key: value for key, value in params.items() if value is not None}
+        
+        with self._cond:
+            self._queue.append(params)
+            self._cond.notify()
+    
+    def queue_depth(self):
+        return len(self._queue)
+    
+    def get_stats(self):
+        """Статистика очереди"""
+        return {
+            'queue_depth': len(self._queue),
+            'sent': self.sent,
+            'failed': self.failed,
+            'requests': self.requests,
+            'batched_requests': self.batched_requests
+        }
+    
+    def _send_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and self._running:
+                    self._cond.wait()
+                
+                if not self._queue:
+                    return
+                
+                batch = self._take_batch()
+            
+            self.bucket.acquire()
+            try:
+                self._send_batch(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"❌ Ошибка отправки исходящих ({len(batch)} шт.): {e}")
+    
+    def _take_batch(self):
+        """Забрать из очереди до batch_size сообщений (вызывается под self._cond)"""
+        batch = [self._queue.popleft()]
+        code_length = len(_to_vkscript_call(batch[0]))
+        
+        while self._queue and len(batch) < self.batch_size:
+            call_length = len(_to_vkscript_call(self._queue[0]))
+            if code_length + call_length > EXECUTE_MAX_CODE_LENGTH:
+                break
+            batch.append(self._queue.popleft())
+            code_length += call_length
+        
+        return batch
+    
+    def _send_batch(self, batch):
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            try:
+                if len(batch) == 1:
+                    self._api.messages.send(**batch[0])
+                    self.sent += 1
+                else:
+                    self._execute(batch)
+                self.requests += 1
+                return
+            except ApiError as e:
+                if e.code in RETRYABLE_ERROR_CODES and attempt < MAX_SEND_ATTEMPTS:
+                    time.sleep(attempt)
+                    self.bucket.acquire()
+                    continue
+                raise
+    
+    def _execute(self, batch):
+        """Отправка пачки одним execute; упавшие вызовы возвращаются как false"""
+        code = 'return [' + ','.join(_to_vkscript_call(params) for params in batch) + '];'
+        results = self._api.execute(code=code, v=EXECUTE_API_VERSION)
+        
+        failed = sum(1 for result in results if result is False)
+        self.sent += len(batch) - failed
+        self.failed += failed
+        self.batched_requests += 1
+        
+        if failed:
+            print(f"⚠️ Исходящие: {failed} из {len(batch)} сообщений в execute не доставлены")
+
+
+def _to_vkscript_call(params):
+    """messages.send(params) в виде вызова VKScript"""
+    # Версия задаётся для всего execute
+    params = {key: value for key, value in params.items() if key != 'v'}
+    return 'API.messages.send(' + json.dumps(params, ensure_ascii=False) + ')'
+
+
+# Общая очередь исходящих процесса
+outbox = OutboundQueue()
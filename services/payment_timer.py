@@ -0,0 +1,173 @@
+"""
+Будильник запланированных платежей
+Куча сроков невыполненных платежей: поток спит ровно до ближайшего срока
+и только тогда обращается к БД. Куча заполняется из БД при запуске и
+пополняется при создании платежа (schedule). В многопроцессном режиме
+воркеры передают сроки процессу планировщика через общую очередь.
+Платежи других экземпляров бота и невыполненные из-за ошибки подхватываются
+сверкой: раз в SCHEDULER_RESYNC_MINUTES запрашивается срок самого раннего
+невыполненного платежа
+"""
+from datetime import datetime, timedelta
+import heapq
+import threading
+
+from database.connection import get_session, close_session
+from database.queries import get_pending_payment_times, get_next_payment_time
+import config
+
+
+class PaymentTimer:
+    """Куча сроков платежей и поток, который просыпается к ближайшему"""
+    
+    def __init__(self, clock=datetime.now, resync_minutes=None):
+        # clock — текущее время в том же виде, что scheduled_for (наивное локальное)
+        self.clock = clock
+        self.resync_interval = timedelta(minutes=resync_minutes or config.SCHEDULER_RESYNC_MINUTES)
+        
+        self._heap = []
+        self._next_resync = None
+        self._on_due = None
+        
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+        
+        # Очередь процесса планировщика (в воркерах многопроцессного режима)
+        self._shared_queue = None
+    
+    def start(self, on_due):
+        """
+        Заполнить кучу из БД и запустить поток
+        on_due() вызывается, когда наступил хотя бы один срок
+        """
+        self._on_due = on_due
+        self.seed(self.clock())
+        
+        with self._condition:
+            self._running = True
+        self._thread = threading.Thread(target=self._loop, name='payment-timer', daemon=True)
+        self._thread.start()
+        print(f"✅ Будильник платежей запущен: {len(self._heap)} в очереди")
+    
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+    
+    def seed(self, now):
+        """Сроки всех невыполненных платежей из БД"""
+        times = self._load_pending()
+        with self._condition:
+            self._heap = list(times)
+            heapq.heapify(self._heap)
+            self._next_resync = now + self.resync_interval
+    
+    def use_shared_queue(self, queue):
+        """Передавать сроки в процесс планировщика (multiprocessing.Manager().Queue())"""
+        self._shared_queue = queue
+    
+    def listen(self, queue):
+        """Принимать сроки из воркеров; None в очереди останавливает приём"""
+        def relay():
+            while True:
+                try:
+                    scheduled_for = queue.get()
+                except (EOFError, OSError):
+                    return
+                if scheduled_for is None:
+                    return
+                self.schedule(scheduled_for)
+        
+        threading.Thread(target=relay, name='payment-timer-relay', daemon=True).start()
+    
+    def schedule(self, scheduled_for):
+        """Добавить срок нового платежа (после коммита)"""
+        if self._shared_queue is not None:
+            self._shared_queue.put(scheduled_for)
+            return
+        
+        with self._condition:
+            # Будильник не запущен в этом процессе — платёж найдёт сверка
+            if not self._running:
+                return
+            heapq.heappush(self._heap, scheduled_for)
+            # Срок раньше того, до которого спит поток, — разбудить его
+            if self._heap[0] == scheduled_for:
+                self._condition.notify()
+    
+    def next_wake(self):
+        """Ближайший срок или время сверки, если оно раньше"""
+        with self._condition:
+            wake = self._next_resync
+            if self._heap and (wake is None or self._heap[0] < wake):
+                wake = self._heap[0]
+            return wake
+    
+    def pending(self):
+        """Сроков в куче"""
+        return len(self._heap)
+    
+    def tick(self, now):
+        """Сверка с БД, если пора, и обработка наступивших сроков"""
+        if self._next_resync is not None and now >= self._next_resync:
+            self._next_resync = now + self.resync_interval
+            self._resync()
+        
+        due = False
+        with self._condition:
+            while self._heap and self._heap[0] <= now:
+                heapq.heappop(self._heap)
+                due = True
+        
+        if due:
+            self._on_due()
+    
+    def _resync(self):
+        """Самый ранний платёж из БД, если его нет в куче (создан другим процессом или не выполнен)"""
+        earliest = self._load_next()
+        if earliest is None:
+            return
+        with self._condition:
+            if not self._heap or earliest < self._heap[0]:
+                heapq.heappush(self._heap, earliest)
+    
+    def _load_pending(self):
+        session = get_session()
+        try:
+            return get_pending_payment_times(session)
+        finally:
+            close_session(session)
+    
+    def _load_next(self):
+        session = get_session()
+        try:
+            return get_next_payment_time(session)
+        finally:
+            close_session(session)
+    
+    def _loop(self):
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                delay = (self.next_wake() - self.clock()).total_seconds()
+                if delay > 0:
+                    # Новый срок (schedule) или остановка прерывают ожидание
+                    self._condition.wait(delay)
+                    continue
+            
+            try:
+                self.tick(self.clock())
+            except Exception as e:
+                print(f"❌ Ошибка будильника платежей: {e}")
+                # Сроки уже сняты с кучи — платёж вернёт ближайшая сверка
+                with self._condition:
+                    self._condition.wait(1)
+
+
+# Общий будильник процесса
+payment_timer = PaymentTimer()
@@ -0,0 +1,182 @@
+"""
+Многопроцессный режим: один процесс читает LongPoll,
+события распределяются по N процессам-воркерам (user_id % N)
+"""
+import multiprocessing
+from multiprocessing.managers import SyncManager
+import signal
+
+import vk_api
+
+import config
+from database.connection import engine
+from middleware import rate_limiter
+from services.event_dispatcher import EventDispatcher
+from services.xp_buffer import xp_buffer
+from services.broadcast_service import broadcast_service
+from services.outbox import outbox
+from services.leaderboard import leaderboard
+from services.payment_timer import payment_timer
+from utils.events import MessageEvent
+import states
+
+
+def _ignore_sigint():
+    """Ctrl+C обрабатывает только супервизор, дочерние процессы останавливаются по команде"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _worker_main(index, inboxes, handler, shared_storage):
+    """Точка входа процесса-воркера"""
+    _ignore_sigint()
+    
+    # Соединения из пула родителя не должны использоваться в дочернем процессе
+    engine.dispose(close=False)
+    
+    attach_shared_storage(index, inboxes, shared_storage)
+    
+    raw_vk = vk_api.VkApi(token=config.VK_GROUP_TOKEN).get_api()
+    xp_buffer.start()
+    leaderboard.start()
+    # Прерванные рассылки продолжает супервизор, воркер только запускает новые;
+    # темп рассылок, как и лимит очереди исходящих, делится между процессами
+    broadcast_service.start(resume=False, rps=broadcast_service.rps / (config.WORKER_PROCESSES + 1))
+    
+    # Своя очередь исходящих с долей общего лимита группы
+    outbox.start(rps=config.OUTBOX_RPS / (config.WORKER_PROCESSES + 1))
+    vk = outbox.wrap(raw_vk)
+    
+    serve_inbox(inboxes[index], lambda event: handler(vk, event))
+    
+    xp_buffer.stop()
+    outbox.stop()
+    print(f"⏸️ Воркер #{index} остановлен")
+
+
+def attach_shared_storage(index, inboxes, shared_storage):
+    """Подключить процесс-воркер к общим хранилищам супервизора (FSM, rate limit, сроки платежей)"""
+    # FSM — в хранилище с кэшем процесса: состояние пользователя читает только его воркер,
+    # поэтому о записи чужого состояния (например, админ одобрил покупку) сообщается владельцу
+    states.init_store(shared_storage['fsm_states'])
+    states.on_write(lambda kind, key: _notify_state_owners(index, inboxes, kind, key))
+    # Просроченные записи удаляет владелец: у остальных срок мог устареть
+    states.set_owner(lambda kind, key: index in _state_owners(len(inboxes), kind, key))
+    
+    # Rate limit — в общих хранилищах, доступных всем воркерам
+    rate_limiter.use_shared_storage(shared_storage['user_requests'], shared_storage['user_hourly_requests'])
+    payment_timer.use_shared_queue(shared_storage['scheduled_payments'])
+
+
+def serve_inbox(inbox, handle):
+    """События из очереди воркера до None — пулу потоков процесса, handle(event)"""
+    # Внутри процесса — пул потоков, чтобы ожидание VK/БД не простаивало CPU
+    dispatcher = EventDispatcher(handle)
+    dispatcher.start()
+    
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        # До событий пользователя, пришедших позже, — очередь общая
+        if 'fsm_kind' in item:
+            states.invalidate(item['fsm_kind'], item['fsm_key'])
+            continue
+        dispatcher.submit(MessageEvent.from_dict(item))
+    
+    dispatcher.stop()
+
+
+def _state_owners(workers, kind, key):
+    """Воркеры, которым принадлежит запись: пользователь — одному (user_id % N), подтверждения — всем"""
+    if kind == states.STATES:
+        return [key % workers]
+    return range(workers)
+
+
+def _notify_state_owners(index, inboxes, kind, key):
+    """Запись состояния в другом воркере — её владельцам"""
+    for owner in _state_owners(len(inboxes), kind, key):
+        if owner != index:
+            inboxes[owner].put({'fsm_kind': kind, 'fsm_key': key})
+
+
+class ProcessSupervisor:
+    """Супервизор процессов-воркеров"""
+    
+    def __init__(self, handler, processes=None, worker_main=None):
+        """worker_main — точка входа воркера (бенчмарк запускает воркеры без служб VK и БД)"""
+        self.handler = handler
+        self.processes = processes or config.WORKER_PROCESSES
+        self.worker_main = worker_main or _worker_main
+        
+        self.manager = None
+        self.shared_storage = None
+        self.scheduled_payments = None
+        self.queues = []
+        self.workers = []
+    
+    def start(self):
+        """Запуск общего хранилища состояний и процессов-воркеров"""
+        self.manager = SyncManager()
+        self.manager.start(_ignore_sigint)
+        
+        # Прокси держит супервизор: при fork воркеры получают их без учёта ссылок в менеджере,
+        # и объекты, на которые у супервизора не осталось прокси, менеджер удаляет
+        self.shared_storage = shared_storage = {
+            'fsm_states': self.manager.dict(),
+            'user_requests': self.manager.dict(),
+            'user_hourly_requests': self.manager.dict(),
+            'scheduled_payments': self.manager.Queue()
+        }
+        
+        # Сроки новых платежей из воркеров — будильнику планировщика этого процесса
+        self.scheduled_payments = shared_storage['scheduled_payments']
+        payment_timer.listen(self.scheduled_payments)
+        
+        # Очереди всех воркеров создаются заранее: воркер пишет в чужие об изменённых состояниях
+        self.queues = [multiprocessing.Queue() for _ in range(self.processes)]
+        
+        for i in range(self.processes):
+            worker = multiprocessing.Process(
+                target=self.worker_main,
+                args=(i, self.queues, self.handler, shared_storage),
+                name=f'event-process-{i}',
+                daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+        
+        print(f"✅ Запущено процессов-воркеров: {self.processes}")
+    
+    def stop(self, timeout=30):
+        """Остановка воркеров после обработки их очередей"""
+        for inbox in self.queues:
+            inbox.put(None)
+        for worker in self.workers:
+            worker.join(timeout=timeout)
+        
+        if self.manager:
+            self.scheduled_payments.put(None)
+            self.manager.shutdown()
+        
+        self.shared_storage = None
+        self.queues = []
+        self.workers = []
+        print("⏸️ Процессы-воркеры остановлены")
+    
+    def submit(self, event):
+        """Передать событие воркеру, закреплённому за пользователем"""
+        index = event.user_id % self.processes
+        self.queues[index].put(MessageEvent.from_longpoll(event).to_dict())
+    
+    def queue_depth(self):
+        """Событий в очередях воркеров (без учёта уже принятых пулами потоков)"""
+        return sum(inbox.qsize() for inbox in self.queues)
+    
+    def get_stats(self):
+        """Метрики супервизора"""
+        return {
+            'processes': self.processes,
+            'queue_depths': [inbox.qsize() for inbox in self.queues],
+            'alive': sum(1 for worker in self.workers if worker.is_alive())
+        }
@@ -0,0 +1,194 @@
+"""
+Кэш профилей VK (имя и фамилия) с TTL, LRU-вытеснением
+и объединением промахов в пакетные вызовы users.get
+"""
+from collections import OrderedDict
+from concurrent.futures import Future
+import threading
+import time
+
+import config
+from services.async_vk import GreenletVkApi
+from services.outbox import QueuedVkApi
+
+# Максимум идентификаторов в одном вызове users.get
+USERS_GET_BATCH_SIZE = 1000
+
+# Сколько ждать загрузки профиля другим потоком
+FETCH_TIMEOUT_SECONDS = 30
+
+# Имя для профилей, которые не удалось загрузить
+FALLBACK_PROFILE = {'first_name': 'Игрок', 'last_name': ''}
+
+
+class ProfileCache:
+    """Потокобезопасный кэш профилей пользователей VK"""
+    
+    def __init__(self, ttl_seconds=None, max_size=None):
+        self.ttl_seconds = ttl_seconds or config.PROFILE_CACHE_TTL_SECONDS
+        self.max_size = max_size or config.PROFILE_CACHE_SIZE
+        
+        # vk_id -> (expires_at, profile), порядок — от давно использованных к недавним
+        self._entries = OrderedDict()
+        # vk_id -> Future загрузки, которая уже запрошена
+        self._inflight = {}
+        # Очередь идентификаторов на загрузку
+        self._queue = []
+        self._fetching = False
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.batches = 0
+    
+    def get(self, vk, vk_id):
+        """Получить профиль пользователя"""
+        return self.get_many(vk, [vk_id])[vk_id]
+    
+    def get_many(self, vk, vk_ids):
+        """Получить профили нескольких пользователей: {vk_id: profile}"""
+        result = {}
+        missing = []
+        
+        with self._lock:
+            for vk_id in vk_ids:
+                profile = self._lookup(vk_id)
+                if profile is None:
+                    missing.append(vk_id)
+                else:
+                    result[vk_id] = profile
+        
+        if missing:
+            result.update(self._load(vk, missing))
+        
+        return result
+    
+    def put(self, vk_id, first_name, last_name):
+        """Положить профиль в кэш (если он уже известен из другого источника)"""
+        with self._lock:
+            self._store(vk_id, {'first_name': first_name, 'last_name': last_name})
+    
+    def invalidate(self, vk_id):
+        """Удалить профиль из кэша"""
+        with self._lock:
+            self._entries.pop(vk_id, None)
+    
+    def get_stats(self):
+        """Метрики кэша"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'batches': self.batches
+            }
+    
+    def _lookup(self, vk_id):
+        """Поиск в кэше (вызывается под блокировкой)"""
+        entry = self._entries.get(vk_id)
+        
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires_at, profile = entry
+        if expires_at < time.monotonic():
+            del self._entries[vk_id]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(vk_id)
+        self.hits += 1
+        return profile
+    
+    def _store(self, vk_id, profile):
+        """Запись в кэш с вытеснением (вызывается под блокировкой)"""
+        self._entries[vk_id] = (time.monotonic() + self.ttl_seconds, profile)
+        self._entries.move_to_end(vk_id)
+        
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def _load(self, vk, vk_ids):
+        """
+        Загрузка промахов. Первый обратившийся поток становится загрузчиком
+        и забирает из очереди все накопившиеся идентификаторы пачками,
+        остальные ждут результат своих идентификаторов.
+        """
+        with self._lock:
+            futures = {}
+            for vk_id in vk_ids:
+                future = self._inflight.get(vk_id)
+                if future is None:
+                    future = Future()
+                    self._inflight[vk_id] = future
+                    self._queue.append(vk_id)
+                futures[vk_id] = future
+            
+            is_loader = not self._fetching
+            if is_loader:
+                self._fetching = True
+        
+        if is_loader:
+            self._fetch_queued(vk)
+        
+        return {vk_id: self._wait(vk, future) for vk_id, future in futures.items()}
+    
+    def _fetch_queued(self, vk):
+        """Цикл загрузчика: пакетные users.get, пока очередь не опустеет"""
+        while True:
+            with self._lock:
+                batch = self._queue[:USERS_GET_BATCH_SIZE]
+                del self._queue[:USERS_GET_BATCH_SIZE]
+                if not batch:
+                    self._fetching = False
+                    return
+                self.batches += 1
+            
+            try:
+                users = vk.users.get(user_ids=','.join(str(vk_id) for vk_id in batch))
+            except Exception as e:
+                print(f"❌ Ошибка загрузки профилей ({len(batch)} шт.): {e}")
+                users = []
+            
+            profiles = {
+                user['id']: {'first_name': user['first_name'], 'last_name': user['last_name']}
+                for user in users
+            }
+            
+            with self._lock:
+                for vk_id in batch:
+                    profile = profiles.get(vk_id)
+                    if profile:
+                        self._store(vk_id, profile)
+                    self._inflight.pop(vk_id).set_result(profile or FALLBACK_PROFILE)
+    
+    def _wait(self, vk, future):
+        """Ожидание загрузки: в asyncio-режиме — без блокировки цикла событий"""
+        if isinstance(vk, QueuedVkApi):
+            vk = vk.wrapped
+        
+        try:
+            if isinstance(vk, GreenletVkApi):
+                return vk.wait_future(future)
+            return future.result(timeout=FETCH_TIMEOUT_SECONDS)
+        except Exception:
+            return FALLBACK_PROFILE
+
+
+# Общий кэш процесса
+profile_cache = ProfileCache()
+
+
+def get_user_profile(vk, vk_id):
+    """Профиль пользователя VK: {'first_name': ..., 'last_name': ...}"""
+    return profile_cache.get(vk, vk_id)
@@ -3,18 +3,26 @@
 """
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from datetime import datetime
+from apscheduler.triggers.date import DateTrigger
+from datetime import datetime, timedelta
+import threading
 import pytz
 
-from database.connection import get_session, close_session
+from database.connection import get_session, close_session, unit_of_work
 from database.queries import (
-    get_due_scheduled_payments,
-    mark_payment_executed,
-    get_player_by_vk_id
+    claim_due_payments,
+    apply_scheduled_payments,
+    apply_segment_payment,
+    segment_condition,
+    iter_notification_recipients,
+    reconcile_global_stats
 )
 from database.models import TransactionType
-from database.queries import create_transaction
-from utils.notifications import notify_scheduled_payment
+from services.achievement_service import achievement_engine
+from services.leaderboard import leaderboard
+from services.payment_timer import payment_timer
+from utils.notifications import notify_scheduled_payment, send_bulk_notification
+from utils.formatters import format_balance
 import config
 
 
@@ -27,80 +35,141 @@ class SchedulerService:
     
     def start(self):
         """Запуск планировщика"""
-        # Проверка каждую минуту
+        # Однократно после запуска: выдать новые/изменённые достижения тем, кто уже выполнил условие
         self.scheduler.add_job(
-            self.process_scheduled_payments,
-            trigger=IntervalTrigger(minutes=1),
-            id='scheduled_payments',
-            name='Обработка запланированных платежей',
+            self.backfill_achievements,
+            trigger=DateTrigger(run_date=datetime.now(pytz.timezone(config.TIMEZONE)) + timedelta(seconds=30)),
+            id='achievement_backfill',
+            name='Выдача достижений по всем игрокам',
+            replace_existing=True
+        )
+        
+        # Сверка глобальной статистики точным пересчётом
+        self.scheduler.add_job(
+            self.reconcile_global_stats,
+            trigger=IntervalTrigger(minutes=config.GLOBAL_STATS_RECONCILE_MINUTES),
+            id='global_stats_reconcile',
+            name='Сверка глобальной статистики',
             replace_existing=True
         )
         
         self.scheduler.start()
+        
+        # Платежи — не по интервалу, а точно к сроку ближайшего
+        payment_timer.start(self.process_scheduled_payments)
         print("✅ Планировщик запущен!")
     
     def stop(self):
         """Остановка планировщика"""
+        payment_timer.stop()
         self.scheduler.shutdown()
         print("⏸️ Планировщик остановлен")
     
+    def backfill_achievements(self):
+        """Выдача достижений всем игрокам, выполнившим условие"""
+        session = get_session()
+        
+        try:
+            achievement_engine.backfill(session, self.vk)
+        except Exception as e:
+            session.rollback()
+            print(f"❌ Ошибка выдачи достижений: {e}")
+        finally:
+            close_session(session)
+    
+    def reconcile_global_stats(self):
+        """Точный пересчёт глобальной статистики"""
+        session = get_session()
+        
+        try:
+            with unit_of_work(session):
+                drift = reconcile_global_stats(session)
+            if any(drift.values()):
+                print(f"⚠️ Глобальная статистика расходилась с БД, исправлено: {drift}")
+        except Exception as e:
+            session.rollback()
+            print(f"❌ Ошибка сверки глобальной статистики: {e}")
+        finally:
+            close_session(session)
+    
     def process_scheduled_payments(self):
-        """Обработка всех запланированных платежей"""
+        """
+        Выполнение наступивших платежей пачками (вызывает payment_timer)
+        Каждая пачка — одна транзакция БД: забрать строки (SKIP LOCKED), начислить,
+        записать историю. Несколько экземпляров бота не выполнят платёж дважды
+        """
         session = get_session()
         
         try:
-            # Получение всех просроченных платежей
-            due_payments = get_due_scheduled_payments(session)
-            
-            if not due_payments:
-                return
-            
-            print(f"⏰ Обработка {len(due_payments)} запланированных платежей...")
-            
-            for payment in due_payments:
-                try:
-                    # Получение игрока
-                    player = get_player_by_vk_id(session, payment.player_id)
-                    
-                    if not player:
-                        print(f"❌ Игрок {payment.player_id} не найден для платежа #{payment.id}")
-                        mark_payment_executed(session, payment.id)
-                        continue
+            while True:
+                with unit_of_work(session):
+                    payments = claim_due_payments(session, config.SCHEDULED_PAYMENT_BATCH_SIZE)
+                    single = [payment for payment in payments if payment.segment is None]
+                    segments = [payment for payment in payments if payment.segment is not None]
                     
-                    # Начисление чилликов
-                    player.balance += payment.amount
-                    
-                    # Создание транзакции
-                    create_transaction(
-                        session,
-                        from_player_id=None,
-                        to_player_id=player.id,
-                        amount=payment.amount,
-                        transaction_type=TransactionType.SCHEDULED_GIVE,
-                        reason=payment.reason
-                    )
-                    
-                    # Отметка выполнения
-                    mark_payment_executed(session, payment.id)
-                    
-                    # Уведомление игрока
-                    notify_scheduled_payment(
-                        self.vk,
-                        session,
-                        player.vk_id,
-                        payment.amount,
-                        payment.reason
-                    )
-                    
-                    print(f"✅ Выполнен платёж #{payment.id}: {payment.amount} чил. → {player.first_name} {player.last_name}")
+                    players = apply_scheduled_payments(session, single) if single else {}
+                    credited = [(payment, apply_segment_payment(session, payment)) for payment in segments]
+                
+                if not payments:
+                    break
                 
-                except Exception as e:
-                    print(f"❌ Ошибка при обработке платежа #{payment.id}: {e}")
-                    session.rollback()
-                    continue
+                print(f"⏰ Выполнено запланированных платежей: {len(payments)}")
+                self._after_payments(session, single, players)
+                self._after_segment_payments(session, credited)
+                
+                if len(payments) < config.SCHEDULED_PAYMENT_BATCH_SIZE:
+                    break
         
         except Exception as e:
+            # Пачка откатилась целиком — платежи остались в очереди, их вернёт сверка будильника
             print(f"❌ Ошибка в планировщике: {e}")
         
         finally:
-            close_session(session)
\ No newline at end of file
+            close_session(session)
+    
+    def _after_payments(self, session, payments, players):
+        """После коммита пачки: таблица лидеров, достижения, уведомления (через очередь исходящих)"""
+        for player in players.values():
+            leaderboard.update(player)
+            achievement_engine.on_transaction(session, self.vk, TransactionType.SCHEDULED_GIVE, to_player=player)
+        
+        for payment in payments:
+            player = players.get(payment.player_id)
+            if player is None:
+                # Игрока удалили после планирования — начислять и уведомлять некого
+                print(f"⚠️ Платёж #{payment.id}: игрок {payment.player_id} не найден, начисление пропущено")
+                continue
+            notify_scheduled_payment(self.vk, player, payment.amount, payment.reason)
+    
+    def _after_segment_payments(self, session, credited):
+        """После коммита пачки: таблица лидеров пересобирается и сегменты уведомляются в фоне"""
+        if not credited:
+            return
+        
+        leaderboard.request_refresh()
+        
+        for payment, count in credited:
+            print(f"✅ Платёж #{payment.id} сегменту {payment.segment}: {payment.amount} чил. × {count} игроков")
+            threading.Thread(
+                target=self._notify_segment,
+                args=(payment,),
+                name='segment-payment-notify',
+                daemon=True
+            ).start()
+    
+    def _notify_segment(self, payment):
+        """Рассылка уведомлений получателям платежа сегменту пачками"""
+        message = f"⏰ Вам начислено {format_balance(payment.amount)} чилликов!"
+        if payment.reason:
+            message += f"\n💬 {payment.reason}"
+        
+        condition = segment_condition(payment.segment, payment.min_level, payment.vk_ids)
+        session = get_session()
+        
+        try:
+            for vk_ids in iter_notification_recipients(session, condition=condition):
+                send_bulk_notification(self.vk, vk_ids, message)
+        except Exception as e:
+            print(f"❌ Ошибка уведомлений о платеже #{payment.id}: {e}")
+        finally:
+            close_session(session)
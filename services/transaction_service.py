@@ -1,13 +1,38 @@
 """
 Бизнес-логика транзакций
 """
+import threading
+import time
+
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database.connection import get_session, close_session, unit_of_work
 from database.models import TransactionType
 from database.queries import (
-    get_player_by_vk_id,
-    update_player_balance,
-    create_transaction
+    transfer_balance,
+    change_balance,
+    credit_players,
+    iter_notification_recipients
 )
-from utils.notifications import notify_transfer_received, notify_admin_operation
+from middleware.context import get_player
+from services.achievement_service import achievement_engine, COMMON_METRICS
+from services.leaderboard import leaderboard
+from utils.formatters import format_balance
+from utils.notifications import notify_transfer_received, notify_admin_operation, send_bulk_notification
+
+
+class DeclinedOperation(Exception):
+    """Примитив ничего не изменил (недостаточно средств, игрок удалён) — единица работы откатывается без коммита"""
+
+
+def _current_balance(session, player):
+    """Баланс из БД после отказа примитива; None — игрока уже нет"""
+    try:
+        session.refresh(player)
+    except InvalidRequestError:
+        return None
+    return player.balance
 
 
 def transfer_chilliki(session, vk, sender_vk_id, receiver_vk_id, amount, is_anonymous=False):
@@ -16,8 +41,8 @@ def transfer_chilliki(session, vk, sender_vk_id, receiver_vk_id, amount, is_anon
     Возвращает (success, message)
     """
     # Получение игроков
-    sender = get_player_by_vk_id(session, sender_vk_id)
-    receiver = get_player_by_vk_id(session, receiver_vk_id)
+    sender = get_player(session, sender_vk_id)
+    receiver = get_player(session, receiver_vk_id)
     
     if not sender:
         return False, "❌ Ваш профиль не найден"
@@ -28,24 +53,39 @@ def transfer_chilliki(session, vk, sender_vk_id, receiver_vk_id, amount, is_anon
     if sender.id == receiver.id:
         return False, "❌ Нельзя переводить чиллики самому себе"
     
-    # Проверка баланса
+    # Быстрый отказ без обращения к БД; окончательно баланс проверяет transfer_balance
     if sender.balance < amount:
         return False, f"❌ Недостаточно чилликов!\nВаш баланс: {sender.balance}, требуется: {amount}"
     
     # Выполнение перевода
     try:
-        sender.balance -= amount
-        receiver.balance += amount
+        with unit_of_work(session):
+            result = transfer_balance(session, sender.id, receiver.id, amount, is_anonymous)
+            if result is None:
+                raise DeclinedOperation()
+    except DeclinedOperation:
+        # Баланс успел измениться (параллельный перевод или покупка)
+        balance = _current_balance(session, sender)
+        if balance is None:
+            return False, "❌ Ваш профиль не найден"
+        return False, f"❌ Недостаточно чилликов!\nВаш баланс: {balance}, требуется: {amount}"
+    except LookupError:
+        # Игрока удалили между подтверждением и переводом — откат, ничего не списано
+        return False, "❌ Профиль игрока не найден"
+    except Exception as e:
+        return False, f"❌ Ошибка при переводе: {e}"
+    
+    try:
+        # Балансы из RETURNING: объекты не помечаются изменёнными и не перезаписываются при следующем коммите
+        sender_balance, receiver_balance, _ = result
+        set_committed_value(sender, 'balance', sender_balance)
+        set_committed_value(receiver, 'balance', receiver_balance)
+        
+        leaderboard.update(sender)
+        leaderboard.update(receiver)
         
-        # Создание транзакции
-        create_transaction(
-            session,
-            from_player_id=sender.id,
-            to_player_id=receiver.id,
-            amount=amount,
-            transaction_type=TransactionType.TRANSFER,
-            is_anonymous=is_anonymous
-        )
+        # Достижения обоих участников
+        achievement_engine.on_transaction(session, vk, TransactionType.TRANSFER, from_player=sender, to_player=receiver)
         
         # Уведомление получателя
         sender_name = f"{sender.first_name} {sender.last_name}"
@@ -54,7 +94,6 @@ def transfer_chilliki(session, vk, sender_vk_id, receiver_vk_id, amount, is_anon
         return True, f"✅ Перевод выполнен!\n💸 Переведено: {amount} чил.\n💰 Ваш баланс: {sender.balance} чил."
     
     except Exception as e:
-        session.rollback()
         return False, f"❌ Ошибка при переводе: {e}"
 
 
@@ -63,23 +102,26 @@ def admin_give_chilliki(session, vk, admin_vk_id, player_vk_id, amount, reason=N
     Начисление чилликов администратором
     Возвращает (success, message)
     """
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = get_player(session, player_vk_id)
     
     if not player:
         return False, "❌ Профиль игрока не найден"
     
     try:
-        player.balance += amount
-        
-        # Создание транзакции
-        create_transaction(
-            session,
-            from_player_id=None,  # NULL для админских начислений
-            to_player_id=player.id,
-            amount=amount,
-            transaction_type=TransactionType.ADMIN_GIVE,
-            reason=reason
-        )
+        with unit_of_work(session):
+            # Относительный UPDATE: параллельный перевод того же игрока не перезаписывается
+            result = change_balance(session, player.id, amount, TransactionType.ADMIN_GIVE, reason)
+            if result is None:
+                raise DeclinedOperation()
+    except DeclinedOperation:
+        return False, "❌ Профиль игрока не найден"
+    except Exception as e:
+        return False, f"❌ Ошибка при начислении: {e}"
+    
+    try:
+        set_committed_value(player, 'balance', result[0])
+        leaderboard.update(player)
+        achievement_engine.on_transaction(session, vk, TransactionType.ADMIN_GIVE, to_player=player)
         
         # Уведомление игрока
         notify_admin_operation(vk, session, player_vk_id, 'give', amount, reason)
@@ -87,7 +129,6 @@ def admin_give_chilliki(session, vk, admin_vk_id, player_vk_id, amount, reason=N
         return True, f"✅ Начислено {amount} чилликов игроку {player.first_name} {player.last_name}\n💰 Его баланс: {player.balance} чил."
     
     except Exception as e:
-        session.rollback()
         return False, f"❌ Ошибка при начислении: {e}"
 
 
@@ -96,26 +137,32 @@ def admin_take_chilliki(session, vk, admin_vk_id, player_vk_id, amount, reason=N
     Списание чилликов администратором
     Возвращает (success, message)
     """
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = get_player(session, player_vk_id)
     
     if not player:
         return False, "❌ Профиль игрока не найден"
     
+    # Быстрый отказ без обращения к БД; окончательно баланс проверяет change_balance
     if player.balance < amount:
         return False, f"❌ У игрока недостаточно чилликов!\nБаланс: {player.balance}, требуется: {amount}"
     
     try:
-        player.balance -= amount
-        
-        # Создание транзакции
-        create_transaction(
-            session,
-            from_player_id=player.id,
-            to_player_id=None,  # NULL для админских списаний
-            amount=amount,
-            transaction_type=TransactionType.ADMIN_TAKE,
-            reason=reason
-        )
+        with unit_of_work(session):
+            result = change_balance(session, player.id, amount, TransactionType.ADMIN_TAKE, reason)
+            if result is None:
+                raise DeclinedOperation()
+    except DeclinedOperation:
+        balance = _current_balance(session, player)
+        if balance is None:
+            return False, "❌ Профиль игрока не найден"
+        return False, f"❌ У игрока недостаточно чилликов!\nБаланс: {balance}, требуется: {amount}"
+    except Exception as e:
+        return False, f"❌ Ошибка при списании: {e}"
+    
+    try:
+        set_committed_value(player, 'balance', result[0])
+        leaderboard.update(player)
+        achievement_engine.on_transaction(session, vk, TransactionType.ADMIN_TAKE, from_player=player)
         
         # Уведомление игрока
         notify_admin_operation(vk, session, player_vk_id, 'take', amount, reason)
@@ -123,38 +170,112 @@ def admin_take_chilliki(session, vk, admin_vk_id, player_vk_id, amount, reason=N
         return True, f"✅ Списано {amount} чилликов у игрока {player.first_name} {player.last_name}\n💰 Его баланс: {player.balance} чил."
     
     except Exception as e:
-        session.rollback()
         return False, f"❌ Ошибка при списании: {e}"
 
 
-def purchase_item(session, vk, player_vk_id, item_name, price):
+def purchase_item(session, vk, player_vk_id, item_name, price, purchase_request=None):
     """
     Покупка предмета/способности
+    purchase_request — одобренный запрос на покупку: отмечается выполненным в том же коммите
     Возвращает (success, message)
     """
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = get_player(session, player_vk_id)
     
     if not player:
         return False, "❌ Ваш профиль не найден"
     
+    # Быстрый отказ без обращения к БД; окончательно баланс проверяет change_balance
     if player.balance < price:
         return False, f"❌ Недостаточно чилликов!\nВаш баланс: {player.balance}, требуется: {price}"
     
     try:
-        player.balance -= price
-        
-        # Создание транзакции
-        create_transaction(
-            session,
-            from_player_id=player.id,
-            to_player_id=None,
-            amount=price,
-            transaction_type=TransactionType.PURCHASE,
-            reason=item_name
-        )
+        with unit_of_work(session):
+            result = change_balance(session, player.id, price, TransactionType.PURCHASE, item_name)
+            if result is None:
+                # Откат: запрос на покупку не отмечается выполненным
+                raise DeclinedOperation()
+            
+            if purchase_request is not None:
+                purchase_request.status = 'completed'
+    except DeclinedOperation:
+        balance = _current_balance(session, player)
+        if balance is None:
+            return False, "❌ Ваш профиль не найден"
+        return False, f"❌ Недостаточно чилликов!\nВаш баланс: {balance}, требуется: {price}"
+    except Exception as e:
+        return False, f"❌ Ошибка при покупке: {e}"
+    
+    try:
+        set_committed_value(player, 'balance', result[0])
+        leaderboard.update(player)
+        achievement_engine.on_transaction(session, vk, TransactionType.PURCHASE, from_player=player)
         
         return True, f"✅ Покупка '{item_name}' завершена!\n💳 Списано: {price} чил.\n💰 Ваш баланс: {player.balance} чил."
     
     except Exception as e:
-        session.rollback()
-        return False, f"❌ Ошибка при покупке: {e}"
\ No newline at end of file
+        return False, f"❌ Ошибка при покупке: {e}"
+
+
+def gift_all_chilliki(session, vk, admin_vk_id, amount, reason=None):
+    """
+    Массовое начисление всем игрокам (set-based, одна транзакция БД)
+    Уведомления рассылаются после коммита в фоне
+    Возвращает (success, message)
+    """
+    started = time.monotonic()
+    
+    try:
+        with unit_of_work(session):
+            rows = credit_players(session, amount, TransactionType.ADMIN_GIVE, reason)
+    except Exception as e:
+        return False, f"❌ Ошибка массового начисления: {e}"
+    
+    elapsed = time.monotonic() - started
+    
+    # Порядок игроков не меняется — балансы в таблице сдвигаются в памяти, без чтения всех игроков
+    leaderboard.credit_all(amount)
+    
+    threading.Thread(
+        target=_notify_gift_all,
+        args=(vk, amount, reason),
+        name='gift-all-notify',
+        daemon=True
+    ).start()
+    
+    msg = f"✅ Начислено {format_balance(amount)} чилликов всем игрокам\n"
+    msg += f"👥 Игроков: {format_balance(rows)}\n"
+    msg += f"⏱ Время: {elapsed:.2f} сек.\n"
+    msg += "📨 Уведомления отправляются в фоне"
+    return True, msg
+
+
+def _notify_gift_all(vk, amount, reason):
+    """Фоновая рассылка уведомлений о массовом начислении пачками"""
+    message = f"🎁 Вам начислено {format_balance(amount)} чилликов!"
+    if reason:
+        message += f"\n💬 {reason}"
+    
+    session = get_session()
+    sent = 0
+    failed = 0
+    
+    try:
+        for vk_ids in iter_notification_recipients(session):
+            batch_sent, batch_failed = send_bulk_notification(vk, vk_ids, message)
+            sent += batch_sent
+            failed += batch_failed
+    except Exception as e:
+        print(f"❌ Ошибка рассылки уведомлений о массовом начислении: {e}")
+    finally:
+        close_session(session)
+    
+    print(f"📨 Уведомления о массовом начислении: отправлено {sent}, ошибок {failed}")
+    
+    # Начисление всем меняет баланс и счётчик транзакций — выдать достижения за них
+    session = get_session()
+    try:
+        achievement_engine.backfill(session, vk, metrics=COMMON_METRICS)
+    except Exception as e:
+        print(f"❌ Ошибка выдачи достижений после массового начисления: {e}")
+    finally:
+        close_session(session)
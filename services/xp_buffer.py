@@ -0,0 +1,141 @@
+"""
+Буфер отложенной записи счётчиков сообщений и опыта
+Инкременты копятся в памяти и раз в несколько секунд записываются одним UPDATE
+"""
+from sqlalchemy.orm.attributes import set_committed_value
+import threading
+import time
+
+from database.connection import get_session, close_session, unit_of_work
+from database.queries import apply_message_increments, calculate_level
+import config
+
+# Опыт за одно сообщение
+XP_PER_MESSAGE = 10
+
+# Через сколько секунд без сообщений забывать известные итоги игрока
+# (после этого источником снова становится строка в БД)
+TOTALS_IDLE_SECONDS = 600
+
+
+class XpBuffer:
+    """Накопитель инкрементов опыта с фоновым сбросом в БД"""
+    
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval or config.XP_FLUSH_INTERVAL_SECONDS
+        
+        # player_id -> [messages, xp], ещё не записанные в БД
+        self._pending = {}
+        # player_id -> (experience, level, messages_count, last_seen) — итоги с учётом буфера
+        self._totals = {}
+        
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Запуск фонового сброса"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name='xp-buffer', daemon=True)
+        self._thread.start()
+        print(f"✅ Буфер опыта запущен (сброс каждые {self.flush_interval} сек.)")
+    
+    def stop(self):
+        """Остановка с финальным сбросом буфера"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        print("⏸️ Буфер опыта остановлен")
+    
+    def add_message(self, player):
+        """
+        Учесть сообщение игрока
+        Возвращает (level_up, level)
+        """
+        now = time.monotonic()
+        
+        with self._lock:
+            pending = self._pending.setdefault(player.id, [0, 0])
+            pending[0] += 1
+            pending[1] += XP_PER_MESSAGE
+            
+            # Итоги из памяти; при первом обращении — из БД с учётом буфера
+            totals = self._totals.get(player.id)
+            if totals is None:
+                experience = player.experience + pending[1]
+                messages_count = player.messages_count + pending[0]
+                level = player.level
+            else:
+                experience, level, messages_count, _ = totals
+                experience += XP_PER_MESSAGE
+                messages_count += 1
+            
+            new_level = calculate_level(experience)
+            level_up = new_level > level
+            level = max(level, new_level)
+            
+            self._totals[player.id] = (experience, level, messages_count, now)
+        
+        # Показываем актуальные значения, не помечая объект изменённым
+        set_committed_value(player, 'experience', experience)
+        set_committed_value(player, 'level', level)
+        set_committed_value(player, 'messages_count', messages_count)
+        
+        return level_up, level
+    
+    def flush(self):
+        """Записать накопленные инкременты в БД"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch = {player_id: tuple(values) for player_id, values in self._pending.items()}
+            self._pending = {}
+        
+        session = get_session()
+        try:
+            with unit_of_work(session):
+                updated = apply_message_increments(session, batch)
+        except Exception as e:
+            print(f"❌ Ошибка записи опыта ({len(batch)} игроков): {e}")
+            self._restore(batch)
+            return 0
+        finally:
+            close_session(session)
+        
+        self._forget_idle()
+        return updated
+    
+    def pending_count(self):
+        """Игроков с незаписанными инкрементами"""
+        with self._lock:
+            return len(self._pending)
+    
+    def _restore(self, batch):
+        """Вернуть незаписанные инкременты в буфер"""
+        with self._lock:
+            for player_id, (messages, xp) in batch.items():
+                pending = self._pending.setdefault(player_id, [0, 0])
+                pending[0] += messages
+                pending[1] += xp
+    
+    def _forget_idle(self):
+        """Забыть итоги игроков, которые давно не писали"""
+        cutoff = time.monotonic() - TOTALS_IDLE_SECONDS
+        with self._lock:
+            idle = [
+                player_id for player_id, (_, _, _, last_seen) in self._totals.items()
+                if last_seen < cutoff and player_id not in self._pending
+            ]
+            for player_id in idle:
+                del self._totals[player_id]
+    
+    def _flush_loop(self):
+        """Цикл фонового сброса"""
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+
+# Общий буфер процесса
+xp_buffer = XpBuffer()
@@ -1,15 +1,208 @@
 """
 FSM (Finite State Machine) для управления состояниями диалогов
+
+Записи хранятся в подключаемом хранилище (database/state_store.py, config.FSM_STATE_STORE)
+и переживают перезапуск. Чтение — из кэша процесса: при подключении хранилища
+в кэш загружаются все записи, поэтому отсутствие в кэше означает отсутствие
+состояния и get_state не обращается к хранилищу. Запись — сквозная: сначала
+в хранилище, затем в кэш; в asyncio-режиме хранилище БД оборачивается
+в WriteBehindStateStore, и запись в таблицу идёт в фоновом потоке, не
+блокируя цикл событий. Кэши других процессов, которым принадлежит пользователь,
+обновляются через on_write / invalidate
+
+Таймаут (CONFIRMATION_TIMEOUT_MINUTES) отсчитывает колесо таймеров
+(utils/timer_wheel.py): чтение время не сравнивает, просроченные записи
+удаляет из кэша и хранилища поток очистки раз в тик
 """
-from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime
+import threading
+import time
 import config
+from database.state_store import MemoryStateStore, DatabaseStateStore, WriteBehindStateStore, dumps, loads
+from utils.timer_wheel import TimerWheel
+
+# Виды записей в хранилище
+STATES = 'states'
+CONFIRMATIONS = 'confirmations'
+
+# Кэш процесса: (вид, ключ) -> запись или None (записи нет)
+_cache = {}
+
+# Все записи хранилища уже в кэше: промах кэша = записи нет
+_complete = False
+
+_store = None
+
+# Вызывается после каждой записи (вид, ключ) — оповещение других процессов
+_on_write = None
+
+# Принадлежит ли запись (вид, ключ) процессу; None — все записи свои
+_owns = None
+
+# События обрабатываются пулом потоков — доступ к кэшу под блокировкой
+_lock = threading.RLock()
+
+# Сроки записей кэша: (вид, ключ) -> истечение
+_wheel = TimerWheel()
+_sweeper = None
+
+_MISSING = object()
+
+
+def use_store(store, warm=True, wheel=None):
+    """
+    Подключить хранилище
+    warm: загрузить все записи в кэш (иначе кэш заполняется при первом чтении ключа)
+    wheel: колесо таймеров (бенчмарк передаёт колесо на виртуальных часах)
+    """
+    global _store, _complete, _wheel
+    
+    entries = {}
+    if warm:
+        for kind in (STATES, CONFIRMATIONS):
+            for key, payload in store.load_all(kind):
+                entries[(kind, key)] = loads(payload)
+    
+    with _lock:
+        _store = store
+        _cache.clear()
+        _cache.update(entries)
+        _complete = warm
+        
+        _wheel = wheel if wheel is not None else TimerWheel()
+        for (kind, key), entry in entries.items():
+            _track(kind, key, entry)
+
+
+def init_store(shared_mapping=None):
+    """
+    Хранилище из config.FSM_STATE_STORE
+    shared_mapping — общий словарь процессов для хранилища memory (многопроцессный режим)
+    """
+    if config.FSM_STATE_STORE == 'database':
+        from database.connection import engine
+        store = DatabaseStateStore(engine)
+        if config.RUNTIME_MODE == 'async':
+            # Обработчики вызывают set_state прямо в цикле событий
+            store = WriteBehindStateStore(store)
+            store.start()
+    else:
+        store = MemoryStateStore(shared_mapping)
+    
+    use_store(store)
+    start_expiry()
+    print(f"✅ Состояния диалогов: хранилище {config.FSM_STATE_STORE}, загружено {len(_cache)}")
+
+
+def close_store():
+    """Дописать отложенные записи хранилища (остановка бота)"""
+    if isinstance(_store, WriteBehindStateStore):
+        _store.stop()
+
+
+def start_expiry():
+    """Поток очистки просроченных записей (один на процесс)"""
+    global _sweeper
+    
+    if _sweeper is not None:
+        return
+    
+    def sweep():
+        while True:
+            time.sleep(_wheel.tick)
+            try:
+                cleanup_expired_states()
+            except Exception as e:
+                print(f"❌ Ошибка очистки состояний: {e}")
+    
+    _sweeper = threading.Thread(target=sweep, name='fsm-expiry', daemon=True)
+    _sweeper.start()
+
 
-# In-memory хранилище состояний пользователей
-user_states = defaultdict(dict)
+def on_write(callback):
+    """Оповещать о записях callback(вид, ключ) — например, процесс, которому принадлежит пользователь"""
+    global _on_write
+    _on_write = callback
 
-# Временные данные для подтверждений
-pending_confirmations = {}
+
+def set_owner(predicate):
+    """
+    Удалять по сроку только свои записи predicate(вид, ключ) — например, пользователей воркера
+    Чужой процесс не получает оповещений о записях владельца, и его срок мог устареть
+    """
+    global _owns
+    _owns = predicate
+
+
+def invalidate(kind, key):
+    """Перечитать запись из хранилища (её изменил другой процесс)"""
+    entry = _load(kind, key)
+    with _lock:
+        if entry is None and _complete:
+            _cache.pop((kind, key), None)
+        else:
+            _cache[(kind, key)] = entry
+        _track(kind, key, entry)
+
+
+def _track(kind, key, entry):
+    """Поставить срок записи на колесо (по её timestamp) или снять; вызывается под _lock"""
+    if entry is None:
+        _wheel.cancel((kind, key))
+        return
+    
+    age = (datetime.now() - entry['timestamp']).total_seconds()
+    _wheel.schedule((kind, key), config.CONFIRMATION_TIMEOUT_MINUTES * 60 - age)
+
+
+def _get_store():
+    if _store is None:
+        init_store()
+    return _store
+
+
+def _load(kind, key):
+    payload = _get_store().load(kind, key)
+    return loads(payload) if payload is not None else None
+
+
+def _read(kind, key):
+    """Запись из кэша; из хранилища — только если кэш не загружен целиком"""
+    with _lock:
+        entry = _cache.get((kind, key), _MISSING)
+        if entry is not _MISSING or _complete:
+            return None if entry is _MISSING else entry
+    
+    entry = _load(kind, key)
+    with _lock:
+        if (kind, key) not in _cache:
+            _cache[(kind, key)] = entry
+            _track(kind, key, entry)
+        return _cache[(kind, key)]
+
+
+def _write(kind, key, entry):
+    """Сквозная запись: хранилище, затем кэш; entry=None — удаление"""
+    store = _get_store()
+    try:
+        if entry is None:
+            store.delete(kind, key)
+        else:
+            store.save(kind, key, dumps(entry))
+    except Exception as e:
+        # Состояние остаётся в кэше процесса, но не переживёт перезапуск
+        print(f"❌ Ошибка записи состояния {kind}/{key}: {e}")
+    
+    with _lock:
+        # При полном кэше отсутствие записи и так означает «нет записи»
+        if entry is None and _complete:
+            _cache.pop((kind, key), None)
+        else:
+            _cache[(kind, key)] = entry
+        _track(kind, key, entry)
+    
+    if _on_write is not None:
+        _on_write(kind, key)
 
 
 class State:
@@ -48,30 +241,27 @@ class State:
     WAITING_BROADCAST_MESSAGE = 'waiting_broadcast_message'
     WAITING_GIFT_ALL_AMOUNT = 'waiting_gift_all_amount'
     
-    # Фильтр истории
+    # Фильтр и страницы истории
     WAITING_HISTORY_FILTER = 'waiting_history_filter'
+    BROWSING_HISTORY = 'browsing_history'
 
 
 def set_state(vk_id, state, **data):
     """Установить состояние пользователя"""
-    user_states[vk_id] = {
+    _write(STATES, vk_id, {
         'state': state,
         'data': data,
         'timestamp': datetime.now()
-    }
+    })
 
 
 def get_state(vk_id):
     """Получить текущее состояние пользователя"""
-    if vk_id in user_states:
-        state_info = user_states[vk_id]
-        
-        # Проверка таймаута (5 минут)
-        if datetime.now() - state_info['timestamp'] > timedelta(minutes=config.CONFIRMATION_TIMEOUT_MINUTES):
-            clear_state(vk_id)
-            return State.IDLE, {}
-        
-        return state_info['state'], state_info.get('data', {})
+    state_info = _read(STATES, vk_id)
+    
+    # Просроченные состояния удаляет колесо таймеров (cleanup_expired_states)
+    if state_info is not None:
+        return state_info['state'], dict(state_info.get('data', {}))
     
     return State.IDLE, {}
 
@@ -84,70 +274,77 @@ def get_state_data(vk_id, key, default=None):
 
 def update_state_data(vk_id, **new_data):
     """Обновить данные состояния"""
-    if vk_id in user_states:
-        user_states[vk_id]['data'].update(new_data)
-        user_states[vk_id]['timestamp'] = datetime.now()
+    state_info = _read(STATES, vk_id)
+    if state_info is not None:
+        _write(STATES, vk_id, {
+            'state': state_info['state'],
+            'data': {**state_info['data'], **new_data},
+            'timestamp': datetime.now()
+        })
 
 
 def clear_state(vk_id):
     """Очистить состояние пользователя"""
-    if vk_id in user_states:
-        del user_states[vk_id]
+    if _read(STATES, vk_id) is not None:
+        _write(STATES, vk_id, None)
 
 
 def add_pending_confirmation(confirmation_id, vk_id, action_type, **data):
     """Добавить ожидающее подтверждение"""
-    pending_confirmations[confirmation_id] = {
+    _write(CONFIRMATIONS, confirmation_id, {
         'vk_id': vk_id,
         'action_type': action_type,
         'data': data,
         'timestamp': datetime.now()
-    }
+    })
 
 
 def get_pending_confirmation(confirmation_id):
     """Получить ожидающее подтверждение"""
-    if confirmation_id in pending_confirmations:
-        confirmation = pending_confirmations[confirmation_id]
-        
-        # Проверка таймаута
-        if datetime.now() - confirmation['timestamp'] > timedelta(minutes=config.CONFIRMATION_TIMEOUT_MINUTES):
-            del pending_confirmations[confirmation_id]
-            return None
-        
-        return confirmation
-    
-    return None
+    return _read(CONFIRMATIONS, confirmation_id)
 
 
 def remove_pending_confirmation(confirmation_id):
     """Удалить подтверждение"""
-    if confirmation_id in pending_confirmations:
-        del pending_confirmations[confirmation_id]
+    if _read(CONFIRMATIONS, confirmation_id) is not None:
+        _write(CONFIRMATIONS, confirmation_id, None)
 
 
 def cleanup_expired_states():
-    """Очистка просроченных состояний"""
-    now = datetime.now()
-    timeout = timedelta(minutes=config.CONFIRMATION_TIMEOUT_MINUTES)
-    
-    # Очистка состояний
-    expired_states = [
-        vk_id for vk_id, state_info in user_states.items()
-        if now - state_info['timestamp'] > timeout
-    ]
-    
-    for vk_id in expired_states:
-        del user_states[vk_id]
-    
-    # Очистка подтверждений
-    expired_confirmations = [
-        conf_id for conf_id, conf in pending_confirmations.items()
-        if now - conf['timestamp'] > timeout
-    ]
-    
-    for conf_id in expired_confirmations:
-        del pending_confirmations[conf_id]
-    
-    if expired_states or expired_confirmations:
-        print(f"🧹 Очищено {len(expired_states)} состояний и {len(expired_confirmations)} подтверждений")
\ No newline at end of file
+    """
+    Удалить записи, срок которых истёк: снимаются с колеса таймеров,
+    поэтому стоимость не зависит от числа живых записей
+    Из хранилища запись удаляется, только если её не перезаписали после
+    снятия из кэша (условие на сериализованную запись с её timestamp).
+    Чужие записи (set_owner) не удаляются, а перечитываются: владелец мог продлить их
+    Возвращает (состояний, подтверждений)
+    """
+    owned, foreign = [], []
+    with _lock:
+        for entry_key in _wheel.advance():
+            if _owns is not None and not _owns(*entry_key):
+                foreign.append(entry_key)
+                continue
+            
+            entry = _cache.get(entry_key)
+            if _complete:
+                _cache.pop(entry_key, None)
+            else:
+                _cache[entry_key] = None
+            if entry is not None:
+                owned.append((entry_key, dumps(entry)))
+    
+    for (kind, key), payload in owned:
+        try:
+            _store.delete(kind, key, payload)
+        except Exception as e:
+            print(f"❌ Ошибка удаления состояния {kind}/{key}: {e}")
+    
+    for kind, key in foreign:
+        try:
+            invalidate(kind, key)
+        except Exception as e:
+            print(f"❌ Ошибка чтения состояния {kind}/{key}: {e}")
+    
+    expired_states = sum(1 for (kind, _), _ in owned if kind == STATES)
+    return expired_states, len(owned) - expired_states
@@ -0,0 +1,38 @@
+"""
+Транспортно-независимое представление входящего сообщения
+"""
+from vk_api.longpoll import VkEventType
+
+
+class MessageEvent:
+    """
+    Входящее сообщение с теми полями, которые используют обработчики.
+    Легко сериализуется для передачи между процессами.
+    """
+    __slots__ = ('user_id', 'peer_id', 'text', 'message_id')
+    
+    type = VkEventType.MESSAGE_NEW
+    to_me = True
+    
+    def __init__(self, user_id, text, peer_id=None, message_id=None):
+        self.user_id = user_id
+        self.text = text
+        self.peer_id = peer_id or user_id
+        self.message_id = message_id
+    
+    @classmethod
+    def from_longpoll(cls, event):
+        """Из события vk_api.longpoll"""
+        return cls(event.user_id, event.text, event.peer_id, event.message_id)
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['user_id'], data['text'], data.get('peer_id'), data.get('message_id'))
+    
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'text': self.text,
+            'peer_id': self.peer_id,
+            'message_id': self.message_id
+        }
@@ -48,12 +48,15 @@ def format_player_profile(player, include_achievements=False, achievements=None)
     return msg
 
 
-def format_transaction_history(transactions, player_id):
+def format_transaction_history(transactions, player_id, page=None):
     """Форматирование истории транзакций"""
     if not transactions:
         return "📋 История транзакций пуста"
     
-    msg = "📜 История последних операций:\n\n"
+    if page and page > 1:
+        msg = f"📜 История операций (стр. {page}):\n\n"
+    else:
+        msg = "📜 История последних операций:\n\n"
     
     for t in transactions:
         date = format_datetime(t.created_at)
@@ -1,9 +1,14 @@
 """
 Система уведомлений
 """
-from database.queries import get_player_by_vk_id
+from middleware.context import get_player
 from utils.formatters import format_balance
 
+# messages.send принимает до 100 получателей в peer_ids
+BULK_SEND_SIZE = 100
+# Версия API, в которой messages.send поддерживает peer_ids
+BULK_API_VERSION = '5.131'
+
 
 def send_notification(vk, vk_id, message, keyboard=None):
     """Отправить уведомление игроку (если у него включены уведомления)"""
@@ -20,9 +25,34 @@ def send_notification(vk, vk_id, message, keyboard=None):
         return False
 
 
+def send_bulk_notification(vk, vk_ids, message):
+    """
+    Отправить одно сообщение многим игрокам (по 100 получателей на вызов)
+    Возвращает (sent, failed)
+    """
+    sent = 0
+    failed = 0
+    
+    for i in range(0, len(vk_ids), BULK_SEND_SIZE):
+        chunk = vk_ids[i:i + BULK_SEND_SIZE]
+        try:
+            vk.messages.send(
+                peer_ids=','.join(str(vk_id) for vk_id in chunk),
+                message=message,
+                random_id=0,
+                v=BULK_API_VERSION
+            )
+            sent += len(chunk)
+        except Exception as e:
+            failed += len(chunk)
+            print(f"❌ Ошибка массовой отправки ({len(chunk)} получателей): {e}")
+    
+    return sent, failed
+
+
 def notify_transfer_received(vk, session, receiver_vk_id, sender_name, amount, is_anonymous=False):
     """Уведомление о получении перевода"""
-    receiver = get_player_by_vk_id(session, receiver_vk_id)
+    receiver = get_player(session, receiver_vk_id)
     
     if not receiver or not receiver.notifications_enabled:
         return False
@@ -41,7 +71,7 @@ def notify_transfer_received(vk, session, receiver_vk_id, sender_name, amount, i
 
 def notify_purchase_approved(vk, session, player_vk_id, item_name, price):
     """Уведомление об одобрении покупки"""
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = get_player(session, player_vk_id)
     
     if not player or not player.notifications_enabled:
         return False
@@ -56,7 +86,7 @@ def notify_purchase_approved(vk, session, player_vk_id, item_name, price):
 
 def notify_purchase_rejected(vk, session, player_vk_id, item_name, reason):
     """Уведомление об отклонении покупки"""
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = get_player(session, player_vk_id)
     
     if not player or not player.notifications_enabled:
         return False
@@ -70,7 +100,7 @@ def notify_purchase_rejected(vk, session, player_vk_id, item_name, reason):
 
 def notify_admin_operation(vk, session, player_vk_id, operation_type, amount, reason=None):
     """Уведомление об операции администратора"""
-    player = get_player_by_vk_id(session, player_vk_id)
+    player = get_player(session, player_vk_id)
     
     if not player or not player.notifications_enabled:
         return False
@@ -88,11 +118,12 @@ def notify_admin_operation(vk, session, player_vk_id, operation_type, amount, re
     return send_notification(vk, player_vk_id, message)
 
 
-def notify_scheduled_payment(vk, session, player_vk_id, amount, reason=None):
-    """Уведомление о запланированном начислении"""
-    player = get_player_by_vk_id(session, player_vk_id)
-    
-    if not player or not player.notifications_enabled:
+def notify_scheduled_payment(vk, player, amount, reason=None):
+    """
+    Уведомление о запланированном начислении
+    player — строка игрока с балансом после начисления (apply_scheduled_payments)
+    """
+    if not player.notifications_enabled:
         return False
     
     message = f"⏰ Вам начислено {format_balance(amount)} чилликов!\n"
@@ -100,7 +131,7 @@ def notify_scheduled_payment(vk, session, player_vk_id, amount, reason=None):
         message += f"💬 {reason}\n"
     message += f"💰 Ваш баланс: {format_balance(player.balance)} чил."
     
-    return send_notification(vk, player_vk_id, message)
+    return send_notification(vk, player.vk_id, message)
 
 
 def notify_ban(vk, vk_id, reason=None):
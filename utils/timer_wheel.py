@@ -0,0 +1,64 @@
+"""
+Хешированное колесо таймеров
+
+Срок ключа округляется до тика и кладётся в ячейку «тик % число ячеек».
+Постановка, перенос и отмена — O(1); advance обходит только ячейки прошедших
+тиков, поэтому каждый ключ обрабатывается один раз — амортизированно O(1)
+на истечение. Время — монотонное (time.monotonic), перевод системных часов
+сроки не сдвигает. Не потокобезопасно: блокировка на стороне вызывающего
+"""
+import math
+import time
+
+
+class TimerWheel:
+    """Ключи с таймаутом: schedule / cancel / advance -> истёкшие ключи"""
+    
+    def __init__(self, tick=1.0, slots=512, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        
+        # Ячейка: ключ -> тик срока (срок дальше оборота колеса ждёт следующих обходов)
+        self._slots = [{} for _ in range(slots)]
+        self._slot_of = {}
+        self._current = math.floor(clock() / tick)
+    
+    def __len__(self):
+        return len(self._slot_of)
+    
+    def __contains__(self, key):
+        return key in self._slot_of
+    
+    def schedule(self, key, delay):
+        """Истечь через delay секунд; прежний срок ключа отменяется"""
+        self.cancel(key)
+        # Не раньше следующего тика: текущая ячейка уже обойдена
+        deadline = max(math.ceil((self.clock() + max(delay, 0)) / self.tick), self._current + 1)
+        slot = self._slots[deadline % len(self._slots)]
+        slot[key] = deadline
+        self._slot_of[key] = slot
+    
+    def cancel(self, key):
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            del slot[key]
+    
+    def advance(self, now=None):
+        """Снять и вернуть ключи, срок которых наступил"""
+        target = math.floor((self.clock() if now is None else now) / self.tick)
+        if target <= self._current:
+            return []
+        
+        # После долгого простоя достаточно одного оборота: каждая ячейка обойдена
+        ticks = min(target - self._current, len(self._slots))
+        expired = []
+        for step in range(1, ticks + 1):
+            slot = self._slots[(self._current + step) % len(self._slots)]
+            due = [key for key, deadline in slot.items() if deadline <= target]
+            for key in due:
+                del slot[key]
+                del self._slot_of[key]
+            expired.extend(due)
+        
+        self._current = target
+        return expired
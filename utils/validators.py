@@ -3,6 +3,8 @@
 """
 import re
 
+from database.models import PaymentSegment
+
 
 def validate_amount(amount_str):
     """
@@ -48,6 +50,38 @@ def validate_vk_id(vk_id_str):
     return False, 0, "Неверный формат VK ID. Используйте: @id123 или id123 или просто число"
 
 
+def validate_payment_target(target_str):
+    """
+    Валидация получателей запланированного начисления
+    Форматы: VK ID игрока, «все», «уровень 5» (уровень от 5), несколько VK ID через запятую
+    Возвращает (valid, target, error_message); target — данные для create_scheduled_payment:
+    {'player_vk_id': ...} для одного игрока или {'segment': ..., 'min_level'/'vk_ids': ...}
+    """
+    text = target_str.strip().lower()
+    
+    if text in ['все', 'всем', 'все игроки']:
+        return True, {'segment': PaymentSegment.ALL}, None
+    
+    match = re.match(r'^(?:уровень|ур\.?|level)\s*(?:от\s*)?(\d+)\s*\+?$', text)
+    if match:
+        return True, {'segment': PaymentSegment.LEVEL, 'min_level': int(match.group(1))}, None
+    
+    parts = [part for part in re.split(r'[,;\s]+', text) if part]
+    if len(parts) > 1:
+        vk_ids = []
+        for part in parts:
+            valid, vk_id, error = validate_vk_id(part)
+            if not valid:
+                return False, None, f"{part}: {error}"
+            vk_ids.append(vk_id)
+        return True, {'segment': PaymentSegment.PLAYERS, 'vk_ids': sorted(set(vk_ids))}, None
+    
+    valid, vk_id, error = validate_vk_id(text)
+    if not valid:
+        return False, None, error
+    return True, {'player_vk_id': vk_id}, None
+
+
 def validate_datetime_format(datetime_str):
     """
     Валидация формата даты/времени